@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+from langchain_core.embeddings import Embeddings
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+
+class OllamaHTTPError(Exception):
+    def __init__(self, status: int, body: str):
+        super().__init__(f"Ollama returned HTTP {status}: {body[:200]}")
+        self.status = status
+
+
+class _ConnectionPool:
+    """
+    Keep-alive HTTP/1.1 connections to one host, at most max_connections of them in use at once.
+    """
+
+    def __init__(self, host: str, port: int, use_ssl: bool, max_connections: int, timeout: float):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self._idle = []
+        self._semaphore = asyncio.Semaphore(max_connections)
+        self.opened = 0
+
+    async def request(self, method: str, path: str, payload: dict, on_chunk=None) -> tuple:
+        """
+        Sends one request and returns (status, body). on_chunk(bytes) sees the body as it
+        arrives, for streamed responses.
+        """
+        body = json.dumps(payload).encode("utf-8")
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode("ascii")
+        async with self._semaphore:
+            if self._idle:
+                reader, writer = self._idle.pop()
+            else:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=self.use_ssl or None), self.timeout
+                )
+                self.opened += 1
+            try:
+                writer.write(head + body)
+                await writer.drain()
+                status, keep_alive, response_body = await asyncio.wait_for(_read_response(reader, on_chunk),
+                                                                           self.timeout)
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+            return status, response_body
+
+    def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = []
+
+
+async def _read_response(reader: asyncio.StreamReader, on_chunk=None) -> tuple:
+    status_line = await reader.readuntil(b"\r\n")
+    version, status = status_line.decode("latin-1").split(" ", 2)[:2]
+    headers = {}
+    while True:
+        line = await reader.readuntil(b"\r\n")
+        if line == b"\r\n":
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    keep_alive = headers.get("connection", "").lower() != "close" and version != "HTTP/1.0"
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                # Skip trailers up to the final blank line
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+            if on_chunk is not None:
+                on_chunk(chunks[-1])
+        return int(status), keep_alive, b"".join(chunks).decode("utf-8")
+    if "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+        keep_alive = False
+    if on_chunk is not None:
+        on_chunk(body)
+    return int(status), keep_alive, body.decode("utf-8")
+
+
+async def post_with_retries(pool: _ConnectionPool, path: str, payload: dict, max_retries: int, backoff: float,
+                            on_chunk=None) -> str:
+    """
+    POSTs payload and returns the response body, retrying connection errors, 429 and 5xx
+    responses with exponential backoff. Other client errors are raised as OllamaHTTPError at once.
+    """
+    attempt = 0
+    while True:
+        try:
+            status, body = await pool.request("POST", path, payload, on_chunk)
+            if status == 200:
+                return body
+            error = OllamaHTTPError(status, body)
+            # Client errors (unknown model, bad input) won't succeed on retry
+            if status < 500 and status != 429:
+                raise error
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError) as connection_error:
+            error = connection_error
+        if attempt >= max_retries:
+            raise error
+        await asyncio.sleep(backoff * 2 ** attempt)
+        attempt += 1
+
+
+class AsyncOllamaEmbeddings(Embeddings):
+    """
+    Ollama embeddings over the batched /api/embed endpoint.
+
+    Requests run on a private asyncio loop with a pool of keep-alive connections: texts are
+    split into batches of batch_size, at most max_concurrency batches are in flight, and
+    failed requests are retried with exponential backoff. Documents and queries get the same
+    instruction prefixes as langchain's OllamaEmbeddings.
+    """
+
+    def __init__(self, model: str, base_url: str = OLLAMA_BASE_URL, batch_size: int = 32, max_concurrency: int = 4,
+                 max_retries: int = 3, backoff: float = 0.5, timeout: float = 120.0,
+                 embed_instruction: str = "passage: ", query_instruction: str = "query: "):
+        self.model = model
+        self.base_url = base_url
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.embed_instruction = embed_instruction
+        self.query_instruction = query_instruction
+        self._loop = None
+        self._pool = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                url = urlsplit(self.base_url)
+                use_ssl = url.scheme == "https"
+                port = url.port or (443 if use_ssl else 80)
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+                self._pool = _ConnectionPool(url.hostname, port, use_ssl, self.max_concurrency, self.timeout)
+        return self._loop
+
+    async def _post_batch(self, texts: list) -> list:
+        body = await post_with_retries(self._pool, "/api/embed", {"model": self.model, "input": texts},
+                                       self.max_retries, self.backoff)
+        return json.loads(body)["embeddings"]
+
+    async def _embed(self, texts: list) -> list:
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*(self._post_batch(batch) for batch in batches))
+        return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
+    def _submit(self, texts: list):
+        return asyncio.run_coroutine_threadsafe(self._embed(texts), self._ensure_loop())
+
+    def embed_documents(self, texts: list) -> list:
+        if not texts:
+            return []
+        return self._submit([f"{self.embed_instruction}{text}" for text in texts]).result()
+
+    def embed_queries(self, texts: list) -> list:
+        if not texts:
+            return []
+        return self._submit([f"{self.query_instruction}{text}" for text in texts]).result()
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_queries([text])[0]
+
+    async def aembed_documents(self, texts: list) -> list:
+        if not texts:
+            return []
+        return await asyncio.wrap_future(self._submit([f"{self.embed_instruction}{text}" for text in texts]))
+
+    async def aembed_query(self, text: str) -> list:
+        return (await asyncio.wrap_future(self._submit([f"{self.query_instruction}{text}"])))[0]
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._pool.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+from async_ollama_embeddings import OLLAMA_BASE_URL, _ConnectionPool, post_with_retries
+from instrumentation import record
+
+
+class AsyncOllamaLLM:
+    """
+    One Ollama /api/generate client shared by every prompt of a run.
+
+    Prompts run concurrently on a private asyncio loop over a pool of keep-alive connections,
+    with at most max_concurrency requests in flight; failed requests are retried with
+    exponential backoff. With on_token, responses are streamed and every token is passed on as
+    it arrives. A LLMResponseCache answers prompts seen before without calling the model.
+    Each call is recorded under its stage (and stage_first_token when streamed) in the stage report.
+    """
+
+    def __init__(self, model: str = "mistral", base_url: str = OLLAMA_BASE_URL, max_concurrency: int = 4,
+                 max_retries: int = 3, backoff: float = 0.5, timeout: float = 300.0, options: dict = None,
+                 cache=None):
+        self.model = model
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.options = options or {}
+        self.cache = cache
+        self._loop = None
+        self._pool = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                url = urlsplit(self.base_url)
+                use_ssl = url.scheme == "https"
+                port = url.port or (443 if use_ssl else 80)
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+                self._pool = _ConnectionPool(url.hostname, port, use_ssl, self.max_concurrency, self.timeout)
+        return self._loop
+
+    async def agenerate(self, prompt: str, model: str = None, on_token=None, stage: str = "llm_generate") -> str:
+        """
+        Returns the model's response to prompt. Must run on this client's loop (see run).
+        """
+        model = model or self.model
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(model, self.options, prompt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                if on_token is not None:
+                    on_token(cached)
+                return cached
+
+        payload = {"model": model, "prompt": prompt, "stream": on_token is not None, "options": self.options}
+        start = time.perf_counter()
+        if on_token is None:
+            response = json.loads(await post_with_retries(self._pool, "/api/generate", payload,
+                                                          self.max_retries, self.backoff))["response"]
+        else:
+            tokens = []
+            pending = bytearray()
+
+            def on_chunk(chunk: bytes):
+                # Streamed responses are one JSON object per line, split across chunks at random
+                pending.extend(chunk)
+                *lines, rest = pending.split(b"\n")
+                pending[:] = rest
+                for line in lines:
+                    if line.strip():
+                        token = json.loads(line).get("response", "")
+                        if not tokens:
+                            record(f"{stage}_first_token", time.perf_counter() - start, 1)
+                        tokens.append(token)
+                        on_token(token)
+
+            await post_with_retries(self._pool, "/api/generate", payload, self.max_retries, self.backoff, on_chunk)
+            on_chunk(b"\n")
+            response = "".join(tokens)
+        record(stage, time.perf_counter() - start, 1, len(response.encode("utf-8")))
+        if key is not None:
+            self.cache.put(key, model, response)
+        return response
+
+    def run(self, coroutine):
+        """
+        Runs a coroutine on this client's loop and waits for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop()).result()
+
+    def generate(self, prompts: list, model: str = None, on_token=None, stage: str = "llm_generate") -> list:
+        """
+        Returns the response to every prompt, in order. on_token(index, token) streams them.
+        """
+        async def generate_all():
+            return await asyncio.gather(*(
+                self.agenerate(prompt, model, None if on_token is None else lambda token, i=i: on_token(i, token), stage)
+                for i, prompt in enumerate(prompts)
+            ))
+
+        if not prompts:
+            return []
+        return list(self.run(generate_all()))
+
+    def invoke(self, prompt: str) -> str:
+        return self.generate([prompt])[0]
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._pool.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
@@ -0,0 +1,131 @@
+"""
+Compares the original per-project process_comments loop with the vectorized filter and the
+columnar comment store on a synthetic comments CSV.
+Run from the repository root: python -m benchmarks.process_comments --rows 1000000
+"""
+import argparse
+import math
+import os
+import tempfile
+import time
+import pandas as pd
+from comment_retriever.util import process_comments
+from comment_retriever.comment_store import ensure_comment_store, load_project_comments
+from benchmarks.synthetic import write_synthetic_comments
+
+
+def process_comments_legacy(csv_file_path, filter_by_round='', filter_by_round_exist='', filter_by_team_name='', filter_by_team_name_present=True, drop_text_na=True, drop_date_na=False):
+    # Read the CSV file
+    df = pd.read_csv(csv_file_path)
+
+    # Group by project
+    grouped = df.groupby('project')
+
+    # Dictionary to store results
+    results_comments = {}
+    results_time = {}
+    # List to store filtered groups
+    filtered_groups = []
+
+    # Process each project group
+    for project_name, group in grouped:
+        # Start with the entire group
+        filtered_group = group
+
+        # Apply round exist filter if provided
+        if len(filter_by_round_exist) >= 1:
+            round_exist = int(filter_by_round_exist)
+            # Get comment_ids that have at least one row with the specified round
+            valid_comment_ids = group[group['round'] == round_exist]['comment_id'].unique()
+            # Filter group to keep only rows with valid comment_ids
+            filtered_group = filtered_group[filtered_group['comment_id'].isin(valid_comment_ids)]
+
+        # Apply round filter if provided
+        if '-' in filter_by_round:
+            split_round_value = filter_by_round.split('-')
+            smallest_round = int(split_round_value[0])
+            if len(split_round_value) == 2:
+                try:
+                    largest_round = int(split_round_value[1])
+                except:
+                    largest_round = df['round'].max()
+                filtered_group = filtered_group[
+                    (filtered_group['round'] >= smallest_round) & (filtered_group['round'] <= largest_round)]
+            else:
+                filtered_group = filtered_group[filtered_group['round'] == smallest_round]
+        elif len(filter_by_round) >= 1:
+            filtered_group = filtered_group[filtered_group['round'] == int(filter_by_round)]
+
+        # Apply team filter if provided, on the filtered group
+        if len(filter_by_team_name) >= 1:
+            print(f"filter_by_team_name: {filter_by_team_name}, filter_by_team_name_present: {filter_by_team_name_present}")
+            if filter_by_team_name_present:
+                filtered_group = filtered_group[
+                    filtered_group['comment_id'].str.lower().str.contains(filter_by_team_name.lower(), na=False)]
+            else:
+                filtered_group = filtered_group[
+                    ~filtered_group['comment_id'].str.lower().str.contains(filter_by_team_name.lower(), na=False)]
+
+        # Append filtered group to list
+        filtered_groups.append(filtered_group)
+
+        # Extract comments and times from the final filtered group
+        if drop_text_na:
+            round_comments = filtered_group['comment_text'].dropna().tolist()
+        else:
+            round_comments = filtered_group['comment_text'].tolist()
+        if drop_date_na:
+            round_time = filtered_group['date_received'].dropna().tolist()
+        else:
+            round_time = filtered_group['date_received'].tolist()
+
+        results_comments[project_name] = round_comments
+        results_time[project_name] = round_time
+
+    return results_comments, results_time
+
+
+def same_results(a: tuple, b: tuple) -> bool:
+    def clean(results):
+        return [{project: [None if isinstance(value, float) and math.isnan(value) else value for value in values]
+                 for project, values in result.items()} for result in results]
+    return clean(a) == clean(b)
+
+
+FILTERS = {
+    "round 1": dict(filter_by_round="1"),
+    "round 2-4, exists in 1": dict(filter_by_round="2-4", filter_by_round_exist="1"),
+    "round 2-, team Tahltan": dict(filter_by_round="2-", filter_by_team_name="tahltan"),
+    "not team EAO, keep NaN": dict(filter_by_team_name="eao", filter_by_team_name_present=False, drop_text_na=False),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark process_comments.")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--projects", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "comments.csv")
+        write_synthetic_comments(csv_path, args.rows, args.projects)
+        start = time.perf_counter()
+        ensure_comment_store(csv_path)
+        print(f"Built the comment store in {time.perf_counter() - start:.2f}s")
+        print(f"{'filters':<28} {'legacy (s)':>10} {'vectorized (s)':>15} {'store (s)':>10} identical")
+        for name, filters in FILTERS.items():
+            start = time.perf_counter()
+            legacy = process_comments_legacy(csv_path, **filters)
+            legacy_time = time.perf_counter() - start
+            start = time.perf_counter()
+            vectorized = process_comments(csv_path, **filters)
+            vectorized_time = time.perf_counter() - start
+            start = time.perf_counter()
+            stored = load_project_comments(csv_path, **filters)
+            store_time = time.perf_counter() - start
+            print(f"{name:<28} {legacy_time:>10.2f} {vectorized_time:>15.2f} {store_time:>10.3f} "
+                  f"{same_results(legacy, vectorized) and same_results(legacy, stored)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Compares float32, int8 and binary storage of the NumPy vector index, as codes alone or with
+full-precision vectors kept for rescoring, and with Matryoshka truncation, on the guidebook:
+index size, load time, query latency and recall@k against exact float32 search.
+Run from the repository root: python -m benchmarks.quantization [--embedding ollama_nomic --dims 256]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from get_embedding_function import EMBEDDING_TYPES, MATRYOSHKA_EMBEDDINGS, embed_queries
+from vector_index import NumpyVectorStore, DEFAULT_RESCORE_CANDIDATES
+
+
+def sample_queries(documents: list, count: int, seed: int = 0) -> list:
+    """
+    Picks count sentences of at least six words from the documents, standing in for comments.
+    """
+    from section_chunker import SENTENCE_BOUNDARY
+
+    sentences = [sentence.strip() for doc in documents for sentence in SENTENCE_BOUNDARY.split(doc.page_content)
+                 if len(sentence.split()) >= 6]
+    rng = np.random.default_rng(seed)
+    return [sentences[i] for i in rng.choice(len(sentences), size=min(count, len(sentences)), replace=False)]
+
+
+def directory_size(path: str, names: list) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in names if os.path.exists(os.path.join(path, name)))
+
+
+def measure(path: str, query_vectors: np.ndarray, k: int, batch_size: int, rescore_candidates: int) -> dict:
+    start = time.perf_counter()
+    store = NumpyVectorStore(path, rescore_candidates=rescore_candidates)
+    load_ms = 1000 * (time.perf_counter() - start)
+    start = time.perf_counter()
+    rows = np.vstack([store.search(query_vectors[i:i + batch_size], k)[0]
+                      for i in range(0, len(query_vectors), batch_size)])
+    searched = "codes.npy" if store.quantization != "none" else "vectors.npy"
+    return {
+        "rows": rows,
+        "load_ms": load_ms,
+        "ms_per_query": 1000 * (time.perf_counter() - start) / len(query_vectors),
+        "searched_mib": directory_size(path, [searched]) / 1024 ** 2,
+        "disk_mib": directory_size(path, ["vectors.npy", "codes.npy", "scale.npy"]) / 1024 ** 2,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quantized storage of the NumPy vector index.")
+    parser.add_argument("--pdf_path", type=str, default="data/2024_Joint_Application_Information_Requirements.pdf")
+    parser.add_argument("--embedding", type=str, default="hash", choices=EMBEDDING_TYPES)
+    parser.add_argument("--dims", type=int, nargs="*", default=None,
+                        help="Matryoshka dimensions to try (default: 256 and 128 for Matryoshka embeddings).")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch_size", type=int, default=64)
+    parser.add_argument("--rescore_candidates", type=int, default=DEFAULT_RESCORE_CANDIDATES)
+    parser.add_argument("--output", type=str, default=None, help="Also write the report to this JSON file.")
+    args = parser.parse_args()
+
+    from embedding_cache import get_cached_embedding_function
+    from populate_database import load_documents, prepare_documents
+
+    documents = prepare_documents(load_documents(args.pdf_path), args.embedding)
+    queries = sample_queries(documents, args.queries)
+    embedding_function = get_cached_embedding_function(args.embedding)
+    document_vectors = np.asarray(embedding_function.embed_documents([doc.page_content for doc in documents]),
+                                  dtype=np.float32)
+    query_vectors = np.asarray(embed_queries(embedding_function, queries), dtype=np.float32)
+    dims_options = args.dims if args.dims is not None else [256, 128] if args.embedding in MATRYOSHKA_EMBEDDINGS else []
+    if dims_options and args.embedding not in MATRYOSHKA_EMBEDDINGS:
+        print(f"Warning: {args.embedding} is not Matryoshka-trained; truncated vectors lose more than they would")
+    print(f"{len(documents)} chunks, {len(queries)} queries, {document_vectors.shape[1]} dimensions ({args.embedding})")
+
+    # Quantized indexes are stored as codes alone, and again with the full-precision vectors for rescoring
+    variants = [(quantization, dims, keep_full_precision)
+                for dims in [None] + [d for d in dims_options if d < document_vectors.shape[1]]
+                for quantization in ("none", "int8", "binary")
+                for keep_full_precision in ([False] if quantization == "none" else [False, True])]
+    ids = [str(i) for i in range(len(documents))]
+    report = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for quantization, dims, keep_full_precision in variants:
+            path = os.path.join(directory, f"{quantization}_{dims}_{keep_full_precision}")
+            store = NumpyVectorStore(path, quantization=quantization, dims=dims, keep_full_precision=keep_full_precision)
+            store.upsert(ids, document_vectors, [""] * len(ids), [{} for _ in ids])
+            store.save()
+            name = {"none": "float32", "int8": "int8", "binary": "binary"}[quantization]
+            name += f" {dims}d" if dims else ""
+            name += f" + float32, rescore {args.rescore_candidates}" if keep_full_precision else ""
+            report[name] = measure(path, query_vectors, args.k, args.batch_size, args.rescore_candidates)
+
+    exact_rows = report["float32"]["rows"]
+    print(f"\n{'storage':<34} {'searched MiB':>12} {'disk MiB':>9} {'load ms':>8} {'ms/query':>9} "
+          f"{f'recall@{args.k}':>9} {'top-1':>6}")
+    for name, result in report.items():
+        rows = result.pop("rows")
+        result["recall_at_k"] = float(np.mean([len(set(a) & set(b)) / args.k for a, b in zip(rows, exact_rows)]))
+        result["top1_agreement"] = float(np.mean(rows[:, 0] == exact_rows[:, 0]))
+        print(f"{name:<34} {result['searched_mib']:>12.2f} {result['disk_mib']:>9.2f} {result['load_ms']:>8.1f} "
+              f"{result['ms_per_query']:>9.3f} {result['recall_at_k']:>9.3f} {result['top1_agreement']:>6.3f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
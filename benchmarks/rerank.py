@@ -0,0 +1,100 @@
+"""
+Measures what the cross-encoder rerank stage of query_data adds: latency per comment and the
+change in top-1 accuracy, on sentences sampled from the guidebook and matched back to the
+section they came from. Needs transformers and torch for the cross-encoder.
+Run from the repository root: python -m benchmarks.rerank [--embedding ollama_nomic --margins 1 0.05]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from get_embedding_function import EMBEDDING_TYPES
+from reranker import CrossEncoderReranker, DEFAULT_RERANK_MODEL, DEFAULT_RERANK_CANDIDATES, DEFAULT_RERANK_BATCH_SIZE
+
+
+def labelled_queries(documents: list, count: int, seed: int = 0) -> tuple:
+    """
+    Picks count sentences of at least six words from the documents, standing in for comments,
+    and returns them with the section number each was taken from.
+    """
+    from section_chunker import SENTENCE_BOUNDARY
+
+    sentences = [(sentence.strip(), doc.metadata["section_number"]) for doc in documents
+                 for sentence in SENTENCE_BOUNDARY.split(doc.page_content) if len(sentence.split()) >= 6]
+    rng = np.random.default_rng(seed)
+    picked = [sentences[i] for i in rng.choice(len(sentences), size=min(count, len(sentences)), replace=False)]
+    return [sentence for sentence, _ in picked], [section for _, section in picked]
+
+
+def evaluate(db, embedding_function, queries: list, expected: list, batch_size: int, reranker=None) -> dict:
+    from query_data import search_batch, chunks_per_section
+
+    chunks = chunks_per_section(db)
+    start = time.perf_counter()
+    results = []
+    for index in range(0, len(queries), batch_size):
+        results.extend(search_batch(db, embedding_function, queries[index:index + batch_size], 1,
+                                    chunks_per_section=chunks, reranker=reranker))
+    elapsed = time.perf_counter() - start
+    top1 = [matches[0][0].metadata["section_number"] if matches else None for matches in results]
+    return {"top1": top1, "accuracy": float(np.mean([a == b for a, b in zip(top1, expected)])),
+            "ms_per_comment": 1000 * elapsed / len(queries)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cross-encoder rerank stage.")
+    parser.add_argument("--pdf_path", type=str, default="data/2024_Joint_Application_Information_Requirements.pdf")
+    parser.add_argument("--embedding", type=str, default="hash", choices=EMBEDDING_TYPES)
+    parser.add_argument("--rerank_model", type=str, default=DEFAULT_RERANK_MODEL)
+    parser.add_argument("--rerank_candidates", type=int, default=DEFAULT_RERANK_CANDIDATES)
+    parser.add_argument("--rerank_batch_size", type=int, default=DEFAULT_RERANK_BATCH_SIZE)
+    parser.add_argument("--margins", type=float, nargs="+", default=[1.0, 0.1, 0.05],
+                        help="Dense margins to try; 1 reranks every comment.")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--batch_size", type=int, default=64)
+    parser.add_argument("--output", type=str, default=None, help="Also write the report to this JSON file.")
+    args = parser.parse_args()
+
+    from embedding_cache import get_cached_embedding_function
+    from populate_database import load_documents, prepare_documents, store_id
+    from vector_index import NumpyVectorStore
+
+    sections = load_documents(args.pdf_path)
+    queries, expected = labelled_queries(sections, args.queries)
+    documents = prepare_documents(sections, args.embedding)
+    embedding_function = get_cached_embedding_function(args.embedding)
+    print(f"{len(documents)} passages, {len(queries)} queries ({args.embedding})")
+
+    report = {}
+    with tempfile.TemporaryDirectory() as directory:
+        db = NumpyVectorStore(os.path.join(directory, "index"), embedding_function)
+        texts = [doc.page_content for doc in documents]
+        db.upsert([store_id(doc.metadata) for doc in documents], embedding_function.embed_documents(texts), texts,
+                  [doc.metadata for doc in documents])
+        dense = evaluate(db, embedding_function, queries, expected, args.batch_size)
+        report["dense"] = dense
+        for margin in args.margins:
+            reranker = CrossEncoderReranker(args.rerank_model, args.rerank_candidates, args.rerank_batch_size, margin)
+            # Loading the model is a one-off cost, kept out of the per-comment latency
+            reranker._load()
+            result = evaluate(db, embedding_function, queries, expected, args.batch_size, reranker)
+            result["reranked_share"] = reranker.stats["reranked"] / len(queries)
+            result["top1_changed"] = float(np.mean([a != b for a, b in zip(result["top1"], dense["top1"])]))
+            report[f"rerank margin {margin:g}"] = result
+
+    print(f"\n{'stage':<22} {'top-1 acc':>9} {'ms/comment':>11} {'added ms':>9} {'reranked':>9} {'changed':>8}")
+    for name, result in report.items():
+        result.pop("top1")
+        added = result["ms_per_comment"] - dense["ms_per_comment"]
+        print(f"{name:<22} {result['accuracy']:>9.3f} {result['ms_per_comment']:>11.2f} {added:>9.2f} "
+              f"{result.get('reranked_share', 0.0):>9.1%} {result.get('top1_changed', 0.0):>8.1%}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Measures how long the CLI scripts take to start, and how long a cold query run takes with the
+embedding model already in ./hf_models.
+Run from the repository root: python -m benchmarks.startup_time [--embedding mpnet]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from get_embedding_function import (EMBEDDING_BACKENDS, EMBEDDING_BACKEND_KINDS, EMBEDDING_TYPES, HF_CACHE_FOLDER,
+                                    is_hf_model_cached)
+
+STARTUP_BUDGET_SECONDS = 1.0
+QUERY_COMMENTS = [
+    "The project will disturb caribou habitat along the access road.",
+    "Water quality downstream of the tailings facility must be monitored.",
+]
+
+
+def time_command(command: list, repeats: int, **run_kwargs) -> list:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **run_kwargs)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: list):
+    median = statistics.median(timings)
+    flag = "" if median < STARTUP_BUDGET_SECONDS else "  <-- over budget"
+    print(f"{name:<45} {median:>10.3f} {max(timings):>10.3f}{flag}")
+
+
+def prepare_query_run(directory: str, embedding_type: str, pdf_path: str) -> list:
+    """
+    Populates a NumPy collection for embedding_type in directory and writes a small comment
+    config, so query_data.py can run there. ./hf_models is linked in, since query_data loads
+    models from the working directory. Returns the query_data.py command to time.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.symlink(os.path.abspath(HF_CACHE_FOLDER), os.path.join(directory, os.path.basename(HF_CACHE_FOLDER)))
+    subprocess.run([sys.executable, os.path.join(root, "populate_database.py"), "--embedding", embedding_type,
+                    "--vector_store", "numpy", "--pdf_path", os.path.abspath(pdf_path)],
+                   check=True, cwd=directory, stdout=subprocess.DEVNULL)
+    os.makedirs(os.path.join(directory, "config_json_data"))
+    with open(os.path.join(directory, "config_json_data", "representative_sentences_config_4.json"), "w") as f:
+        json.dump([{"company name": "Benchmark", "topics": [{"representative sentences": QUERY_COMMENTS}]}], f)
+    # No cached vectors or results: the model itself has to load and embed the comments
+    return [sys.executable, os.path.join(root, "query_data.py"), "--embedding", embedding_type, "--vector_store",
+            "numpy", "--no_embedding_cache", "--no_query_cache", "--output_format", "csv"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup time.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--embedding", type=str, default="mpnet", choices=EMBEDDING_TYPES,
+                        help="Backend of the cold query run; Hugging Face models must already be in ./hf_models.")
+    parser.add_argument("--pdf_path", type=str, default="data/2024_Joint_Application_Information_Requirements.pdf",
+                        help="PDF the query run's collection is populated from.")
+    args = parser.parse_args()
+
+    scenarios = {
+        "populate_database.py --help": [sys.executable, "populate_database.py", "--help"],
+        "query_data.py --help": [sys.executable, "query_data.py", "--help"],
+        "import get_embedding_function": [sys.executable, "-c", "import get_embedding_function"],
+    }
+    print(f"{'scenario':<45} {'median (s)':>10} {'max (s)':>10}")
+    for name, command in scenarios.items():
+        report(name, time_command(command, args.repeats))
+
+    name = f"cold query run ({args.embedding})"
+    if EMBEDDING_BACKEND_KINDS[args.embedding] == "huggingface":
+        model_name = EMBEDDING_BACKENDS[args.embedding].args[0]
+        if not is_hf_model_cached(model_name):
+            print(f"{name:<45} skipped: {model_name} is not in {HF_CACHE_FOLDER}; populate a collection with "
+                  f"--embedding {args.embedding} once to download it")
+            return
+    with tempfile.TemporaryDirectory() as directory:
+        command = prepare_query_run(directory, args.embedding, args.pdf_path)
+        # With the model cached it loads with local_files_only; offline mode fails the run on any Hub call
+        env = dict(os.environ, HF_HUB_OFFLINE="1", TRANSFORMERS_OFFLINE="1")
+        report(name, time_command(command, args.repeats, cwd=directory, env=env))
+
+
+if __name__ == "__main__":
+    main()
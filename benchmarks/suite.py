@@ -0,0 +1,215 @@
+"""
+Offline benchmark suite: section extraction, population, batched retrieval and comment filtering
+on synthetic data with the deterministic "hash" embedding, so it runs on a CPU-only box without
+Ollama, API keys or model downloads. Results are written as JSON and compared with a baseline.
+Run from the repository root: python -m benchmarks.suite [--update_baseline]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The suite runs in a scratch directory; keep the repository importable from there
+sys.path.insert(0, REPO_ROOT)
+
+import instrumentation  # noqa: E402
+from benchmarks.process_comments import FILTERS  # noqa: E402
+from benchmarks.synthetic import synthetic_queries, synthetic_sections, write_synthetic_comments, write_synthetic_pdf  # noqa: E402
+from comment_retriever.comment_store import ensure_comment_store, load_project_comments  # noqa: E402
+from comment_retriever.util import process_comments  # noqa: E402
+from pdf_splitter_test import extract_sections  # noqa: E402
+import populate_database  # noqa: E402
+import query_data  # noqa: E402
+
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "baseline.json")
+RESULTS_PATH = os.path.join(REPO_ROOT, "benchmarks", "results", "latest.json")
+DEFAULT_THRESHOLD = 0.3
+# Differences below this are timer noise on scenarios that only take a fraction of a second
+MIN_REGRESSION_SECONDS = 0.1
+# Chroma's HNSW graph is built non-deterministically, so its recall moves a little between runs
+RECALL_TOLERANCE = 0.01
+EMBEDDING = "hash"
+
+
+def best_of(repeats: int, function, setup=None) -> tuple:
+    """
+    Runs function repeats times, calling setup before each run, and returns the fastest time and the last result.
+    """
+    timings = []
+    result = None
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def scenario(seconds: float, items: int, **extra) -> dict:
+    return dict(seconds=seconds, items=items, items_per_s=items / seconds if seconds else 0.0,
+                stages=instrumentation.report(), **extra)
+
+
+def recall_at_1(results: list, expected: list) -> float:
+    hits = sum(1 for matches, section_number in zip(results, expected)
+               if matches and matches[0][0].metadata["section_number"] == section_number)
+    return hits / len(expected) if expected else 0.0
+
+
+def run_suite(args) -> dict:
+    sections = synthetic_sections(args.sections, args.sentences_per_section)
+    comments, expected = synthetic_queries(sections, args.queries)
+    pdf_path = os.path.abspath("guidebook.pdf")
+    csv_path = os.path.abspath("comments.csv")
+    write_synthetic_pdf(pdf_path, sections)
+    write_synthetic_comments(csv_path, args.comment_rows, args.projects)
+    results = {}
+
+    def run(name, function, setup=None, items=None, **extra):
+        instrumentation.drain()
+        seconds, result = best_of(args.repeats, function, setup)
+        count = items(result) if items else len(result)
+        results[name] = scenario(seconds, count, **{key: value(result) for key, value in extra.items()})
+        recall_text = f"  recall@1 {results[name]['recall_at_1']:.3f}" if "recall_at_1" in results[name] else ""
+        print(f"{name:<45} {seconds:>9.3f}s {results[name]['items_per_s']:>12.1f} items/s{recall_text}")
+        return result
+
+    run("extract_sections_1_worker", lambda: extract_sections(pdf_path, workers=1))
+    run("extract_sections_parallel", lambda: extract_sections(pdf_path))
+    documents = run("load_documents", lambda: populate_database.load_documents(pdf_path, use_section_cache=False))
+    # Every run after the first reads the sections written by the first
+    run("load_documents_section_cache", lambda: populate_database.load_documents(pdf_path))
+
+    collection_name = f"my_collection_{EMBEDDING}"
+
+    def clear_chroma():
+        client = populate_database.get_chroma_client()
+        if any(collection.name == collection_name for collection in client.list_collections()):
+            client.delete_collection(collection_name)
+
+    def clear_vector_index():
+        from vector_index import VECTOR_INDEX_PATH
+        shutil.rmtree(VECTOR_INDEX_PATH, ignore_errors=True)
+
+    run("populate_chroma", lambda: populate_database.add_to_chroma(documents, EMBEDDING, use_embedding_cache=False),
+        setup=clear_chroma, items=lambda added: added)
+    run("populate_numpy", lambda: populate_database.sync_vector_index(documents, EMBEDDING, use_embedding_cache=False),
+        setup=clear_vector_index, items=lambda summary: summary["added"])
+
+    chroma_db, embedding_function, _ = populate_database.get_chroma_db(EMBEDDING, use_embedding_cache=False)
+    numpy_db, _ = query_data.open_vector_store(EMBEDDING, use_embedding_cache=False, vector_store="numpy")
+    lexical_index = query_data.open_lexical_index(EMBEDDING, "numpy")
+    recall = {"recall_at_1": lambda results: recall_at_1(results, expected)}
+    run("retrieve_batched_chroma",
+        lambda: query_data.retrieve_batched(chroma_db, embedding_function, comments, 1, args.batch_size), **recall)
+    run("retrieve_batched_numpy",
+        lambda: query_data.retrieve_batched(numpy_db, embedding_function, comments, 1, args.batch_size), **recall)
+    run("retrieve_batched_hybrid",
+        lambda: query_data.retrieve_batched(numpy_db, embedding_function, comments, 1, args.batch_size, lexical_index),
+        **recall)
+
+    # The same corpus split into chunks that fit the embedding's max length, hits aggregated back to sections
+    chunks = run("chunk_documents", lambda: populate_database.prepare_documents(documents, EMBEDDING))
+    run("populate_numpy_chunked",
+        lambda: populate_database.sync_vector_index(chunks, EMBEDDING, use_embedding_cache=False),
+        setup=clear_vector_index, items=lambda summary: summary["added"])
+    chunked_db, _ = query_data.open_vector_store(EMBEDDING, use_embedding_cache=False, vector_store="numpy")
+    run("retrieve_batched_numpy_chunked",
+        lambda: query_data.retrieve_batched(chunked_db, embedding_function, comments, 1, args.batch_size,
+                                            chunks_per_section=query_data.chunks_per_section(chunked_db)), **recall)
+
+    ensure_comment_store(csv_path)
+    for name, filters in FILTERS.items():
+        key = name.replace(" ", "_").replace(",", "").replace("-", "_")
+        run(f"filter_vectorized_{key}", lambda: process_comments(csv_path, **filters), items=lambda result: args.comment_rows)
+        run(f"filter_store_{key}", lambda: load_project_comments(csv_path, **filters), items=lambda result: args.comment_rows)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Returns a message for every scenario that got slower than the baseline by more than
+    threshold, or whose recall dropped.
+    """
+    regressions = []
+    print(f"\n{'scenario':<45} {'baseline s':>10} {'current s':>10} {'change':>8}")
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print(f"{name:<45} {'-':>10} {current['seconds']:>10.3f}      new")
+            continue
+        change = current["seconds"] / reference["seconds"] - 1 if reference["seconds"] else 0.0
+        flag = ""
+        if change > threshold and current["seconds"] - reference["seconds"] > MIN_REGRESSION_SECONDS:
+            flag = "  <-- slower"
+            regressions.append(f"{name}: {change:+.0%} time")
+        if current.get("recall_at_1", 1.0) < reference.get("recall_at_1", 0.0) - RECALL_TOLERANCE:
+            flag += "  <-- lower recall"
+            regressions.append(f"{name}: recall@1 {reference['recall_at_1']:.3f} -> {current['recall_at_1']:.3f}")
+        print(f"{name:<45} {reference['seconds']:>10.3f} {current['seconds']:>10.3f} {change:>+8.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite.")
+    parser.add_argument("--sections", type=int, default=120, help="Sections in the synthetic guidebook.")
+    parser.add_argument("--sentences_per_section", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=1000, help="Synthetic comments retrieved per scenario.")
+    parser.add_argument("--comment_rows", type=int, default=200000, help="Rows in the synthetic comments CSV.")
+    parser.add_argument("--projects", type=int, default=200)
+    parser.add_argument("--batch_size", type=int, default=query_data.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", type=str, default=RESULTS_PATH)
+    parser.add_argument("--baseline", type=str, default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Fail when a scenario is this much slower than the baseline (0.3 = 30%%).")
+    parser.add_argument("--update_baseline", action="store_true", help="Store these results as the new baseline.")
+    args = parser.parse_args()
+
+    config = {key: getattr(args, key) for key in
+              ("sections", "sentences_per_section", "queries", "comment_rows", "projects", "batch_size")}
+    start_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            scenarios = run_suite(args)
+        finally:
+            os.chdir(start_directory)
+
+    output = {
+        "config": config,
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "scenarios": scenarios,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print("No baseline yet; run with --update_baseline to store one.")
+        return
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    if baseline["config"] != config:
+        print(f"Baseline was recorded with {baseline['config']}; timings are not comparable.")
+        return
+    regressions = compare(scenarios, baseline["scenarios"], args.threshold)
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
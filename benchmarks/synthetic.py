@@ -0,0 +1,137 @@
+"""
+Synthetic guidebook PDFs and comment CSVs at configurable scale, for benchmarks that run offline.
+"""
+import numpy as np
+import pandas as pd
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 56
+BODY_FONT_SIZE = 10
+HEADING_FONT_SIZE = 14
+LINE_HEIGHT = 14
+WORDS_PER_LINE = 12
+TOC_PAGES = range(2, 7)
+TOC_LINES_PER_PAGE = 48
+
+
+def synthetic_vocabulary(size: int, rng) -> list:
+    syllables = ["ka", "lo", "mi", "ter", "an", "vo", "sel", "ri", "du", "pen", "ox", "mar", "quel", "sta", "fi", "gen"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables, size=rng.integers(2, 5))))
+    return sorted(words)
+
+
+def synthetic_sections(sections: int, sentences_per_section: int, seed: int = 0) -> list:
+    """
+    Returns (section_number, title, sentences) for every section. Each section draws most of
+    its words from its own topic words, so sentences from it can be matched back to it.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = synthetic_vocabulary(max(2000, sections * 30), rng)
+    common_words = vocabulary[:200]
+    result = []
+    chapter = 1
+    subsection = 0
+    for index in range(sections):
+        # Chapters of up to nine numbered subsections: 1., 1.1., ..., 1.9., 2., ...
+        if subsection == 9 or (index and rng.random() < 0.15):
+            chapter += 1
+            subsection = 0
+        section_number = f"{chapter}." if subsection == 0 else f"{chapter}.{subsection}."
+        subsection += 1
+        topic_words = list(rng.choice(vocabulary[200:], size=20, replace=False))
+        title = " ".join(word.capitalize() for word in topic_words[:3])
+        sentences = []
+        for _ in range(sentences_per_section):
+            length = int(rng.integers(8, 20))
+            words = [topic_words[i] if rng.random() < 0.7 else common_words[i % len(common_words)]
+                     for i in rng.integers(0, 20, size=length)]
+            sentences.append(" ".join(words).capitalize() + ".")
+        result.append((section_number, title, sentences))
+    return result
+
+
+def _wrap(text: str) -> list:
+    words = text.split()
+    return [" ".join(words[start:start + WORDS_PER_LINE]) for start in range(0, len(words), WORDS_PER_LINE)]
+
+
+def write_synthetic_pdf(path: str, sections: list):
+    """
+    Writes a guidebook laid out the way extract_sections expects: a table of contents on pages
+    3-7 ("1.2. Title ..... 14"), then every section starting on a new page under a heading
+    set in a font of at least 13 points.
+    """
+    import fitz
+
+    if len(sections) > len(TOC_PAGES) * TOC_LINES_PER_PAGE:
+        raise ValueError(f"At most {len(TOC_PAGES) * TOC_LINES_PER_PAGE} sections fit in the table of contents")
+
+    doc = fitz.open()
+    for _ in range(TOC_PAGES.stop):
+        doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    doc[0].insert_text((MARGIN, MARGIN * 3), "Synthetic Guidebook", fontsize=24)
+
+    toc_entries = []
+    for section_number, title, sentences in sections:
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        toc_entries.append((section_number, title, page.number + 1))
+        page.insert_text((MARGIN, MARGIN), f"{section_number} {title}", fontsize=HEADING_FONT_SIZE)
+        y = MARGIN + 2 * LINE_HEIGHT
+        for line in _wrap(" ".join(sentences)):
+            if y > PAGE_HEIGHT - MARGIN:
+                page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+                y = MARGIN
+            page.insert_text((MARGIN, y), line, fontsize=BODY_FONT_SIZE)
+            y += LINE_HEIGHT
+
+    for page_index, start in zip(TOC_PAGES, range(0, len(toc_entries), TOC_LINES_PER_PAGE)):
+        page = doc[page_index]
+        if start == 0:
+            page.insert_text((MARGIN, MARGIN), "Table of Contents", fontsize=HEADING_FONT_SIZE)
+        y = MARGIN + 2 * LINE_HEIGHT
+        for section_number, title, page_number in toc_entries[start:start + TOC_LINES_PER_PAGE]:
+            page.insert_text((MARGIN, y), f"{section_number} {title} {'.' * 20} {page_number}", fontsize=BODY_FONT_SIZE)
+            y += LINE_HEIGHT
+    doc.save(path)
+    doc.close()
+
+
+def synthetic_queries(sections: list, count: int, seed: int = 0) -> tuple:
+    """
+    Returns count comments, each a sentence taken from a random section, and the section
+    number each one came from.
+    """
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(sections), size=count)
+    comments = []
+    expected = []
+    for pick in picks:
+        section_number, _, sentences = sections[pick]
+        comments.append(sentences[int(rng.integers(len(sentences)))])
+        expected.append(section_number)
+    return comments, expected
+
+
+def write_synthetic_comments(path: str, rows: int, projects: int, seed: int = 0):
+    """
+    Writes a CSV with the columns of merged_comments_cleaned_dates.csv: comments belong to
+    projects, comment_ids carry a team name, and each comment appears in one or more rounds.
+    """
+    rng = np.random.default_rng(seed)
+    teams = np.array(["EAO", "Tahltan", "Public", "ENV", "MEM"])
+    comment_numbers = rng.integers(0, rows // 3 + 1, size=rows)
+    project_numbers = comment_numbers % projects
+    team_names = teams[comment_numbers % len(teams)]
+    df = pd.DataFrame({
+        "project": np.char.add("Project ", project_numbers.astype(str)),
+        "comment_id": np.char.add(np.char.add(team_names, "-"), comment_numbers.astype(str)),
+        "round": rng.integers(1, 6, size=rows),
+        "comment_text": np.char.add("Comment text ", rng.integers(0, rows, size=rows).astype(str)),
+        "date_received": np.char.add(np.char.add("2024-0", rng.integers(1, 10, size=rows).astype(str)), "-15 12:00:00 AM"),
+    })
+    # Some missing text and dates, as in the real export
+    df.loc[rng.random(rows) < 0.01, "comment_text"] = np.nan
+    df.loc[rng.random(rows) < 0.01, "date_received"] = np.nan
+    df.to_csv(path, index=False)
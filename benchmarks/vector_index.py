@@ -0,0 +1,78 @@
+"""
+Compares the NumPy vector index (exact and IVF) with a Chroma collection on the same vectors.
+Run from the repository root: python -m benchmarks.vector_index
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+from vector_index import NumpyVectorStore, normalize_rows
+
+
+def synthetic_vectors(count: int, dims: int, clusters: int, rng) -> np.ndarray:
+    # Clustered data, closer to real embeddings than uniform noise
+    centers = rng.normal(size=(clusters, dims))
+    return normalize_rows(centers[rng.integers(clusters, size=count)] + 0.5 * rng.normal(size=(count, dims)))
+
+
+def time_queries(search, queries: np.ndarray, batch_size: int) -> tuple:
+    start = time.perf_counter()
+    for query in queries[:100]:
+        search(query[None, :])
+    per_query = (time.perf_counter() - start) / min(100, len(queries))
+    start = time.perf_counter()
+    rows = [search(queries[i:i + batch_size]) for i in range(0, len(queries), batch_size)]
+    per_batch = (time.perf_counter() - start) / len(queries) * 1000
+    return per_query, per_batch, np.vstack(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NumPy vector index.")
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--dims", type=int, default=768)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--ivf_lists", type=int, default=64)
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic_vectors(args.documents + args.queries, args.dims, 50, rng)
+    documents, queries = vectors[:args.documents], vectors[args.documents:]
+    ids = [str(i) for i in range(args.documents)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = NumpyVectorStore(f"{directory}/index")
+        store.upsert(ids, documents, [""] * len(ids), [{} for _ in ids])
+        store.save()
+        exact = time_queries(lambda q: store.search(q, args.k)[0], queries, 1000)
+
+        store.build_ivf(args.ivf_lists)
+        ivf = time_queries(lambda q: store.search(q, args.k, args.nprobe)[0], queries, 1000)
+
+        results = {"numpy exact": exact, f"numpy IVF ({args.ivf_lists} lists, nprobe {args.nprobe})": ivf}
+        try:
+            import chromadb
+            client = chromadb.PersistentClient(path=f"{directory}/chroma")
+            collection = client.create_collection("benchmark", metadata={"hnsw:space": "cosine"}, embedding_function=None)
+            for start in range(0, len(ids), 1000):
+                collection.add(ids=ids[start:start + 1000], embeddings=documents[start:start + 1000].tolist())
+
+            def chroma_search(q):
+                found = collection.query(query_embeddings=q.tolist(), n_results=args.k, include=[])["ids"]
+                return np.array([[int(doc_id) for doc_id in row] for row in found])
+
+            results["chroma"] = time_queries(chroma_search, queries, 1000)
+        except ImportError:
+            print("chromadb is not installed; skipping the Chroma comparison")
+
+    exact_rows = exact[2]
+    print(f"{'index':<40} {'ms/query':>9} {'ms/1k batch':>12} {'top-1 = exact':>14} {f'recall@{args.k}':>10}")
+    for name, (per_query, per_batch, rows) in results.items():
+        top1 = np.mean(rows[:, 0] == exact_rows[:, 0])
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(rows, exact_rows)])
+        print(f"{name:<40} {per_query * 1000:>9.3f} {per_batch * 1000:>12.1f} {top1:>14.3f} {recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
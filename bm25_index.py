@@ -0,0 +1,177 @@
+import json
+import os
+import re
+from collections import Counter
+import numpy as np
+from vector_index import top_k, VECTOR_INDEX_PATH
+
+CHROMA_PATH = "chroma"
+BM25_DIRECTORY = "bm25"
+DEFAULT_K1 = 1.5
+DEFAULT_B = 0.75
+RRF_K = 60
+# Section numbers such as 10.5.1 stay one token so quoted references match exactly
+TOKEN_PATTERN = re.compile(r"\d+(?:\.\d+)*|[^\W\d_]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> list:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def bm25_index_path(collection_name: str, vector_store: str = "chroma") -> str:
+    # Kept inside the vector store's directory, so it is removed together with the collection
+    if vector_store == "numpy":
+        return os.path.join(VECTOR_INDEX_PATH, collection_name, BM25_DIRECTORY)
+    return os.path.join(CHROMA_PATH, BM25_DIRECTORY, collection_name)
+
+
+def reciprocal_rank_fusion(result_lists: list, k: int, key, rrf_k: int = RRF_K) -> list:
+    """
+    Fuses ranked lists of (Document, score), best first, into one list of k (Document, distance).
+    Each document scores sum(1 / (rrf_k + rank)) over the lists it appears in. The distance is
+    1 - that score divided by the best possible score, so it stays between 0 and 1.
+    """
+    fused = {}
+    documents = {}
+    for results in result_lists:
+        for rank, (doc, _score) in enumerate(results, start=1):
+            doc_key = key(doc)
+            documents.setdefault(doc_key, doc)
+            fused[doc_key] = fused.get(doc_key, 0.0) + 1.0 / (rrf_k + rank)
+    best_possible = len(result_lists) / (rrf_k + 1)
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [(documents[doc_key], 1.0 - score / best_possible) for doc_key, score in ranked]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the sections of one collection.
+
+    Postings are stored term by term in flat arrays (CSR layout): the rows of term t are
+    doc_ids[offsets[t]:offsets[t + 1]], and weights holds each posting's precomputed BM25
+    contribution, so scoring a batch of queries is one gather and a bincount. The arrays live
+    in postings.npz next to a documents.jsonl sidecar with each row's id, text and metadata.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self.vocabulary = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.empty(0, dtype=np.int32)
+        self.weights = np.empty(0, dtype=np.float32)
+
+        postings_path = os.path.join(path, "postings.npz")
+        if os.path.exists(postings_path):
+            postings = np.load(postings_path)
+            self.vocabulary = {term: term_id for term_id, term in enumerate(postings["terms"].tolist())}
+            self.offsets = postings["offsets"]
+            self.doc_ids = postings["doc_ids"]
+            self.weights = postings["weights"]
+            with open(os.path.join(path, "documents.jsonl"), "r") as f:
+                for line in f:
+                    row = json.loads(line)
+                    self.ids.append(row["id"])
+                    self.documents.append(row["document"])
+                    self.metadatas.append(row["metadata"])
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, path: str, ids: list, documents: list, metadatas: list, k1: float = DEFAULT_K1, b: float = DEFAULT_B):
+        index = cls(path)
+        index.ids = list(ids)
+        index.documents = list(documents)
+        index.metadatas = [metadata or {} for metadata in metadatas]
+
+        vocabulary = {}
+        term_ids, doc_ids, term_freqs = [], [], []
+        doc_lengths = np.zeros(len(documents), dtype=np.float32)
+        for doc_id, document in enumerate(documents):
+            tokens = tokenize(document)
+            doc_lengths[doc_id] = len(tokens)
+            for term, term_freq in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc_id)
+                term_freqs.append(term_freq)
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        term_ids = term_ids[order]
+        doc_ids = np.array(doc_ids, dtype=np.int32)[order]
+        term_freqs = np.array(term_freqs, dtype=np.float32)[order]
+
+        offsets = np.searchsorted(term_ids, np.arange(len(vocabulary) + 1))
+        doc_freqs = np.diff(offsets)
+        idf = np.log1p((len(documents) - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        average_length = doc_lengths.mean() if len(documents) else 1.0
+        length_norm = k1 * (1 - b + b * doc_lengths[doc_ids] / max(average_length, 1e-9))
+
+        index.vocabulary = vocabulary
+        index.offsets = offsets
+        index.doc_ids = doc_ids
+        index.weights = (idf[term_ids] * term_freqs * (k1 + 1) / (term_freqs + length_norm)).astype(np.float32)
+        return index
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        # Write to temporary files first so a crash never leaves a half-written index
+        postings_tmp = os.path.join(self.path, "postings.tmp.npz")
+        np.savez(postings_tmp, terms=np.array(list(self.vocabulary), dtype=str), offsets=self.offsets,
+                 doc_ids=self.doc_ids, weights=self.weights)
+        documents_tmp = os.path.join(self.path, "documents.jsonl.tmp")
+        with open(documents_tmp, "w") as f:
+            for doc_id, document, metadata in zip(self.ids, self.documents, self.metadatas):
+                f.write(json.dumps({"id": doc_id, "document": document, "metadata": metadata}) + "\n")
+        os.replace(postings_tmp, os.path.join(self.path, "postings.npz"))
+        os.replace(documents_tmp, os.path.join(self.path, "documents.jsonl"))
+
+    def scores(self, queries: list) -> np.ndarray:
+        """
+        Returns the BM25 score of every section for every query, shape (number of queries, sections).
+        """
+        n_docs = len(self.ids)
+        flat_rows = []
+        flat_weights = []
+        for q, query in enumerate(queries):
+            for term, query_freq in Counter(tokenize(query)).items():
+                term_id = self.vocabulary.get(term)
+                if term_id is None:
+                    continue
+                start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                flat_rows.append(q * n_docs + self.doc_ids[start:end].astype(np.int64))
+                flat_weights.append(self.weights[start:end] * query_freq)
+        if not flat_rows:
+            return np.zeros((len(queries), n_docs), dtype=np.float32)
+        scores = np.bincount(np.concatenate(flat_rows), weights=np.concatenate(flat_weights),
+                             minlength=len(queries) * n_docs)
+        return scores.reshape(len(queries), n_docs)
+
+    def search(self, queries: list, k: int) -> tuple:
+        """
+        Returns (rows, scores), each of shape (number of queries, k).
+        Rows are -1 where fewer than k sections share a term with the query.
+        """
+        scores = self.scores(queries)
+        rows = top_k(scores, k)
+        top_scores = np.take_along_axis(scores, rows, axis=1)
+        return np.where(top_scores > 0, rows, -1), top_scores
+
+    def similarity_search_by_texts(self, queries: list, k: int) -> list:
+        """
+        Returns one list of (Document, BM25 score) per query, best first.
+        """
+        from langchain_core.documents import Document
+
+        rows, scores = self.search(queries, k)
+        return [
+            [(Document(page_content=self.documents[row], metadata=self.metadatas[row]), float(score))
+             for row, score in zip(query_rows, query_scores) if row >= 0]
+            for query_rows, query_scores in zip(rows, scores)
+        ]
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import pandas as pd
+from comment_retriever.util import filter_comments
+
+STORE_VERSION = 1
+STORE_COLUMNS = ['project', 'comment_id', 'round', 'comment_text', 'date_received']
+# Same formats as get_date_difference, applied to the date part of each value
+DATE_FORMATS = ['%Y-%m-%d', '%d/%b/%y', '%m/%d/%y']
+
+
+def store_paths(csv_file_path):
+    base = os.path.splitext(csv_file_path)[0]
+    return f'{base}.parquet', f'{base}.parquet.json'
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_dates(values):
+    date_part = values.astype('string').str.split(' ').str[0]
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for fmt in DATE_FORMATS:
+        parsed = parsed.fillna(pd.to_datetime(date_part, format=fmt, errors='coerce'))
+    return parsed
+
+
+def build_comment_store(csv_file_path):
+    """
+    Converts the comments CSV into a typed Parquet file: categorical project, a lowercased
+    comment_id for team filtering and pre-parsed dates. A JSON sidecar records the source's
+    size, mtime and hash, plus the full project list.
+    """
+    store_path, meta_path = store_paths(csv_file_path)
+    df = pd.read_csv(csv_file_path)
+    df['project'] = df['project'].astype('category')
+    df['comment_id_lower'] = df['comment_id'].str.lower()
+    df['date_received_parsed'] = parse_dates(df['date_received'])
+    df.to_parquet(store_path, index=False)
+
+    stat = os.stat(csv_file_path)
+    meta = {
+        'version': STORE_VERSION,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': file_sha256(csv_file_path),
+        'projects': [project.item() if hasattr(project, 'item') else project
+                     for project in sorted(df['project'].dropna().unique())],
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def ensure_comment_store(csv_file_path):
+    """
+    Returns the store's metadata, rebuilding the store only when the CSV's content changed.
+    """
+    store_path, meta_path = store_paths(csv_file_path)
+    if os.path.exists(store_path) and os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        stat = os.stat(csv_file_path)
+        if meta.get('version') == STORE_VERSION and meta['size'] == stat.st_size:
+            if meta['mtime_ns'] == stat.st_mtime_ns:
+                return meta
+            # Touched but not edited (e.g. copied again): keep the store, remember the new mtime
+            if meta['sha256'] == file_sha256(csv_file_path):
+                meta['mtime_ns'] = stat.st_mtime_ns
+                with open(meta_path, 'w') as f:
+                    json.dump(meta, f)
+                return meta
+    print(f"Building comment store for {csv_file_path}")
+    return build_comment_store(csv_file_path)
+
+
+def read_comments(csv_file_path, filter_by_round='', filter_by_round_exist='', filter_by_team_name='', filter_by_team_name_present=True, columns=None):
+    """
+    Reads the rows that can pass the round and team filters from the store, with only the
+    needed columns. The round filter is pushed down only without a round-exist filter, which
+    needs every round of a comment to decide.
+    """
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    meta = ensure_comment_store(csv_file_path)
+    store_path, _ = store_paths(csv_file_path)
+
+    predicate = None
+    if len(filter_by_round_exist) < 1:
+        round_field = pc.field('round')
+        if '-' in filter_by_round:
+            split_round_value = filter_by_round.split('-')
+            predicate = round_field >= int(split_round_value[0])
+            if len(split_round_value) == 2 and split_round_value[1].strip().isdigit():
+                predicate = predicate & (round_field <= int(split_round_value[1]))
+            elif len(split_round_value) != 2:
+                predicate = round_field == int(split_round_value[0])
+        elif len(filter_by_round) >= 1:
+            predicate = round_field == int(filter_by_round)
+    if len(filter_by_team_name) >= 1:
+        team_field = pc.field('comment_id_lower')
+        team_match = pc.match_substring_regex(team_field, filter_by_team_name.lower())
+        # Like str.contains(na=False): rows without a comment_id never match the team
+        team_predicate = team_match if filter_by_team_name_present else (~team_match | team_field.is_null())
+        predicate = team_predicate if predicate is None else predicate & team_predicate
+
+    columns = columns or STORE_COLUMNS
+    table = ds.dataset(store_path, format='parquet').to_table(columns=columns, filter=predicate)
+    return table.to_pandas(), meta['projects']
+
+
+def load_project_comments(csv_file_path, filter_by_round='', filter_by_round_exist='', filter_by_team_name='', filter_by_team_name_present=True, drop_text_na=True, drop_date_na=False, parsed_dates=False):
+    """
+    Drop-in replacement for process_comments that reads the columnar store instead of the CSV.
+    With parsed_dates, the per-project times are the pre-parsed dates, without missing values.
+    """
+    date_column = 'date_received_parsed' if parsed_dates else 'date_received'
+    columns = [column for column in STORE_COLUMNS if column != 'date_received'] + [date_column]
+    df, projects = read_comments(csv_file_path, filter_by_round, filter_by_round_exist, filter_by_team_name,
+                                 filter_by_team_name_present, columns)
+    # Filters that were pushed down are applied again, which leaves the already filtered rows unchanged
+    return filter_comments(df, filter_by_round, filter_by_round_exist, filter_by_team_name, filter_by_team_name_present,
+                           drop_text_na, drop_date_na or parsed_dates, projects=projects, date_column=date_column)
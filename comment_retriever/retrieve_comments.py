@@ -1,6 +1,7 @@
 import json
 import locale
 from comment_retriever.util import get_date_difference, process_comments
+from comment_retriever.comment_store import load_project_comments
 
 
 def getpreferredencoding(do_setlocale=True):
@@ -13,9 +14,9 @@ locale.getpreferredencoding = getpreferredencoding
 def start_processing(round_value_f, round_exist_value_f, team_value_f, team_bool_value_f, config_name):
     csv_file = '../Mining-RAG/config_json_data/merged_comments_cleaned_dates.csv'  # Replace with actual file path
 
-    # Get round 1 comments for each project
-    project_comments, project_time = process_comments(csv_file, round_value_f, round_exist_value_f, team_value_f,
-                                                      team_bool_value_f)
+    # Get round 1 comments for each project, from the columnar store built once per CSV version
+    project_comments, project_time = load_project_comments(csv_file, round_value_f, round_exist_value_f, team_value_f,
+                                                           team_bool_value_f)
 
     return [(project, comment) for project, comments in project_comments.items() for comment in comments]
 
@@ -46,3 +47,20 @@ def return_comments(config_name, representative=False, number_of_representative_
             all_comments = start_processing(round_value, round_exist_value, team_value, team_bool_value, f"{config_name}")
                 # Write to a specific sheet
     return all_comments
+
+
+def match_comments(config_name, service_url, representative=False, number_of_representative_sentences=5, k=1,
+                   embedding_type=None, batch_size=256):
+    # Matches every comment of config_name to its k best sections through a running retrieval_service
+    from retrieval_service import RetrievalClient
+    from result_writer import passage_key
+
+    all_comments = return_comments(config_name, representative, number_of_representative_sentences)
+    unique_comments = list(dict.fromkeys(comment for _, comment in all_comments))
+    client = RetrievalClient(service_url, embedding_type)
+    matches = {}
+    for start in range(0, len(unique_comments), batch_size):
+        batch = unique_comments[start:start + batch_size]
+        for comment, results in zip(batch, client.search(batch, k)):
+            matches[comment] = [(passage_key(doc.metadata), 1 - distance) for doc, distance in results]
+    return [(company_name, comment, matches[comment]) for company_name, comment in all_comments]
@@ -1,6 +1,7 @@
 import locale
 import time
 from datetime import datetime, date
+import numpy as np
 import pandas as pd
 
 
@@ -50,71 +51,70 @@ def get_date_difference(time_values_c):
 def process_comments(csv_file_path, filter_by_round='', filter_by_round_exist='', filter_by_team_name='', filter_by_team_name_present=True, drop_text_na=True, drop_date_na=False):
     # Read the CSV file
     df = pd.read_csv(csv_file_path)
+    return filter_comments(df, filter_by_round, filter_by_round_exist, filter_by_team_name,
+                           filter_by_team_name_present, drop_text_na, drop_date_na)
 
-    # Group by project
-    grouped = df.groupby('project')
-
-    # Dictionary to store results
-    results_comments = {}
-    results_time = {}
-    # List to store filtered groups
-    filtered_groups = []
-
-    # Process each project group
-    for project_name, group in grouped:
-        # Start with the entire group
-        filtered_group = group
-
-        # Apply round exist filter if provided
-        if len(filter_by_round_exist) >= 1:
-            round_exist = int(filter_by_round_exist)
-            # Get comment_ids that have at least one row with the specified round
-            valid_comment_ids = group[group['round'] == round_exist]['comment_id'].unique()
-            # Filter group to keep only rows with valid comment_ids
-            filtered_group = filtered_group[filtered_group['comment_id'].isin(valid_comment_ids)]
-
-        # Apply round filter if provided
-        if '-' in filter_by_round:
-            split_round_value = filter_by_round.split('-')
-            smallest_round = int(split_round_value[0])
-            if len(split_round_value) == 2:
-                try:
-                    largest_round = int(split_round_value[1])
-                except:
-                    largest_round = df['round'].max()
-                filtered_group = filtered_group[
-                    (filtered_group['round'] >= smallest_round) & (filtered_group['round'] <= largest_round)]
-            else:
-                filtered_group = filtered_group[filtered_group['round'] == smallest_round]
-        elif len(filter_by_round) >= 1:
-            filtered_group = filtered_group[filtered_group['round'] == int(filter_by_round)]
-
-        # Apply team filter if provided, on the filtered group
-        if len(filter_by_team_name) >= 1:
-            print(f"filter_by_team_name: {filter_by_team_name}, filter_by_team_name_present: {filter_by_team_name_present}")
-            if filter_by_team_name_present:
-                filtered_group = filtered_group[
-                    filtered_group['comment_id'].str.lower().str.contains(filter_by_team_name.lower(), na=False)]
-            else:
-                filtered_group = filtered_group[
-                    ~filtered_group['comment_id'].str.lower().str.contains(filter_by_team_name.lower(), na=False)]
-
-        # Append filtered group to list
-        filtered_groups.append(filtered_group)
-
-        # Extract comments and times from the final filtered group
-        if drop_text_na:
-            round_comments = filtered_group['comment_text'].dropna().tolist()
-        else:
-            round_comments = filtered_group['comment_text'].tolist()
-        if drop_date_na:
-            round_time = filtered_group['date_received'].dropna().tolist()
-        else:
-            round_time = filtered_group['date_received'].tolist()
 
-        results_comments[project_name] = round_comments
-        results_time[project_name] = round_time
+def group_values(values, keys):
+    """
+    Splits values into one list per key, keeping row order within each list.
+    A stable sort plus slicing avoids building a Series for every group.
+    """
+    codes, uniques = pd.factorize(keys, sort=False)
+    order = np.argsort(codes, kind='stable')
+    sorted_values = values.to_numpy(dtype=object)[order]
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(uniques)))])
+    return {uniques[i]: sorted_values[offsets[i]:offsets[i + 1]].tolist() for i in range(len(uniques))}
+
 
+def filter_comments(df, filter_by_round='', filter_by_round_exist='', filter_by_team_name='', filter_by_team_name_present=True, drop_text_na=True, drop_date_na=False, projects=None, date_column='date_received'):
+    """
+    Applies the round-exist, round and team filters to the whole frame at once and splits the
+    remaining comments and dates per project. Every project in df (or in projects, when df was
+    already narrowed down) gets an entry, even if all of its rows were filtered out.
+    """
+    mask = pd.Series(True, index=df.index)
+
+    # Apply round exist filter if provided
+    if len(filter_by_round_exist) >= 1:
+        round_exist = int(filter_by_round_exist)
+        # Keep comment_ids that have at least one row with the specified round in the same project
+        has_round = df['round'] == round_exist
+        mask &= has_round.groupby([df['project'], df['comment_id']], dropna=False, observed=True).transform('any')
+
+    # Apply round filter if provided
+    if '-' in filter_by_round:
+        split_round_value = filter_by_round.split('-')
+        smallest_round = int(split_round_value[0])
+        if len(split_round_value) == 2:
+            try:
+                largest_round = int(split_round_value[1])
+            except:
+                largest_round = df['round'].max()
+            mask &= (df['round'] >= smallest_round) & (df['round'] <= largest_round)
+        else:
+            mask &= df['round'] == smallest_round
+    elif len(filter_by_round) >= 1:
+        mask &= df['round'] == int(filter_by_round)
+
+    # Apply team filter if provided
+    if len(filter_by_team_name) >= 1:
+        print(f"filter_by_team_name: {filter_by_team_name}, filter_by_team_name_present: {filter_by_team_name_present}")
+        team_match = df['comment_id'].str.lower().str.contains(filter_by_team_name.lower(), na=False)
+        mask &= team_match if filter_by_team_name_present else ~team_match
+
+    filtered = df[mask & df['project'].notna()]
+    if projects is None:
+        projects = sorted(df['project'].dropna().unique())
+
+    # Extract comments and times from the final filtered frame
+    round_comments = filtered['comment_text'].dropna() if drop_text_na else filtered['comment_text']
+    round_time = filtered[date_column].dropna() if drop_date_na else filtered[date_column]
+    comments_by_project = group_values(round_comments, filtered.loc[round_comments.index, 'project'])
+    time_by_project = group_values(round_time, filtered.loc[round_time.index, 'project'])
+
+    results_comments = {project: comments_by_project.get(project, []) for project in projects}
+    results_time = {project: time_by_project.get(project, []) for project in projects}
     return results_comments, results_time
 
 
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from hash_embeddings import HashEmbeddings
+from section_chunker import chunk_section
+from vector_index import NumpyVectorStore
+
+SECTIONS = {
+    "1.": "Each player starts the game with $1500 in Monopoly money.",
+    "2.": "The longest continuous train is worth 10 points in Ticket to Ride.",
+    "3.": "Players roll two dice and move clockwise around the board.",
+}
+
+
+class StubLLM(ThreadingHTTPServer):
+    """
+    Mimics Ollama's /api/generate: an answer repeats the prompt's context, and the judge says
+    'true' when the expected response appears in the actual one.
+    """
+    daemon_threads = True
+
+    def __init__(self, delay: float = 0.0):
+        super().__init__(("127.0.0.1", 0), StubLLMHandler)
+        self.delay = delay
+        self.prompts = []
+        self.client_ports = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.prompts.append(payload["prompt"])
+            server.client_ports.add(self.client_address[1])
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+
+        judged = re.search(r"Expected Response: (.*)\nActual Response: (.*)\n---", payload["prompt"], re.S)
+        if judged:
+            response = "true" if judged.group(1) in judged.group(2) else "false"
+        else:
+            response = payload["prompt"].split("context:")[1].split("---")[0].strip()
+        if payload.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            tokens = [{"response": word + " ", "done": False} for word in response.split()] + [{"response": "", "done": True}]
+            for token in tokens:
+                line = (json.dumps(token) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            body = json.dumps({"model": payload["model"], "response": response, "done": True}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+
+@pytest.fixture
+def stub_server(request):
+    server = StubLLM(**getattr(request, "param", {}))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_store():
+    """
+    Returns a function that saves a NumpyVectorStore of sections (default SECTIONS, all from
+    rules.pdf) at path, embedded with HashEmbeddings, and returns it with its embedding function.
+    With max_tokens the sections are stored as chunks of at most that many tokens.
+    """
+    def make(path: str, sections: dict = None, max_tokens: int = None) -> tuple:
+        sections = SECTIONS if sections is None else sections
+        passages = [(number, text, {"source": "rules.pdf", "section_number": number, "page": 1,
+                                    "content_hash": hashlib.sha256(text.encode("utf-8")).hexdigest()})
+                    for number, text in sections.items()]
+        if max_tokens:
+            passages = [chunk for passage in passages for chunk in chunk_section(*passage, max_tokens)]
+        embedding_function = HashEmbeddings()
+        db = NumpyVectorStore(str(path), embedding_function)
+        ids, texts, metadatas = (list(column) for column in zip(*passages))
+        db.upsert(ids, embedding_function.embed_documents(texts), texts, metadatas)
+        db.save()
+        return db, embedding_function
+    return make
+
+
+@pytest.fixture
+def store(tmp_path, make_store):
+    return make_store(tmp_path / "index")
+
+
+@pytest.fixture
+def sections():
+    return SECTIONS
@@ -0,0 +1,161 @@
+import array
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from langchain_core.embeddings import Embeddings
+from get_embedding_function import get_embedding_function, embed_queries
+from instrumentation import timer, text_bytes
+
+EMBEDDING_CACHE_PATH = "embedding_cache/embeddings.sqlite"
+DEFAULT_MAX_CACHE_BYTES = 2 * 1024 ** 3
+# SQLite limits the number of host parameters per statement
+LOOKUP_CHUNK_SIZE = 500
+# Seconds a connection waits for another process's write to finish before giving up
+SQLITE_TIMEOUT = 30.0
+
+
+def normalize_text(text: str) -> str:
+    return unicodedata.normalize("NFC", text).strip()
+
+
+def get_model_name(embedding_function) -> str:
+    for attribute in ("model", "model_name", "model_id"):
+        value = getattr(embedding_function, attribute, None)
+        if value:
+            return str(value)
+    return type(embedding_function).__name__
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding object and stores every vector it computes in SQLite as a float32 blob.
+    Entries are keyed by (embedding_type, model name, document/query, normalized text hash) and
+    the least recently used ones are evicted once the cache grows past max_bytes. Writes are
+    committed in short transactions, never held across a backend call, so several processes
+    and instances can share one cache file.
+    """
+
+    def __init__(self, embedding_function, embedding_type: str, path: str = EMBEDDING_CACHE_PATH,
+                 max_bytes: int = DEFAULT_MAX_CACHE_BYTES):
+        self.embedding_function = embedding_function
+        self.embedding_type = embedding_type
+        self.model_name = get_model_name(embedding_function)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=SQLITE_TIMEOUT, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, embedding_type TEXT, model TEXT, vector BLOB, "
+            "nbytes INTEGER, last_used INTEGER)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._connection.commit()
+        self._total_bytes = self._connection.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+
+    def _key(self, kind: str, text: str) -> bytes:
+        text_hash = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{self.embedding_type}\0{self.model_name}\0{kind}\0{text_hash}".encode("utf-8")).digest()
+
+    def _lookup(self, keys: list) -> dict:
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(unique_keys), LOOKUP_CHUNK_SIZE):
+            chunk = unique_keys[start:start + LOOKUP_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            for key, blob in rows:
+                vector = array.array("f")
+                vector.frombytes(blob)
+                found[key] = vector.tolist()
+        if found:
+            now = time.time_ns()
+            self._connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+            )
+            # Committed now: an open write transaction would lock out other writers during the backend call
+            self._connection.commit()
+        return found
+
+    def _store(self, items: list):
+        now = time.time_ns()
+        rows = []
+        for key, vector in items:
+            blob = array.array("f", vector).tobytes()
+            rows.append((key, self.embedding_type, self.model_name, blob, len(blob), now))
+            self._total_bytes += len(blob)
+        self._connection.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?)", rows)
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until the cache is back under 90% of its budget
+        target = int(self.max_bytes * 0.9)
+        cursor = self._connection.execute("SELECT key, nbytes FROM embeddings ORDER BY last_used")
+        evicted = []
+        for key, nbytes in cursor:
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= nbytes
+        self._connection.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+
+    def _embed(self, kind: str, texts: list, embed) -> list:
+        with self._lock:
+            keys = [self._key(kind, text) for text in texts]
+            vectors = self._lookup(keys)
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in vectors and key not in missing:
+                    missing[key] = text
+            self.hits += sum(1 for key in keys if key in vectors)
+            self.misses += len(missing)
+            if missing:
+                texts = list(missing.values())
+                # Only the backend's own work, without the cache lookups around it
+                with timer("embedding_backend", len(texts), text_bytes(texts)):
+                    new_vectors = embed(texts)
+                self._store(list(zip(missing.keys(), new_vectors)))
+                self._connection.commit()
+                vectors.update(zip(missing.keys(), new_vectors))
+            return [list(vectors[key]) for key in keys]
+
+    def embed_documents(self, texts: list) -> list:
+        return self._embed("document", texts, self.embedding_function.embed_documents)
+
+    def embed_queries(self, texts: list) -> list:
+        return self._embed("query", texts, lambda batch: embed_queries(self.embedding_function, batch))
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_queries([text])[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size_bytes": self._total_bytes
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Embedding cache ({self.embedding_type}): {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.1%} hit rate), {stats['size_bytes'] / 1024 ** 2:.1f} MiB on disk")
+
+
+def get_cached_embedding_function(embedding_type: str, path: str = EMBEDDING_CACHE_PATH,
+                                  max_bytes: int = DEFAULT_MAX_CACHE_BYTES) -> CachedEmbeddings:
+    return CachedEmbeddings(get_embedding_function(embedding_type), embedding_type, path, max_bytes)
@@ -1,21 +1,140 @@
 import os
-from langchain_community.embeddings.ollama import OllamaEmbeddings
-from langchain_community.embeddings.bedrock import BedrockEmbeddings
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_openai import OpenAIEmbeddings
-from huggingface_hub import login
+import threading
+from functools import partial
 from dotenv import load_dotenv
-import torch
 
 load_dotenv()
 
-# Log in to Hugging Face Hub
-login(token=os.getenv('HUB_TOKEN'))
+HF_CACHE_FOLDER = "./hf_models"
+
+_instances = {}
+_instance_locks = {}
+_instances_lock = threading.Lock()
+_hub_logged_in = False
+
+
+def _hub_login():
+    # Only needed when a Hugging Face model has to be downloaded
+    global _hub_logged_in
+    if _hub_logged_in:
+        return
+    from huggingface_hub import login
+    login(token=os.getenv('HUB_TOKEN'))
+    _hub_logged_in = True
+
+
+def is_hf_model_cached(model_name: str, cache_folder: str = HF_CACHE_FOLDER) -> bool:
+    """
+    Checks whether a Hugging Face model is already in the local cache folder, either in the
+    hub layout (models--org--name/snapshots) or the older sentence-transformers layout (org_name).
+    """
+    snapshots = os.path.join(cache_folder, "models--" + model_name.replace("/", "--"), "snapshots")
+    if os.path.isdir(snapshots) and os.listdir(snapshots):
+        return True
+    return os.path.isdir(os.path.join(cache_folder, model_name.replace("/", "_")))
+
+
+def _ollama(model: str):
+    from async_ollama_embeddings import AsyncOllamaEmbeddings
+    return AsyncOllamaEmbeddings(model=model)
+
+
+def _openai(model: str):
+    from langchain_openai import OpenAIEmbeddings
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not found. Did you create a .env file?")
+    return OpenAIEmbeddings(model=model, api_key=api_key)
+
+
+def _huggingface(model_name: str):
+    import torch
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    # Common model kwargs for Hugging Face models
+    hf_model_kwargs = {
+        "use_auth_token": os.getenv("HF_TOKEN"),
+        "device": "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu",
+        "trust_remote_code": True
+    }
+    if is_hf_model_cached(model_name):
+        # Load straight from ./hf_models without contacting the Hub
+        hf_model_kwargs["local_files_only"] = True
+    else:
+        _hub_login()
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        cache_folder=HF_CACHE_FOLDER,
+        model_kwargs=hf_model_kwargs
+    )
+
+
+def _hash():
+    from hash_embeddings import HashEmbeddings
+    return HashEmbeddings()
+
+
+def _bedrock():
+    from langchain_community.embeddings.bedrock import BedrockEmbeddings
+    return BedrockEmbeddings(
+        credentials_profile_name="default",
+        region_name="us-east-1"
+    )
+
+
+# Each backend is imported only when it is first requested
+EMBEDDING_BACKENDS = {
+    "ollama_nomic": partial(_ollama, "nomic-embed-text"),
+    "ollama_mxbai": partial(_ollama, "mxbai-embed-large"),
+    "ollama_minilm": partial(_ollama, "tazarov/all-minilm-l6-v2-f32"),
+    "openai": partial(_openai, "text-embedding-3-large"),
+    "bge_large": partial(_huggingface, "BAAI/bge-large-en-v1.5"),
+    "e5_large": partial(_huggingface, "intfloat/e5-large-v2"),
+    "mpnet": partial(_huggingface, "sentence-transformers/all-mpnet-base-v2"),
+    "bge_m3": partial(_huggingface, "BAAI/bge-m3"),
+    "bedrock": _bedrock,
+    "hash": _hash,
+}
+EMBEDDING_TYPES = list(EMBEDDING_BACKENDS)
+
+# Where each backend does its work: backends of different kinds don't compete for the same resources
+EMBEDDING_BACKEND_KINDS = {
+    "ollama_nomic": "ollama",
+    "ollama_mxbai": "ollama",
+    "ollama_minilm": "ollama",
+    "openai": "remote",
+    "bge_large": "huggingface",
+    "e5_large": "huggingface",
+    "mpnet": "huggingface",
+    "bge_m3": "huggingface",
+    "bedrock": "remote",
+    "hash": "local",
+}
+
+# Longest input, in tokens, each backend embeds; anything beyond it is truncated by the model
+EMBEDDING_MAX_TOKENS = {
+    # Ollama truncates at its default context length rather than the model's
+    "ollama_nomic": 2048,
+    "ollama_mxbai": 512,
+    "ollama_minilm": 256,
+    "openai": 8191,
+    "bge_large": 512,
+    "e5_large": 512,
+    "mpnet": 384,
+    "bge_m3": 8192,
+    "bedrock": 8192,
+    # No real limit; sized like the local models so benchmarks exercise chunking
+    "hash": 512,
+}
+
+# Backends trained with Matryoshka representation learning: a prefix of their vectors is a usable embedding
+MATRYOSHKA_EMBEDDINGS = {"ollama_nomic", "ollama_mxbai", "openai"}
 
 
 def get_embedding_function(embedding_type="ollama"):
     """
     Returns an embedding function based on the specified type.
+    Backends are created once per process and reused on later calls.
     Options:
         - "ollama_nomic": uses Ollama's nomic-embed-text model (local).
         - "ollama_mxbai": uses Ollama's mxbai-embed-large model (local, larger).
@@ -26,67 +145,27 @@ def get_embedding_function(embedding_type="ollama"):
         - "mpnet": uses sentence-transformers/all-mpnet-base-v2 (HuggingFace, local).
         - "bge_m3": uses BAAI/bge-m3 (HuggingFace, local, multilingual, large).
         - "bedrock": uses AWS Bedrock embeddings (cloud-based).
+        - "hash": deterministic word-hashing stand-in (offline, for benchmarks and tests).
     """
-    # Common model kwargs for Hugging Face models
-    hf_model_kwargs = {
-        "use_auth_token": os.getenv("HF_TOKEN"),
-        "device": "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu",
-        "trust_remote_code": True
-    }
+    if embedding_type not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding type: {embedding_type}")
+    with _instances_lock:
+        lock = _instance_locks.setdefault(embedding_type, threading.Lock())
+    # One lock per backend so slow model loads don't block other backends
+    with lock:
+        if embedding_type not in _instances:
+            _instances[embedding_type] = EMBEDDING_BACKENDS[embedding_type]()
+        return _instances[embedding_type]
 
-    # Enable quantization for larger models if on GPU
-    quantization_config = {
-        "load_in_4bit": True
-    } if hf_model_kwargs["device"] in ["cuda", "mps"] else None
-
-    if embedding_type == "ollama_nomic":
-        return OllamaEmbeddings(model="nomic-embed-text")
-
-    elif embedding_type == "ollama_mxbai":
-        return OllamaEmbeddings(model="mxbai-embed-large")
-
-    elif embedding_type == "ollama_minilm":
-        return OllamaEmbeddings(model="tazarov/all-minilm-l6-v2-f32")
-
-    elif embedding_type == "openai":
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY not found. Did you create a .env file?")
-        return OpenAIEmbeddings(model="text-embedding-3-large", api_key=api_key)
-
-    elif embedding_type == "bge_large":
-        return HuggingFaceEmbeddings(
-            model_name="BAAI/bge-large-en-v1.5",
-            cache_folder="./hf_models",
-            model_kwargs=hf_model_kwargs
-        )
-
-    elif embedding_type == "e5_large":
-        return HuggingFaceEmbeddings(
-            model_name="intfloat/e5-large-v2",
-            cache_folder="./hf_models",
-            model_kwargs=hf_model_kwargs
-        )
-
-    elif embedding_type == "mpnet":
-        return HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-mpnet-base-v2",
-            cache_folder="./hf_models",
-            model_kwargs=hf_model_kwargs
-        )
-
-    elif embedding_type == "bge_m3":
-        return HuggingFaceEmbeddings(
-            model_name="BAAI/bge-m3",
-            cache_folder="./hf_models",
-            model_kwargs=hf_model_kwargs,
-        )
-
-    elif embedding_type == "bedrock":
-        return BedrockEmbeddings(
-            credentials_profile_name="default",
-            region_name="us-east-1"
-        )
 
-    else:
-        raise ValueError(f"Unknown embedding type: {embedding_type}")
\ No newline at end of file
+def embed_queries(embedding_function, texts: list) -> list:
+    """
+    Embeds a batch of query texts with a single call.
+    OllamaEmbeddings prefixes queries and documents with different instructions, so the
+    query instruction is applied here to keep the vectors identical to embed_query.
+    """
+    if hasattr(embedding_function, "embed_queries"):
+        return embedding_function.embed_queries(texts)
+    if hasattr(embedding_function, "query_instruction") and hasattr(embedding_function, "_embed"):
+        return embedding_function._embed([f"{embedding_function.query_instruction}{text}" for text in texts])
+    return embedding_function.embed_documents(texts)
@@ -0,0 +1,47 @@
+import hashlib
+import re
+from functools import lru_cache
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=1 << 16)
+def _token_slot(token: str, dims: int) -> tuple:
+    digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dims, 1.0 if (value >> 63) else -1.0
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic stand-in embedding for offline benchmarks and tests.
+
+    Every lowercased word is hashed to one signed dimension (feature hashing), so texts sharing
+    words get similar vectors and retrieval behaves sensibly without any model or server.
+    Vectors are identical across processes and machines.
+    """
+
+    def __init__(self, dims: int = 384):
+        self.dims = dims
+        self.model = f"hash-{dims}"
+
+    def _vector(self, text: str) -> list:
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            slot, sign = _token_slot(token, self.dims)
+            vector[slot] += sign
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        return [self._vector(text) for text in texts]
+
+    def embed_queries(self, texts: list) -> list:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self._vector(text)
@@ -0,0 +1,239 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from section_extractors import load_sections
+from instrumentation import timer, text_bytes
+from section_chunker import chunk_budget, chunk_section, check_chunk_layout
+from populate_database import get_chroma_db, section_content_hash, update_bm25_from_collection, invalidate_query_cache
+
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_EMBED_BATCH_SIZE = 64
+DEFAULT_WRITE_BATCH_SIZE = 256
+_DONE = object()
+
+
+def discover_pdfs(pdf_dir: str):
+    """
+    Yields every PDF below pdf_dir, in a stable order.
+    """
+    for root, dirs, files in os.walk(pdf_dir):
+        dirs.sort()
+        for file_name in sorted(files):
+            if file_name.lower().endswith(".pdf"):
+                yield os.path.join(root, file_name)
+
+
+def document_id(pdf_dir: str, pdf_path: str, section_number: str) -> str:
+    # Section numbers restart in every PDF, so IDs are namespaced by the file's relative path
+    relative_path = os.path.relpath(pdf_path, pdf_dir).replace(os.sep, "/")
+    return f"{relative_path}::{section_number}"
+
+
+def extract_pdf_sections(pdf_path: str, extractor: str = "auto", use_section_cache: bool = True) -> list:
+    """
+    Runs in a parse worker. Pages are parsed in-process since the pool already spreads PDFs over cores,
+    and not at all for PDFs whose sections are in the section cache.
+    """
+    sections = load_sections(pdf_path, extractor, workers=1, use_cache=use_section_cache)
+    for section in sections:
+        section["content_hash"] = section_content_hash(section)
+    return sections
+
+
+def _put(target: queue.Queue, item, stop: threading.Event):
+    # Gives up instead of blocking forever when another stage has failed
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(source: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return source.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def ingest_directory(pdf_dir: str, embedding_type: str, use_embedding_cache: bool = True, parse_workers: int = None,
+                     queue_size: int = DEFAULT_QUEUE_SIZE, embed_batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+                     write_batch_size: int = DEFAULT_WRITE_BATCH_SIZE, chunking: bool = False,
+                     chunk_tokens: int = None, extractor: str = "auto", use_section_cache: bool = True,
+                     sync: bool = False) -> dict:
+    """
+    Streams every PDF below pdf_dir into the collection for embedding_type.
+
+    PDFs are parsed by a process pool, sections flow through a bounded queue to a batched
+    embedder thread, and embeddings flow through a second bounded queue to a batched Chroma
+    writer, so parsing, embedding and writing overlap and memory is bounded by the queue sizes.
+    Sections whose content_hash is already stored are skipped. With chunking, sections are
+    split into overlapping chunks that fit the max length of embedding_type. Sections are found
+    with extractor and cached per PDF content (see section_extractors). With sync, stored IDs
+    that no PDF produced any more (removed PDFs, sections or chunks) are deleted afterwards,
+    unless a PDF failed to parse and its sections are therefore unknown.
+    """
+    db, embedding_function, collection_name = get_chroma_db(embedding_type, use_embedding_cache)
+    collection = db._collection
+    existing_items = collection.get(include=["metadatas"])
+    existing_hashes = {
+        doc_id: (metadata or {}).get("content_hash")
+        for doc_id, metadata in zip(existing_items["ids"], existing_items["metadatas"])
+    }
+    print(f"Number of existing documents in DB ({collection_name}): {len(existing_hashes)}")
+
+    chunk_tokens = chunk_budget(embedding_type, chunk_tokens) if chunking else None
+    if not sync:
+        check_chunk_layout(existing_hashes, chunking, collection_name)
+    parse_workers = parse_workers or os.cpu_count() or 1
+    section_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=max(1, queue_size // embed_batch_size))
+    stop = threading.Event()
+    errors = []
+    stats = {"pdfs": 0, "failed": 0, "sections": 0, "embedded": 0, "unchanged": 0, "written": 0, "deleted": 0}
+    current_ids = set()
+
+    def parse_stage():
+        try:
+            with ProcessPoolExecutor(max_workers=parse_workers) as executor:
+                in_flight = deque()
+                for pdf_path in discover_pdfs(pdf_dir):
+                    in_flight.append((pdf_path, executor.submit(extract_pdf_sections, pdf_path, extractor,
+                                                                    use_section_cache)))
+                    # Keep only a couple of PDFs per worker in flight so parsed sections can't pile up
+                    while len(in_flight) >= 2 * parse_workers:
+                        emit_sections(*in_flight.popleft())
+                    if stop.is_set():
+                        return
+                while in_flight:
+                    emit_sections(*in_flight.popleft())
+        except Exception as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            _put(section_queue, _DONE, stop)
+
+    def emit_sections(pdf_path, future):
+        try:
+            sections = future.result()
+        except Exception as error:
+            # One unreadable PDF shouldn't stop a whole corpus from being ingested
+            print(f"Skipping {pdf_path}: {error}")
+            stats["failed"] += 1
+            return
+        stats["pdfs"] += 1
+        print(f"Parsed {pdf_path}: {len(sections)} sections")
+        for section in sections:
+            doc_id = document_id(pdf_dir, pdf_path, section["section_number"])
+            metadata = {
+                "source": pdf_path,
+                "section_number": section["section_number"],
+                "title": section["title"],
+                "page": section["page"],
+                "content_hash": section["content_hash"]
+            }
+            if chunk_tokens is None:
+                _put(section_queue, (doc_id, section["text"], metadata), stop)
+                continue
+            for chunk in chunk_section(doc_id, section["text"], metadata, chunk_tokens):
+                _put(section_queue, chunk, stop)
+
+    def embed_stage():
+        batch = []
+
+        def flush():
+            texts = [text for _, text, _ in batch]
+            with timer("embed_documents", len(texts), text_bytes(texts)):
+                embeddings = embedding_function.embed_documents(texts)
+            stats["embedded"] += len(batch)
+            _put(write_queue, (batch, embeddings), stop)
+
+        try:
+            while True:
+                item = _get(section_queue, stop)
+                if item is _DONE:
+                    break
+                stats["sections"] += 1
+                doc_id, text, metadata = item
+                current_ids.add(doc_id)
+                if existing_hashes.get(doc_id) == metadata["content_hash"]:
+                    stats["unchanged"] += 1
+                    continue
+                batch.append(item)
+                if len(batch) >= embed_batch_size:
+                    flush()
+                    batch = []
+            if batch and not stop.is_set():
+                flush()
+        except Exception as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            _put(write_queue, _DONE, stop)
+
+    start_time = time.perf_counter()
+    threads = [threading.Thread(target=parse_stage, daemon=True), threading.Thread(target=embed_stage, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    # The writer runs on the calling thread
+    pending = []
+
+    def write():
+        with timer("vector_store_upsert", len(pending)):
+            collection.upsert(
+                ids=[doc_id for doc_id, _, _, _ in pending],
+                embeddings=[embedding for _, _, _, embedding in pending],
+                metadatas=[metadata for _, _, metadata, _ in pending],
+                documents=[text for _, text, _, _ in pending]
+            )
+        stats["written"] += len(pending)
+
+    try:
+        while True:
+            item = _get(write_queue, stop)
+            if item is _DONE:
+                break
+            batch, embeddings = item
+            pending.extend((doc_id, text, metadata, embedding)
+                           for (doc_id, text, metadata), embedding in zip(batch, embeddings))
+            if len(pending) >= write_batch_size:
+                write()
+                pending = []
+        if pending and not stop.is_set():
+            write()
+    except Exception as error:
+        errors.append(error)
+        stop.set()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    if sync:
+        deleted_ids = [doc_id for doc_id in existing_hashes if doc_id not in current_ids]
+        if stats["failed"]:
+            print(f"⚠️ Not deleting anything: {stats['failed']} PDFs failed to parse")
+        elif deleted_ids:
+            print(f"🗑️ Deleting removed documents: {len(deleted_ids)}")
+            collection.delete(ids=deleted_ids)
+            stats["deleted"] = len(deleted_ids)
+
+    elapsed = time.perf_counter() - start_time
+    changed = stats["written"] + stats["deleted"] > 0
+    update_bm25_from_collection(collection, collection_name, changed=changed)
+    if changed:
+        invalidate_query_cache(collection_name)
+    print(f"✅ Ingested {stats['pdfs']} PDFs into {collection_name} in {elapsed:.1f}s: "
+          f"{stats['sections']} sections, {stats['written']} written, {stats['unchanged']} unchanged, "
+          f"{stats['deleted']} deleted "
+          f"({stats['sections'] / max(elapsed, 1e-9):.1f} sections/sec)")
+    if use_embedding_cache:
+        embedding_function.print_stats()
+    return stats
@@ -0,0 +1,157 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_stages = {}
+_stages_lock = threading.Lock()
+
+
+class Measurement:
+    """
+    Filled in by the timed code: the number of items and bytes it processed.
+    """
+
+    def __init__(self, items: int = 0, nbytes: int = 0):
+        self.items = items
+        self.nbytes = nbytes
+
+
+def record(stage: str, seconds: float, items: int = 0, nbytes: int = 0):
+    with _stages_lock:
+        stats = _stages.setdefault(stage, {"durations": [], "items": 0, "bytes": 0})
+        stats["durations"].append(seconds)
+        stats["items"] += items
+        stats["bytes"] += nbytes
+
+
+@contextmanager
+def timer(stage: str, items: int = 0, nbytes: int = 0):
+    measurement = Measurement(items, nbytes)
+    start = time.perf_counter()
+    try:
+        yield measurement
+    finally:
+        record(stage, time.perf_counter() - start, measurement.items, measurement.nbytes)
+
+
+def instrumented(stage: str, items=None):
+    """
+    Decorator timing every call of a function under stage. items(result) counts what the call produced.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(stage) as measurement:
+                result = function(*args, **kwargs)
+                if items is not None:
+                    measurement.items = items(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def text_bytes(texts: list) -> int:
+    return sum(len(text.encode("utf-8")) for text in texts)
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    # Nearest-rank percentile, enough for a handful of timings per stage
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def report() -> dict:
+    """
+    Returns count, total seconds, p50/p95 milliseconds and items/bytes per second for every stage.
+    """
+    with _stages_lock:
+        stages = {stage: dict(stats, durations=sorted(stats["durations"])) for stage, stats in _stages.items()}
+    summary = {}
+    for stage, stats in stages.items():
+        total = sum(stats["durations"])
+        summary[stage] = {
+            "count": len(stats["durations"]),
+            "total_s": total,
+            "p50_ms": 1000 * percentile(stats["durations"], 0.5),
+            "p95_ms": 1000 * percentile(stats["durations"], 0.95),
+            "items": stats["items"],
+            "items_per_s": stats["items"] / total if total else 0.0,
+            "bytes": stats["bytes"],
+            "bytes_per_s": stats["bytes"] / total if total else 0.0,
+        }
+    return summary
+
+
+def print_report():
+    summary = report()
+    if not summary:
+        return
+    print(f"\n{'stage':<22} {'count':>6} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} {'items/s':>10} {'MiB/s':>8}")
+    for stage, stats in sorted(summary.items(), key=lambda item: item[1]["total_s"], reverse=True):
+        print(f"{stage:<22} {stats['count']:>6} {stats['total_s']:>9.2f} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+              f"{stats['items_per_s']:>10.1f} {stats['bytes_per_s'] / 1024 ** 2:>8.2f}")
+
+
+def write_report(path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report(), f, indent=2)
+    print(f"Stage metrics written to {path}")
+
+
+def drain() -> dict:
+    """
+    Returns the raw measurements recorded so far and clears them, e.g. to ship them from a worker process.
+    """
+    with _stages_lock:
+        stages = dict(_stages)
+        _stages.clear()
+    return stages
+
+
+def merge(stages: dict):
+    with _stages_lock:
+        for stage, stats in stages.items():
+            target = _stages.setdefault(stage, {"durations": [], "items": 0, "bytes": 0})
+            target["durations"].extend(stats["durations"])
+            target["items"] += stats["items"]
+            target["bytes"] += stats["bytes"]
+
+
+@contextmanager
+def profiling(output_directory: str, name: str):
+    """
+    Runs the body under cProfile and tracemalloc, then writes {name}.pstats and the top
+    allocation sites to {name}_memory.txt in output_directory.
+    """
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    os.makedirs(output_directory, exist_ok=True)
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats_path = os.path.join(output_directory, f"{name}.pstats")
+        profiler.dump_stats(stats_path)
+        memory_path = os.path.join(output_directory, f"{name}_memory.txt")
+        with open(memory_path, "w") as f:
+            f.write(f"Peak traced memory: {peak / 1024 ** 2:.1f} MiB\n\n")
+            for statistic in snapshot.statistics("lineno")[:50]:
+                f.write(f"{statistic}\n")
+        print(f"Profile written to {stats_path} and {memory_path}")
+        pstats.Stats(stats_path).sort_stats("cumulative").print_stats(15)
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+LLM_CACHE_PATH = "llm_cache/responses.sqlite"
+DEFAULT_MAX_ENTRIES = 100_000
+
+
+class LLMResponseCache:
+    """
+    Persists LLM responses in SQLite, keyed by model, generation options and the exact prompt,
+    so repeated evaluation runs only call the model for prompts it hasn't answered yet. The
+    least recently used responses are evicted past max_entries. Safe to share between threads.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, response TEXT, last_used INTEGER)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._connection.commit()
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def key(model: str, options: dict, prompt: str) -> str:
+        scope = f"{model}\0{json.dumps(options or {}, sort_keys=True)}"
+        return hashlib.sha256(f"{scope}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time_ns(), key))
+            self._connection.commit()
+            return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                                     (key, model, response, time.time_ns()))
+            self._entries += 1
+            if self._entries > self.max_entries:
+                # Drop least recently used responses until the cache is back under 90% of its budget
+                self._connection.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (max(self._entries - int(self.max_entries * 0.9), 0),)
+                )
+                self._entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            self._connection.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._entries
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"LLM response cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.1%} hit rate), {stats['entries']} entries")
@@ -1,18 +1,94 @@
 import fitz  # PyMuPDF, install with pip install pymupdf
+import os
 import re, sys
 import argparse
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from instrumentation import instrumented, timer
 
+# Small documents are parsed in-process; a worker is only worth starting for this many pages
+PAGES_PER_WORKER = 50
+# Pages handed to a worker at a time; small chunks keep the parsed pages waiting to be used few
+MAX_PAGES_PER_TASK = 16
+# Lines set at least this large are headings
+HEADING_FONT_SIZE = 13
+TOC_LINE = re.compile(r'^\s*(?:(?:(\d+(?:\.\d+)*\.?)\s+)?(.+?)\s*\.+\s*(\d+)$)')
 
-def extract_sections(pdf_path: str) -> list:
+
+_worker_doc = None
+
+
+def _init_page_worker(pdf_path: str):
+    # One fitz handle per worker process, reused for every page it parses
+    global _worker_doc
+    _worker_doc = fitz.open(pdf_path)
+
+
+def _parse_pages(page_numbers: list) -> list:
+    return [_page_lines(_worker_doc[p]) for p in page_numbers]
+
+
+def _page_lines(page_obj) -> list:
     """
-    Extract sections from a single PDF using the TOC on pages 2-6 (0-based).
-    Returns a list of dictionaries with section_number, title, page, and text.
+    Returns the (line_text, font_size) pairs of every non-empty text line on a page.
+    """
+    page_lines = []
+    text_dict = page_obj.get_text("dict")
+    for block in text_dict.get("blocks", []):
+        if block.get("type") != 0:  # Skip non-text blocks
+            continue
+        for line in block.get("lines", []):
+            line_text = "".join(span.get("text", "") for span in line.get("spans", [])).strip()
+            if not line_text:
+                continue
+            # Get font size from first span
+            font_size = line.get("spans", [{}])[0].get("size", 0.0)
+            page_lines.append((line_text, font_size))
+    return page_lines
+
+
+def iter_page_lines(pdf_path: str, page_count: int, workers: int = None):
+    """
+    Yields the (line_text, font_size) pairs of every page, in page order, parsing each page once.
+    With several workers, pages are parsed by a process pool a few small chunks ahead of the
+    consumer, so only those chunks are ever held in memory.
+    """
+    if workers is None:
+        workers = min(os.cpu_count() or 1, max(1, page_count // PAGES_PER_WORKER))
+    if workers <= 1:
+        with fitz.open(pdf_path) as doc:
+            for p in range(page_count):
+                with timer("parse_pages", 1):
+                    page_lines = _page_lines(doc[p])
+                yield page_lines
+        return
+
+    chunk_size = max(1, min(-(-page_count // (workers * 4)), MAX_PAGES_PER_TASK))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_page_worker, initargs=(pdf_path,)) as executor:
+        in_flight = deque()
+        for start in range(0, page_count, chunk_size):
+            chunk = list(range(start, min(start + chunk_size, page_count)))
+            in_flight.append((len(chunk), executor.submit(_parse_pages, chunk)))
+            if len(in_flight) >= 2 * workers:
+                yield from _chunk_result(*in_flight.popleft())
+        while in_flight:
+            yield from _chunk_result(*in_flight.popleft())
+
+
+def _chunk_result(pages: int, future) -> list:
+    with timer("parse_pages", pages):
+        return future.result()
+
+
+def parse_toc(doc) -> list:
+    """
+    Returns (section_number, title, page) for every entry of the TOC on pages 2-6 (0-based).
     """
     empty_section_number_count = 1
-    doc = fitz.open(pdf_path)
-    # Parse TOC from pages 2-6 (0-based, range(2,7))
+    # Parse TOC from pages 2-6 (0-based, range(2,7)), or as many of them as a short document has
     toc_text = ""
-    for page_num in range(2, 7):
+    for page_num in range(2, min(7, doc.page_count)):
         toc_text += doc[page_num].get_text() + "\n"
 
     # Parse TOC lines
@@ -23,7 +99,7 @@ def extract_sections(pdf_path: str) -> list:
         if not line or "Table of Contents" in line:
             continue
         # Match lines with optional leading spaces
-        match = re.match(r'^\s*(?:(?:(\d+(?:\.\d+)*\.?)\s+)?(.+?)\s*\.+\s*(\d+)$)', line)
+        match = TOC_LINE.match(line)
         empty_section_number = False
         if match:
             if match.group(1) is not None:
@@ -39,84 +115,212 @@ def extract_sections(pdf_path: str) -> list:
             if empty_section_number:
                 empty_section_number_count += 1
         last_line = line
-    if not toc:
-        print(f"No sections found in {pdf_path}.")
-        doc.close()
-        return []
-
-    # Extract text for each section
-    sections = []
-    for i in range(len(toc)):
-        section_number, title, page = toc[i]
-        if page == 0:
-            # section_number: 0.1, title: Version 3
-            continue
+    return toc
 
-        next_section_number = toc[i + 1][0] if i + 1 < len(toc) else None
-        next_title = toc[i + 1][1] if i + 1 < len(toc) else None
-        next_page = toc[i + 1][2] if i + 1 < len(toc) else len(doc) + 1
 
-        # if section_number == '4.4.3.':
-        #     print(f"next_title: {next_title}, next_page: {next_page}")
+class HeadingIndex:
+    """
+    Where every TOC title and section number occurs in the document's heading lines.
 
-        # Collect full text with formatting from start page to next page
-        full_text = []
-        for p in range(page - 1, next_page):
-            if p >= doc.page_count:
-                continue
-            page_obj = doc[p]
-            text_dict = page_obj.get_text("dict")
-            for block in text_dict.get("blocks", []):
-                if block.get("type") != 0:  # Skip non-text blocks
+    The patterns go into one Aho-Corasick automaton, so each heading line is scanned once
+    for all of them, with the same substring semantics as `pattern in line_text`. Pages are
+    added in order, which keeps each pattern's (page, line) positions sorted for bisect.
+    """
+
+    def __init__(self, patterns: list):
+        self.patterns = list(dict.fromkeys(patterns))
+        self.pattern_ids = {pattern: i for i, pattern in enumerate(self.patterns)}
+        self.positions = [[] for _ in self.patterns]
+        self._goto = [{}]
+        self._outputs = [[]]
+        for i, pattern in enumerate(self.patterns):
+            state = 0
+            for character in pattern:
+                if character not in self._goto[state]:
+                    self._goto.append({})
+                    self._outputs.append([])
+                    self._goto[state][character] = len(self._goto) - 1
+                state = self._goto[state][character]
+            self._outputs[state].append(i)
+        # Failure links, breadth first, each state also reporting the patterns of its failure state
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for character, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and character not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(character, 0)
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+
+    def matches(self, text: str) -> set:
+        """
+        Returns the ids of every pattern that occurs in text.
+        """
+        # An empty pattern is in every text
+        found = set(self._outputs[0])
+        state = 0
+        for character in text:
+            while state and character not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(character, 0)
+            found.update(self._outputs[state])
+        return found
+
+    def add_page(self, page: int, page_lines: list):
+        for line_index, (line_text, font_size) in enumerate(page_lines):
+            if font_size >= HEADING_FONT_SIZE:
+                for pattern_id in self.matches(line_text):
+                    self.positions[pattern_id].append((page, line_index))
+
+    def first(self, patterns: list, start: tuple):
+        """
+        Returns the first indexed (page, line) at or after start of a heading containing any of patterns.
+        """
+        best = None
+        for pattern in patterns:
+            positions = self.positions[self.pattern_ids[pattern]]
+            index = bisect_left(positions, start)
+            if index < len(positions) and (best is None or positions[index] < best):
+                best = positions[index]
+        return best
+
+
+def heading_patterns(section_number: str, title: str) -> list:
+    # A heading is found by its title, or by its section number unless that was made up for an unnumbered entry
+    return [title] if section_number.startswith("0") else [title, section_number]
+
+
+def iter_sections(pdf_path: str, workers: int = None, diagnostics: list = None):
+    """
+    Yields the sections of a single PDF, found with the TOC on pages 2-6 (0-based), one at a time
+    as dictionaries with section_number, title, page (from the TOC), end_page (the last page
+    holding the section's text), and text.
+
+    Pages are walked once, in order (in parallel across workers processes, default: based on
+    page count). A section is yielded as soon as the next section's heading is found, and only
+    the pages from the current section to the page holding that heading are kept, so memory
+    stays flat however long the PDF is. Headings are found through a HeadingIndex built as the
+    pages stream past, so resolving boundaries costs lookups rather than rescans of the text.
+    Every heading that isn't found is appended to diagnostics, if given.
+    """
+    with fitz.open(pdf_path) as doc:
+        toc = parse_toc(doc)
+        if not toc:
+            print(f"No sections found in {pdf_path}.")
+            return
+        page_count = doc.page_count
+
+        # Each section is looked for from its TOC page up to and including the next section's page
+        page_ranges = []
+        for i, (section_number, title, page) in enumerate(toc):
+            next_page = toc[i + 1][2] if i + 1 < len(toc) else len(doc) + 1
+            first_page = min(max(page - 1, 0), page_count)
+            page_ranges.append((first_page, min(max(next_page, first_page), page_count)))
+        # Pages before keep_from[i] are not needed by section i or any section after it
+        keep_from = [page_count] * (len(toc) + 1)
+        for i in range(len(toc) - 1, -1, -1):
+            keep_from[i] = keep_from[i + 1] if toc[i][2] == 0 else min(keep_from[i + 1], page_ranges[i][0])
+
+        headings = HeadingIndex([pattern for section_number, title, _ in toc
+                                 for pattern in heading_patterns(section_number, title)])
+        pages = {}
+        page_stream = iter_page_lines(pdf_path, page_count, workers)
+        next_unread = 0
+
+        def read_page(keep: int):
+            nonlocal next_unread
+            lines = next(page_stream)
+            headings.add_page(next_unread, lines)
+            if next_unread >= keep:
+                pages[next_unread] = lines
+            next_unread += 1
+
+        def page_lines(p: int, keep: int) -> list:
+            while next_unread <= p:
+                read_page(keep)
+            if p not in pages:
+                # Only when the TOC goes back to a page that was already dropped
+                pages[p] = _page_lines(doc[p])
+            return pages[p]
+
+        def find_heading(patterns: list, start: tuple, end_page: int, keep: int):
+            # Pages are only read until the heading turns up: later pages can only hold later positions
+            while True:
+                position = headings.first(patterns, start)
+                if position is not None and position[0] < next_unread:
+                    return position if position[0] < end_page else None
+                if next_unread >= end_page:
+                    return None
+                read_page(keep)
+
+        try:
+            for i, (section_number, title, page) in enumerate(toc):
+                if page == 0:
+                    # section_number: 0.1, title: Version 3
                     continue
-                for line in block.get("lines", []):
-                    line_text = "".join(span.get("text", "") for span in line.get("spans", [])).strip()
-                    if not line_text:
-                        continue
-                    # Get font size from first span
-                    font_size = line.get("spans", [{}])[0].get("size", 0.0)
-                    full_text.append((line_text, font_size))
-
-        # Find start index after title with font size >= 13
-        start_idx = -1
-        for j in range(len(full_text)):
-            line_text, font_size = full_text[j]
-            if font_size >= 13 and (title in line_text or (not section_number.startswith("0") and section_number in line_text)):
-                start_idx = j + 1
-                break
-        if start_idx == -1:
-            print(f"Title '{title}' or section number '{section_number}' not found on page {page} with font size >= 13.")
-            continue
+                for p in [p for p in pages if p < keep_from[i]]:
+                    del pages[p]
 
-        # Find end index before next title with font size >= 13
-        end_idx = len(full_text)
-        if next_title:
-            for j in range(start_idx, len(full_text)):
-                line_text, font_size = full_text[j]
-                if font_size >= 13 and (next_title in line_text or (next_section_number and not next_section_number.startswith("0") and next_section_number in line_text)):
-                    end_idx = j
-                    break
+                first_page, last_page = page_ranges[i]
+                # Find start after title with font size >= 13
+                start = find_heading(heading_patterns(section_number, title), (first_page, 0), last_page, keep_from[i])
+                if start is None:
+                    print(f"Title '{title}' or section number '{section_number}' not found on page {page} with font size >= {HEADING_FONT_SIZE}.")
+                    if diagnostics is not None:
+                        diagnostics.append({"section_number": section_number, "title": title, "page": page,
+                                            "missing": "start", "pages_searched": [first_page, last_page]})
+                    continue
+
+                # Collect lines up to the next title with font size >= 13
+                end = None
+                if i + 1 < len(toc):
+                    end = find_heading(heading_patterns(*toc[i + 1][:2]), (start[0], start[1] + 1), last_page,
+                                       keep_from[i])
+                    if end is None and diagnostics is not None:
+                        diagnostics.append({"section_number": toc[i + 1][0], "title": toc[i + 1][1],
+                                            "page": toc[i + 1][2], "missing": "end of " + section_number,
+                                            "pages_searched": [start[0], last_page]})
+                end_page, end_line = end if end is not None else (last_page, 0)
+                section_lines = []
+                for p in range(start[0], min(end_page + 1, last_page)):
+                    lines = page_lines(p, keep_from[i])
+                    section_lines.extend(line_text for line_text, _ in
+                                         lines[start[1] + 1 if p == start[0] else 0:end_line if p == end_page else None])
+
+                # Collect text, removing empty lines
+                text = '\n'.join([line_text for line_text in section_lines if line_text.strip()]).strip()
 
-        # Collect text, removing empty lines
-        text = '\n'.join([line_text for line_text, _ in full_text[start_idx:end_idx] if line_text.strip()]).strip()
+                yield {
+                    "section_number": section_number,
+                    "title": title,
+                    "page": page,
+                    "end_page": max(start[0], end_page - 1 if end_line == 0 else end_page) + 1,
+                    "text": text
+                }
+        finally:
+            page_stream.close()
 
-        sections.append({
-            "section_number": section_number,
-            "title": title,
-            "page": page,
-            "text": text
-        })
 
-    doc.close()
-    return sections
+@instrumented("extract_sections", items=len)
+def extract_sections(pdf_path: str, workers: int = None, diagnostics: list = None) -> list:
+    """
+    Extract sections from a single PDF using the TOC on pages 2-6 (0-based).
+    Returns a list of dictionaries with section_number, title, page, end_page, and text.
+    """
+    return list(iter_sections(pdf_path, workers, diagnostics))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Extract PDF sections using TOC.")
     parser.add_argument("--pdf_path", type=str, default="data/2024_Joint_Application_Information_Requirements.pdf")
+    parser.add_argument("--workers", type=int, default=None, help="Number of page parsing processes.")
     args = parser.parse_args()
 
-    sections = extract_sections(args.pdf_path)
+    diagnostics = []
+    sections = extract_sections(args.pdf_path, workers=args.workers, diagnostics=diagnostics)
     for section in sections:
         print(f"\n{'=' * 80}")
         print(f"Section number: {section['section_number']} Section title: {section['title']} (Page: {section['page']})")
@@ -126,4 +330,8 @@ if __name__ == "__main__":
         # print(f"Preview_start: {preview_start}")
         # print(f"Preview_last: {preview_last}")
         # print(f"Length: {len(section['text'])} characters")
-    print(f"length of sections: {len(sections)}")
\ No newline at end of file
+    print(f"length of sections: {len(sections)}")
+    for diagnostic in diagnostics:
+        print(f"Heading not found ({diagnostic['missing']}): {diagnostic['section_number']} {diagnostic['title']} "
+              f"(TOC page {diagnostic['page']}, searched pages {diagnostic['pages_searched'][0]}-"
+              f"{diagnostic['pages_searched'][1] - 1})")
\ No newline at end of file
@@ -1,12 +1,12 @@
 import argparse
+import hashlib
 import os
 import shutil
-from pdf_splitter_test import extract_sections
-from langchain.schema.document import Document
-from langchain.vectorstores.chroma import Chroma
-from chromadb import PersistentClient
-from chromadb.config import Settings
-from get_embedding_function import get_embedding_function
+import time
+from concurrent.futures import ThreadPoolExecutor
+from section_extractors import iter_cached_sections, EXTRACTOR_NAMES
+from get_embedding_function import get_embedding_function, EMBEDDING_TYPES, EMBEDDING_BACKEND_KINDS, MATRYOSHKA_EMBEDDINGS
+from instrumentation import instrumented, timer, text_bytes, print_report, write_report, profiling
 
 CHROMA_PATH = "chroma"
 DATA_PATH = "data"
@@ -14,72 +14,433 @@ DATA_PATH = "data"
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--reset", action="store_true", help="Reset the database.")
+    parser.add_argument("--reset", action="store_true",
+                        help="Delete the Chroma collection, NumPy vector index and BM25 index of every chosen "
+                             "embedding before populating.")
     parser.add_argument("--pdf_path", type=str,
                         default="data/2024_Joint_Application_Information_Requirements.pdf",
                         help="Path to the PDF file.")
-    parser.add_argument("--embedding", type=str, default="ollama_nomic",
-                        choices=["ollama_nomic", "ollama_mxbai", "ollama_minilm", "openai", "bge_large", "e5_large", "mpnet", "bge_m3", "bedrock"],
-                        help="Which embedding type to use.")
+    parser.add_argument("--pdf_dir", type=str, default=None,
+                        help="Ingest every PDF below this directory instead of --pdf_path.")
+    parser.add_argument("--parse_workers", type=int, default=None,
+                        help="Number of processes parsing PDFs when --pdf_dir is used.")
+    parser.add_argument("--extractor", type=str, default="auto", choices=EXTRACTOR_NAMES,
+                        help="How sections are found: the printed table of contents, the PDF outline, heading font "
+                             "sizes, or 'auto' to use the first of those the PDF has.")
+    parser.add_argument("--no_section_cache", action="store_true",
+                        help="Parse every PDF again instead of reading its cached sections.")
+    parser.add_argument("--queue_size", type=int, default=256,
+                        help="Maximum number of sections waiting to be embedded when --pdf_dir is used.")
+    parser.add_argument("--embedding", type=str, nargs="+", default=["ollama_nomic"],
+                        choices=EMBEDDING_TYPES + ["all"],
+                        help="Which embedding type(s) to use; 'all' populates every backend from a single parse.")
+    parser.add_argument("--no_embedding_cache", action="store_true",
+                        help="Embed every section again instead of reusing cached vectors.")
+    parser.add_argument("--sync", action="store_true",
+                        help="Re-embed changed sections and delete sections that are no longer in the PDF "
+                             "(or, with --pdf_dir, in any PDF below it).")
+    parser.add_argument("--vector_store", type=str, default="chroma", choices=["chroma", "numpy"],
+                        help="Store sections in Chroma or in the in-process NumPy vector index (always synced).")
+    parser.add_argument("--ivf_lists", type=int, default=0,
+                        help="Number of IVF clusters for the NumPy vector index; 0 keeps exact search.")
+    parser.add_argument("--quantization", type=str, default=None, choices=["none", "int8", "binary"],
+                        help="Search int8 or binary codes of the NumPy vector index, rescoring with full precision "
+                             "(default: keep the index's current setting).")
+    parser.add_argument("--keep_full_precision", action=argparse.BooleanOptionalAction, default=None,
+                        help="Keep full-precision vectors next to the quantized codes so queries can rescore with "
+                             "them; without it only the codes are stored (default: keep the index's current setting).")
+    parser.add_argument("--dims", type=int, default=None,
+                        help="Keep only the first dims dimensions of every vector in the NumPy vector index "
+                             f"(Matryoshka models only: {', '.join(sorted(MATRYOSHKA_EMBEDDINGS))}).")
+    parser.add_argument("--chunk_tokens", type=int, default=None,
+                        help="Cap chunks at this many tokens (default: the embedding model's max length).")
+    parser.add_argument("--no_chunking", action="store_true",
+                        help="Store every section as one document, however long it is.")
+    parser.add_argument("--metrics_json", type=str, default=None,
+                        help="Also write the per-stage timings to this JSON file.")
+    parser.add_argument("--profile", type=str, default=None, metavar="DIR",
+                        help="Write cProfile and tracemalloc snapshots of the run to DIR.")
     args = parser.parse_args()
+    if ((args.quantization or args.dims or args.keep_full_precision is not None)
+            and (args.vector_store != "numpy" or args.pdf_dir)):
+        parser.error("--quantization, --dims and --keep_full_precision apply to --vector_store numpy with --pdf_path")
+    if args.pdf_dir and args.vector_store != "chroma":
+        parser.error("--pdf_dir only ingests into --vector_store chroma")
+    if args.dims and not set(args.embedding) <= MATRYOSHKA_EMBEDDINGS:
+        parser.error(f"--dims needs a Matryoshka embedding: {', '.join(sorted(MATRYOSHKA_EMBEDDINGS))}")
+    if args.profile:
+        with profiling(args.profile, "populate_database"):
+            populate(args)
+    else:
+        populate(args)
+    print_report()
+    if args.metrics_json:
+        write_report(args.metrics_json)
+
+
+def populate(args):
+    if "all" in args.embedding:
+        # The hash stand-in is only meant for benchmarks and tests
+        embedding_types = [embedding_type for embedding_type in EMBEDDING_TYPES if embedding_type != "hash"]
+    else:
+        embedding_types = list(dict.fromkeys(args.embedding))
 
     if args.reset:
-        print(f"✨ Clearing Database for embedding={args.embedding}")
-        clear_database(args.embedding)
+        for embedding_type in embedding_types:
+            print(f"✨ Clearing Database for embedding={embedding_type}")
+            clear_database(embedding_type)
+
+    if args.pdf_dir:
+        from ingest_pipeline import ingest_directory
+        for embedding_type in embedding_types:
+            ingest_directory(args.pdf_dir, embedding_type, use_embedding_cache=not args.no_embedding_cache,
+                             parse_workers=args.parse_workers, queue_size=args.queue_size,
+                             chunking=not args.no_chunking, chunk_tokens=args.chunk_tokens,
+                             extractor=args.extractor, use_section_cache=not args.no_section_cache,
+                             sync=args.sync)
+        return
+
+    documents = load_documents(args.pdf_path, args.extractor, use_section_cache=not args.no_section_cache)
+    chunking = not args.no_chunking
+    if args.vector_store == "numpy":
+        for embedding_type in embedding_types:
+            sync_vector_index(prepare_documents(documents, embedding_type, chunking, args.chunk_tokens), embedding_type,
+                              use_embedding_cache=not args.no_embedding_cache, ivf_lists=args.ivf_lists,
+                              quantization=args.quantization, dims=args.dims,
+                              keep_full_precision=args.keep_full_precision)
+    elif len(embedding_types) > 1:
+        populate_backends(documents, embedding_types, use_embedding_cache=not args.no_embedding_cache,
+                          sync=args.sync, chunking=chunking, chunk_tokens=args.chunk_tokens)
+    elif args.sync:
+        sync_chroma(prepare_documents(documents, embedding_types[0], chunking, args.chunk_tokens), embedding_types[0],
+                    use_embedding_cache=not args.no_embedding_cache)
+    else:
+        add_to_chroma(prepare_documents(documents, embedding_types[0], chunking, args.chunk_tokens), embedding_types[0],
+                      use_embedding_cache=not args.no_embedding_cache)
 
-    documents = load_documents(args.pdf_path)
-    add_to_chroma(documents, args.embedding)
 
+def section_content_hash(section: dict) -> str:
+    """
+    Hashes everything that ends up in a section's document, so any edit between guidebook
+    revisions changes the hash.
+    """
+    content = "\0".join([section["title"], str(section["page"]), section["text"]])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+@instrumented("load_documents", items=len)
+def load_documents(pdf_path: str, extractor: str = "auto", use_section_cache: bool = True) -> list:
+    from langchain_core.documents import Document
 
-def load_documents(pdf_path: str) -> list:
-    sections = extract_sections(pdf_path)
     documents = []
-    for section in sections:
+    # Sections are turned into documents as they are extracted, so the parsed pages never pile up;
+    # an unchanged PDF isn't parsed at all, its sections are read from the section cache
+    for section in iter_cached_sections(pdf_path, extractor, use_cache=use_section_cache):
         documents.append(Document(
             page_content=section["text"],
             metadata={
                 "source": pdf_path,
                 "section_number": section["section_number"],
                 "title": section["title"],
-                "page": section["page"]
+                "page": section["page"],
+                "content_hash": section_content_hash(section)
             }
         ))
     print(f"total documents: {len(documents)}")
     return documents
 
 
-def add_to_chroma(documents: list[Document], embedding_type: str):
-    client = PersistentClient(
+@instrumented("chunk_documents", items=len)
+def prepare_documents(documents: list, embedding_type: str, chunking: bool = True, chunk_tokens: int = None) -> list:
+    """
+    Splits section documents into overlapping chunks that fit the max length of embedding_type,
+    so the model never truncates them. Chunks keep their section's metadata.
+    """
+    if not chunking:
+        return documents
+    from section_chunker import chunk_budget, chunk_documents
+
+    budget = chunk_budget(embedding_type, chunk_tokens)
+    chunks = chunk_documents(documents, budget)
+    print(f"total chunks for {embedding_type} (up to {budget} tokens): {len(chunks)}")
+    return chunks
+
+
+def store_id(metadata: dict) -> str:
+    # Chunks are stored under their own ID, whole sections under their section number
+    return metadata.get("chunk_id", metadata["section_number"])
+
+
+def get_chroma_client():
+    from chromadb import PersistentClient
+    from chromadb.config import Settings
+
+    return PersistentClient(
         path=CHROMA_PATH,
         settings=Settings(anonymized_telemetry=False)
     )
 
+
+def get_chroma_db(embedding_type: str, use_embedding_cache: bool = True, client=None):
+    """
+    Opens (or creates) the collection for embedding_type, on client if one is given.
+    Returns the Chroma store, its embedding function and the collection name.
+    """
+    # Imported here so that --help doesn't pay for loading chromadb and langchain
+    from langchain.vectorstores.chroma import Chroma
+    from embedding_cache import get_cached_embedding_function
+
+    if client is None:
+        client = get_chroma_client()
+
     collection_name = f"my_collection_{embedding_type}"
+    if use_embedding_cache:
+        embedding_function = get_cached_embedding_function(embedding_type)
+    else:
+        embedding_function = get_embedding_function(embedding_type)
     db = Chroma(
         client=client,
         collection_name=collection_name,
-        embedding_function=get_embedding_function(embedding_type),
+        embedding_function=embedding_function,
         collection_metadata={"hnsw:space": "cosine"}
     )
+    return db, embedding_function, collection_name
+
+
+@instrumented("add_to_chroma", items=lambda added: added)
+def add_to_chroma(documents: list, embedding_type: str, use_embedding_cache: bool = True, client=None) -> int:
+    db, embedding_function, collection_name = get_chroma_db(embedding_type, use_embedding_cache, client)
 
     existing_items = db.get(include=[])
     existing_ids = set(existing_items["ids"])
     print(f"Number of existing documents in DB ({collection_name}): {len(existing_ids)}")
+    if documents:
+        from section_chunker import check_chunk_layout
+        check_chunk_layout(existing_ids, "chunk_id" in documents[0].metadata, collection_name)
 
-    new_documents = [doc for doc in documents if doc.metadata["section_number"] not in existing_ids]
+    new_documents = [doc for doc in documents if store_id(doc.metadata) not in existing_ids]
     if new_documents:
         print(f"👉 Adding new documents: {len(new_documents)}")
-        new_doc_ids = [doc.metadata["section_number"] for doc in new_documents]
+        new_doc_ids = [store_id(doc.metadata) for doc in new_documents]
         db.add_documents(new_documents, ids=new_doc_ids)
     else:
         print("✅ No new documents to add")
+    update_bm25_from_collection(db._collection, collection_name, changed=bool(new_documents))
+    if new_documents:
+        invalidate_query_cache(collection_name)
+    if use_embedding_cache:
+        embedding_function.print_stats()
+    return len(new_documents)
+
+
+def sync_chroma(documents: list, embedding_type: str, use_embedding_cache: bool = True, client=None) -> dict:
+    """
+    Brings the collection in line with documents using the content_hash stored in each
+    document's metadata: only new or changed sections are embedded and upserted, and sections
+    that disappeared from the PDF are deleted. Returns the added/updated/deleted/unchanged counts.
+    """
+    db, embedding_function, collection_name = get_chroma_db(embedding_type, use_embedding_cache, client)
+
+    existing_items = db.get(include=["metadatas"])
+    existing_hashes = {
+        doc_id: (metadata or {}).get("content_hash")
+        for doc_id, metadata in zip(existing_items["ids"], existing_items["metadatas"])
+    }
+    print(f"Number of existing documents in DB ({collection_name}): {len(existing_hashes)}")
+
+    summary = sync_store(db._collection, embedding_function, documents, existing_hashes)
+    update_bm25_from_collection(db._collection, collection_name, changed=summary_changed(summary))
+    if summary_changed(summary):
+        invalidate_query_cache(collection_name)
+    print(f"✅ Sync complete ({collection_name}): {summary['added']} added, {summary['updated']} updated, "
+          f"{summary['deleted']} deleted, {summary['unchanged']} unchanged")
+    if use_embedding_cache:
+        embedding_function.print_stats()
+    return summary
+
+
+def sync_store(store, embedding_function, documents: list, existing_hashes: dict) -> dict:
+    """
+    Embeds and upserts the documents that are new or whose content_hash differs from
+    existing_hashes, and deletes the IDs that are no longer among documents.
+    store is anything with Chroma's collection upsert/delete methods.
+    """
+    current_ids = set()
+    added = []
+    updated = []
+    for doc in documents:
+        doc_id = store_id(doc.metadata)
+        current_ids.add(doc_id)
+        if doc_id not in existing_hashes:
+            added.append(doc)
+        elif existing_hashes[doc_id] != doc.metadata["content_hash"]:
+            updated.append(doc)
+    deleted_ids = [doc_id for doc_id in existing_hashes if doc_id not in current_ids]
+
+    changed = added + updated
+    if changed:
+        print(f"👉 Embedding new or changed documents: {len(changed)}")
+        texts = [doc.page_content for doc in changed]
+        with timer("embed_documents", len(texts), text_bytes(texts)):
+            embeddings = embedding_function.embed_documents(texts)
+        with timer("vector_store_upsert", len(changed)):
+            store.upsert(
+                ids=[store_id(doc.metadata) for doc in changed],
+                embeddings=embeddings,
+                metadatas=[doc.metadata for doc in changed],
+                documents=texts
+            )
+    if deleted_ids:
+        print(f"🗑️ Deleting removed documents: {len(deleted_ids)}")
+        store.delete(ids=deleted_ids)
+
+    return {
+        "added": len(added),
+        "updated": len(updated),
+        "deleted": len(deleted_ids),
+        "unchanged": len(current_ids) - len(changed)
+    }
+
+
+def summary_changed(summary: dict) -> bool:
+    return summary["added"] + summary["updated"] + summary["deleted"] > 0
+
+
+def invalidate_query_cache(collection_name: str, vector_store: str = "chroma"):
+    # Cached query results are keyed by collection version too; this just frees their space right away
+    from query_cache import invalidate_collection
+    invalidate_collection(collection_name, vector_store)
+
+
+def update_bm25_index(path: str, ids: list, documents: list, metadatas: list, changed: bool = True):
+    """
+    Rebuilds the BM25 index at path from a collection's full contents, unless the
+    collection is unchanged and the index already exists.
+    """
+    if not changed and os.path.exists(path):
+        return
+    from bm25_index import BM25Index
+
+    BM25Index.build(path, ids, documents, metadatas).save()
+    print(f"Rebuilt BM25 index ({len(ids)} sections): {path}")
+
+
+def update_bm25_from_collection(collection, collection_name: str, changed: bool = True):
+    from bm25_index import bm25_index_path
+
+    path = bm25_index_path(collection_name)
+    if not changed and os.path.exists(path):
+        return
+    items = collection.get(include=["documents", "metadatas"])
+    update_bm25_index(path, items["ids"], items["documents"], items["metadatas"])
+
+
+def sync_vector_index(documents: list, embedding_type: str, use_embedding_cache: bool = True,
+                      ivf_lists: int = 0, quantization: str = None, dims: int = None,
+                      keep_full_precision: bool = None) -> dict:
+    """
+    Brings the in-process NumpyVectorStore for embedding_type in line with documents, the same
+    way sync_chroma does, and rebuilds its IVF lists when ivf_lists > 0. quantization, dims and
+    keep_full_precision change how the index stores its vectors (None keeps its current settings).
+    """
+    from embedding_cache import get_cached_embedding_function
+    from vector_index import NumpyVectorStore, VECTOR_INDEX_PATH
+    from bm25_index import bm25_index_path
+
+    if use_embedding_cache:
+        embedding_function = get_cached_embedding_function(embedding_type)
+    else:
+        embedding_function = get_embedding_function(embedding_type)
+    collection_name = f"my_collection_{embedding_type}"
+    store = NumpyVectorStore(os.path.join(VECTOR_INDEX_PATH, collection_name), embedding_function,
+                             quantization=quantization, dims=dims, keep_full_precision=keep_full_precision)
+    existing_hashes = {doc_id: metadata.get("content_hash") for doc_id, metadata in zip(store.ids, store.metadatas)}
+    print(f"Number of existing documents in vector index ({collection_name}): {len(existing_hashes)}")
+
+    summary = sync_store(store, embedding_function, documents, existing_hashes)
+    if ivf_lists > 0 and len(store):
+        store.build_ivf(ivf_lists)
+    with timer("vector_index_save", len(store)):
+        store.save()
+    update_bm25_index(bm25_index_path(collection_name, "numpy"), store.ids, store.documents, store.metadatas,
+                      changed=summary_changed(summary))
+    if summary_changed(summary):
+        invalidate_query_cache(collection_name, "numpy")
+    print(f"✅ Sync complete ({collection_name}, vector index): {summary['added']} added, {summary['updated']} updated, "
+          f"{summary['deleted']} deleted, {summary['unchanged']} unchanged")
+    if use_embedding_cache:
+        embedding_function.print_stats()
+    return summary
+
+
+def populate_backends(documents: list, embedding_types: list, use_embedding_cache: bool = True,
+                      sync: bool = False, chunking: bool = False, chunk_tokens: int = None) -> dict:
+    """
+    Fans the same documents out to the collection of every backend in embedding_types, chunked
+    for each backend's max length when chunking is set.
+    Backends of different kinds (local Hugging Face, Ollama server, remote APIs) run concurrently;
+    backends of the same kind run one after another so they don't compete for the same CPU or server.
+    Returns the seconds spent and the outcome for every backend.
+    """
+    client = get_chroma_client()
+    lanes = {}
+    for embedding_type in embedding_types:
+        lanes.setdefault(EMBEDDING_BACKEND_KINDS[embedding_type], []).append(embedding_type)
+
+    def run_lane(lane_embedding_types):
+        lane_report = {}
+        for embedding_type in lane_embedding_types:
+            start_time = time.perf_counter()
+            try:
+                backend_documents = prepare_documents(documents, embedding_type, chunking, chunk_tokens)
+                if sync:
+                    summary = sync_chroma(backend_documents, embedding_type, use_embedding_cache, client)
+                    outcome = f"{summary['added']} added, {summary['updated']} updated, {summary['deleted']} deleted"
+                else:
+                    outcome = f"{add_to_chroma(backend_documents, embedding_type, use_embedding_cache, client)} added"
+            except Exception as error:
+                # One unavailable backend (e.g. a missing API key) shouldn't stop the others
+                outcome = f"failed: {error}"
+            lane_report[embedding_type] = (time.perf_counter() - start_time, outcome)
+        return lane_report
+
+    report = {}
+    with ThreadPoolExecutor(max_workers=len(lanes)) as executor:
+        for lane_report in executor.map(run_lane, lanes.values()):
+            report.update(lane_report)
+
+    print(f"\n{'embedding':<15} {'kind':<12} {'seconds':>8}  outcome")
+    for embedding_type in embedding_types:
+        elapsed, outcome = report[embedding_type]
+        print(f"{embedding_type:<15} {EMBEDDING_BACKEND_KINDS[embedding_type]:<12} {elapsed:>8.1f}  {outcome}")
+    return report
 
 
 def clear_database(embedding_type: str):
-    collection_dir = os.path.join(CHROMA_PATH, f"my_collection_{embedding_type}")
+    collection_name = f"my_collection_{embedding_type}"
+    if os.path.exists(CHROMA_PATH):
+        # Chroma keeps collections in chroma.sqlite3 and UUID-named segment directories, so it deletes them itself
+        client = get_chroma_client()
+        if collection_name in {getattr(collection, "name", collection) for collection in client.list_collections()}:
+            client.delete_collection(collection_name)
+            print(f"Deleted collection: {collection_name}")
+    # Chroma before 0.4 kept a directory per collection
+    collection_dir = os.path.join(CHROMA_PATH, collection_name)
     if os.path.exists(collection_dir):
         shutil.rmtree(collection_dir)
         print(f"Deleted collection: {collection_dir}")
+    from bm25_index import bm25_index_path
+    from vector_index import VECTOR_INDEX_PATH
+
+    bm25_dir = bm25_index_path(collection_name)
+    if os.path.exists(bm25_dir):
+        shutil.rmtree(bm25_dir)
+        print(f"Deleted BM25 index: {bm25_dir}")
+    # Vectors or codes, settings, IVF lists and its BM25 index all go, so the next run uses the settings it is given
+    index_dir = os.path.join(VECTOR_INDEX_PATH, collection_name)
+    if os.path.exists(index_dir):
+        shutil.rmtree(index_dir)
+        print(f"Deleted NumPy vector index: {index_dir}")
 
 
 if __name__ == "__main__":
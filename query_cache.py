@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from embedding_cache import normalize_text, LOOKUP_CHUNK_SIZE, SQLITE_TIMEOUT
+from result_writer import score_type, with_score_type
+
+QUERY_CACHE_PATH = "query_cache/results.sqlite"
+DEFAULT_MAX_ENTRIES = 200_000
+
+
+def collection_version(db) -> str:
+    """
+    Fingerprints a collection's contents from the content_hash of every stored section,
+    so any add, update or delete made by populate_database gives a new version.
+    db is a Chroma store or a NumpyVectorStore.
+    """
+    items = db.get(include=["metadatas"])
+    digest = hashlib.sha256()
+    for doc_id, metadata in sorted(zip(items["ids"], items["metadatas"]), key=lambda item: item[0]):
+        digest.update(f"{doc_id}\0{(metadata or {}).get('content_hash', '')}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class QueryResultCache:
+    """
+    Persists the search results of every comment in SQLite.
+
+    Results are keyed by collection name, collection version, vector store, embedding type,
+    retrieval mode, k and normalized comment text, and store only (section id, distance, score
+    type) triples; each section's text and metadata are stored once per collection version.
+    Opening a collection at a new version drops its older entries, and the least recently used
+    results are evicted past max_entries. Writes are committed in short transactions, never held
+    across a search, so the retrieval service and query_data runs can share one cache file.
+    """
+
+    def __init__(self, collection_name: str, version: str, embedding_type: str, vector_store: str = "chroma",
+                 retrieval: str = "dense", path: str = QUERY_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.collection_name = collection_name
+        self.version = version
+        self.vector_store = vector_store
+        self.embedding_type = embedding_type
+        self.retrieval = retrieval
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+        self.search_seconds = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = open_query_cache(path)
+        # Results of older versions can never be hit again
+        for table in ("results", "sections"):
+            self._connection.execute(f"DELETE FROM {table} WHERE collection = ? AND store = ? AND version != ?",
+                                     (collection_name, vector_store, version))
+        self._connection.commit()
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def _key(self, k: int, comment: str) -> str:
+        scope = f"{self.collection_name}\0{self.version}\0{self.vector_store}\0{self.embedding_type}\0{self.retrieval}\0{k}"
+        return hashlib.sha256(f"{scope}\0{normalize_text(comment)}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: list) -> dict:
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(unique_keys), LOOKUP_CHUNK_SIZE):
+            chunk = unique_keys[start:start + LOOKUP_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._connection.execute(
+                f"SELECT key, matches FROM results WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            found.update((key, json.loads(matches)) for key, matches in rows)
+        if found:
+            now = time.time_ns()
+            self._connection.executemany("UPDATE results SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            # Committed now: an open write transaction would lock out other writers during the search
+            self._connection.commit()
+        return found
+
+    def _sections(self, section_ids: set) -> dict:
+        from langchain_core.documents import Document
+
+        documents = {}
+        section_ids = list(section_ids)
+        for start in range(0, len(section_ids), LOOKUP_CHUNK_SIZE):
+            chunk = section_ids[start:start + LOOKUP_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._connection.execute(
+                f"SELECT section_id, document, metadata FROM sections "
+                f"WHERE collection = ? AND store = ? AND version = ? AND section_id IN ({placeholders})",
+                [self.collection_name, self.vector_store, self.version] + chunk
+            ).fetchall()
+            for section_id, document, metadata in rows:
+                documents[section_id] = Document(page_content=document, metadata=json.loads(metadata))
+        return documents
+
+    @staticmethod
+    def _match(documents: dict, section_id: str, distance: float, match_type: str = "dense") -> tuple:
+        doc = documents[section_id]
+        return (doc if match_type == "dense" else with_score_type(doc, match_type)), distance
+
+    def _store(self, items: list, section_key):
+        now = time.time_ns()
+        result_rows = []
+        section_rows = {}
+        for key, results in items:
+            matches = []
+            for doc, distance in results:
+                section_id = section_key(doc.metadata)
+                # The score type belongs to the match, not to the section shared by other comments
+                metadata = {name: value for name, value in doc.metadata.items() if name != "score_type"}
+                section_rows[section_id] = (self.collection_name, self.vector_store, self.version, section_id,
+                                            doc.page_content, json.dumps(metadata))
+                matches.append([section_id, float(distance), score_type(doc.metadata)])
+            result_rows.append((key, self.collection_name, self.vector_store, self.version, json.dumps(matches), now))
+        self._connection.executemany("INSERT OR REPLACE INTO sections VALUES (?, ?, ?, ?, ?, ?)", section_rows.values())
+        self._connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)", result_rows)
+        self._entries += len(result_rows)
+        if self._entries > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        # Drop least recently used results until the cache is back under 90% of its budget
+        target = int(self.max_entries * 0.9)
+        self._connection.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)",
+            (max(self._entries - target, 0),)
+        )
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def search(self, comments: list, k: int, search, section_key) -> list:
+        """
+        Returns one list of (Document, distance) per comment, calling search(missing comments)
+        only for the comments that aren't cached yet. section_key names a result's section or chunk.
+        """
+        start_time = time.perf_counter()
+        keys = [self._key(k, comment) for comment in comments]
+        cached = self._lookup(keys)
+        documents = self._sections({match[0] for matches in cached.values() for match in matches})
+        # A result is only usable if all of its sections are still stored
+        cached = {key: matches for key, matches in cached.items()
+                  if all(match[0] in documents for match in matches)}
+        results = {key: [self._match(documents, *match) for match in matches] for key, matches in cached.items()}
+        missing = {}
+        for key, comment in zip(keys, comments):
+            if key not in results and key not in missing:
+                missing[key] = comment
+        self.hits += sum(1 for key in keys if key in results)
+        self.misses += len(missing)
+        self.lookup_seconds += time.perf_counter() - start_time
+
+        if missing:
+            search_start = time.perf_counter()
+            new_results = search(list(missing.values()))
+            self.search_seconds += time.perf_counter() - search_start
+            self._store(list(zip(missing.keys(), new_results)), section_key)
+            self._connection.commit()
+            results.update(zip(missing.keys(), new_results))
+        return [results[key] for key in keys]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "lookup_ms_per_comment": 1000 * self.lookup_seconds / total if total else 0.0,
+            "search_ms_per_miss": 1000 * self.search_seconds / self.misses if self.misses else 0.0,
+            "entries": self._entries
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Query result cache ({self.collection_name}, {self.retrieval}): {stats['hits']} hits, "
+              f"{stats['misses']} misses ({stats['hit_rate']:.1%} hit rate), "
+              f"{stats['lookup_ms_per_comment']:.2f} ms/comment lookup, "
+              f"{stats['search_ms_per_miss']:.2f} ms/miss search, {stats['entries']} entries")
+
+
+def open_query_cache(path: str = QUERY_CACHE_PATH) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=SQLITE_TIMEOUT)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS results ("
+        "key TEXT PRIMARY KEY, collection TEXT, store TEXT, version TEXT, matches TEXT, last_used INTEGER)"
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+    connection.execute("CREATE INDEX IF NOT EXISTS results_collection ON results (collection)")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS sections ("
+        "collection TEXT, store TEXT, version TEXT, section_id TEXT, document TEXT, metadata TEXT, "
+        "PRIMARY KEY (collection, store, version, section_id))"
+    )
+    return connection
+
+
+def invalidate_collection(collection_name: str, vector_store: str = "chroma", path: str = QUERY_CACHE_PATH):
+    """
+    Drops every cached result of a collection. populate_database calls this after changing one.
+    """
+    if not os.path.exists(path):
+        return
+    connection = open_query_cache(path)
+    with connection:
+        for table in ("results", "sections"):
+            connection.execute(f"DELETE FROM {table} WHERE collection = ? AND store = ?", (collection_name, vector_store))
+    connection.close()
@@ -4,18 +4,28 @@ import os
 # from langchain.vectorstores.chroma import Chroma
 import json
 import pandas as pd
-from langchain.prompts import ChatPromptTemplate
-from langchain_community.llms.ollama import Ollama
-from chromadb import PersistentClient
+# from langchain.prompts import ChatPromptTemplate
+# from langchain_community.llms.ollama import Ollama
 # from langchain.vectorstores.chroma import Chroma  # Assuming you're using langchain_community.vectorstores.chroma or similar; adjust if
-from langchain_community.vectorstores import Chroma
 import json
-from get_embedding_function import get_embedding_function
+import time
+from concurrent.futures import ProcessPoolExecutor
+from get_embedding_function import get_embedding_function, embed_queries, EMBEDDING_TYPES
 from collections import Counter
-import matplotlib.pyplot as plt
+from instrumentation import timer, text_bytes, print_report, write_report, profiling, drain, merge
+from result_writer import (ResultWriter, section_key, passage_key, score_type, with_score_type, DEFAULT_CHUNK_SIZE,
+                           OUTPUT_FORMATS)
+from vector_index import DEFAULT_RESCORE_CANDIDATES
+from reranker import (CrossEncoderReranker, DEFAULT_RERANK_MODEL, DEFAULT_RERANK_CANDIDATES, DEFAULT_RERANK_MARGIN,
+                      DEFAULT_RERANK_BATCH_SIZE, dense_margin)
 
 
 CHROMA_PATH = "chroma"
+CONFIG_JSON = "config_json_data/config.json"
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_HYBRID_CANDIDATES = 20
+# Most chunk hits fetched per section wanted, so that k distinct sections remain after aggregation
+MAX_CHUNKS_PER_SECTION = 4
 
 PROMPT_TEMPLATE = """
 Answer the question based only on the following context:
@@ -32,13 +42,100 @@ def main():
     # Create CLI.
     parser = argparse.ArgumentParser()
     # parser.add_argument("query_text", type=str, help="The query text.", default='Query comment')
-    # args = parser.parse_args()
+    parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Number of comments embedded and searched per batch.")
+    parser.add_argument("--embedding", type=str, default="ollama_nomic",
+                        choices=EMBEDDING_TYPES,
+                        help="Which embedding type to use. Must match the one used to populate the database.")
+    parser.add_argument("--no_embedding_cache", action="store_true",
+                        help="Embed every comment again instead of reusing cached vectors.")
+    parser.add_argument("--vector_store", type=str, default="chroma", choices=["chroma", "numpy"],
+                        help="Search the Chroma collection or the in-process NumPy vector index.")
+    parser.add_argument("--rescore_candidates", type=int, default=None,
+                        help="Candidates rescored with full-precision vectors when the NumPy vector index is "
+                             f"quantized and was populated with --keep_full_precision (default: "
+                             f"{DEFAULT_RESCORE_CANDIDATES}); 0 ranks by the quantized vectors alone.")
+    parser.add_argument("--retrieval", type=str, default="dense", choices=["dense", "hybrid"],
+                        help="Dense search only, or dense and BM25 matches fused by reciprocal rank.")
+    parser.add_argument("--hybrid_candidates", type=int, default=DEFAULT_HYBRID_CANDIDATES,
+                        help="Number of dense and of BM25 candidates fused per comment with --retrieval hybrid.")
+    parser.add_argument("--rerank", action="store_true",
+                        help="Reorder each comment's candidates with a cross-encoder before keeping the best match.")
+    parser.add_argument("--rerank_model", type=str, default=DEFAULT_RERANK_MODEL,
+                        help="Hugging Face cross-encoder used with --rerank.")
+    parser.add_argument("--rerank_candidates", type=int, default=DEFAULT_RERANK_CANDIDATES,
+                        help="Number of sections retrieved per comment and scored by the cross-encoder.")
+    parser.add_argument("--rerank_margin", type=float, default=DEFAULT_RERANK_MARGIN,
+                        help="Keep the retrieved order, without reranking, when the best match is at least this "
+                             "much more similar than the runner-up; 1 or more reranks every comment.")
+    parser.add_argument("--rerank_batch_size", type=int, default=DEFAULT_RERANK_BATCH_SIZE,
+                        help="Number of (comment, section) pairs scored per cross-encoder call.")
+    parser.add_argument("--service", type=str, default=None, metavar="URL",
+                        help="Search through a running retrieval_service (http://host:port or unix:///path) "
+                             "instead of opening the collection; it applies its own retrieval settings.")
+    parser.add_argument("--no_query_cache", action="store_true",
+                        help="Search every comment again instead of reusing cached results.")
+    parser.add_argument("--query_cache_size", type=int, default=None,
+                        help="Maximum number of cached comment results (least recently used are evicted).")
+    parser.add_argument("--output_format", type=str, nargs="+", default=["xlsx"], choices=OUTPUT_FORMATS,
+                        help="Result files to write. Parquet and CSV store each section's text once in a *_sections file.")
+    parser.add_argument("--write_chunk_size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Number of result rows buffered before they are written.")
+    parser.add_argument("--configs", type=str, nargs="+", default=None,
+                        help="Evaluate these configs together, sharing retrieval across them.")
+    parser.add_argument("--all_configs", action="store_true",
+                        help=f"Evaluate every config listed in {CONFIG_JSON}.")
+    parser.add_argument("--render_workers", type=int, default=None,
+                        help="Processes writing the per-config Excel files and plots (default: one per CPU).")
+    parser.add_argument("--metrics_json", type=str, default=None,
+                        help="Also write the per-stage timings to this JSON file.")
+    parser.add_argument("--profile", type=str, default=None, metavar="DIR",
+                        help="Write cProfile and tracemalloc snapshots of the run to DIR.")
+    args = parser.parse_args()
+    if args.service and (args.rerank or args.retrieval != "dense" or args.rescore_candidates is not None):
+        parser.error("--service searches with the service's own settings; start retrieval_service with "
+                     "--retrieval/--rerank instead")
+    if args.profile:
+        with profiling(args.profile, "query_data"):
+            run(args)
+    else:
+        run(args)
+    print_report()
+    if args.metrics_json:
+        write_report(args.metrics_json)
+
+
+def run(args):
     # query_text = args.query_text
     # query_rag(query_text)
-    query_rag('')
+    reranker = None
+    if args.rerank:
+        reranker = CrossEncoderReranker(args.rerank_model, args.rerank_candidates, args.rerank_batch_size,
+                                        args.rerank_margin)
+    if args.configs or args.all_configs:
+        if args.all_configs:
+            with open(CONFIG_JSON, 'r') as f:
+                config_names = list(json.load(f))
+        else:
+            config_names = args.configs
+        query_configs(config_names, embedding_type=args.embedding, batch_size=args.batch_size,
+                      use_embedding_cache=not args.no_embedding_cache, vector_store=args.vector_store,
+                      render_workers=args.render_workers, output_formats=args.output_format,
+                      chunk_size=args.write_chunk_size, retrieval=args.retrieval,
+                      hybrid_candidates=args.hybrid_candidates, use_query_cache=not args.no_query_cache,
+                      query_cache_size=args.query_cache_size, rescore_candidates=args.rescore_candidates,
+                      reranker=reranker, service_url=args.service)
+    else:
+        query_rag('', embedding_type=args.embedding, batch_size=args.batch_size,
+                  use_embedding_cache=not args.no_embedding_cache, vector_store=args.vector_store,
+                  output_formats=args.output_format, chunk_size=args.write_chunk_size,
+                  retrieval=args.retrieval, hybrid_candidates=args.hybrid_candidates,
+                  use_query_cache=not args.no_query_cache, query_cache_size=args.query_cache_size,
+                  rescore_candidates=args.rescore_candidates, reranker=reranker, service_url=args.service)
 
 
 def plot_section_frequency(section_numbers, horizontal_plot, config_name, output_directory, total_number_of_comments):
+    import matplotlib.pyplot as plt
     section_freq = Counter(section_numbers)
     top_section = sorted(section_freq.items(), key=lambda x: x[1], reverse=True)[:10]
     if not top_section:
@@ -67,6 +164,7 @@ def plot_section_frequency(section_numbers, horizontal_plot, config_name, output
             plt.legend(loc='lower right')
 
             plt.savefig(f'{output_directory}/{config_name}_comments_{total_number_of_comments}_section_frequency_horizontal.png')
+            plt.close()
         else:
             print("No page data available.")
     else:
@@ -82,11 +180,13 @@ def plot_section_frequency(section_numbers, horizontal_plot, config_name, output
             plt.xticks(sorted_pages)  # Show all page numbers on x-axis
             plt.grid(axis='y', linestyle='--', alpha=0.7)
             plt.savefig(f'{output_directory}/{config_name}_comments_{total_number_of_comments}_section_frequency_vertical.png')
+            plt.close()
         else:
             print("No pages with frequency of at least 5.")
 
 
 def plot_similarity(scores, config_name, output_directory, total_number_of_comments):
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(10, 6))
     plt.hist(scores, bins=10, range=(0, 1), color='skyblue', edgecolor='black')
     plt.xlabel('Similarity Score')
@@ -94,27 +194,195 @@ def plot_similarity(scores, config_name, output_directory, total_number_of_comme
     plt.title('Histogram of Similarity Scores (0-1)')
     plt.grid(axis='y', linestyle='--', alpha=0.7)
     plt.savefig(f'{output_directory}/{config_name}_comments_{total_number_of_comments}_similarity_scores_histogram.png')
+    plt.close()
     return
 
 
-def query_rag(query_text: str):
-    # Prepare the DB.
-    output_directory = 'output/section_splitter'
-    config_name = 'config_4'
-    json_file = f'config_json_data/representative_sentences_{config_name}.json'
-    best_match_count = 1
-    number_of_representative_sentences = 5
-    os.makedirs(output_directory, exist_ok=True)
-    embedding_function = get_embedding_function()
-    # db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
+def query_collection(db, query_embeddings: list, k: int) -> list:
+    """
+    Sends several query vectors to the collection in one round trip.
+    Returns one list of (Document, distance) per query, like similarity_search_with_score.
+    """
+    from langchain_core.documents import Document
+
+    if hasattr(db, "similarity_search_by_vectors"):
+        return db.similarity_search_by_vectors(query_embeddings, k)
 
-    client = PersistentClient(path=CHROMA_PATH)
-    db = Chroma(
-        client=client,
-        collection_name="my_collection",  # Match the collection name used in your population script
-        embedding_function=embedding_function
+    results = db._collection.query(
+        query_embeddings=query_embeddings,
+        n_results=k,
+        include=["documents", "metadatas", "distances"]
     )
+    all_results = []
+    for documents, metadatas, distances in zip(results["documents"], results["metadatas"], results["distances"]):
+        all_results.append([
+            (Document(page_content=document, metadata=metadata or {}), distance)
+            for document, metadata, distance in zip(documents, metadatas, distances)
+        ])
+    return all_results
+
+
+def search_batch(db, embedding_function, comments: list, k: int, lexical_index=None,
+                 hybrid_candidates: int = DEFAULT_HYBRID_CANDIDATES, chunks_per_section: int = 1,
+                 reranker=None) -> list:
+    """
+    Returns one list of (Document, distance) per comment, with at most one match per section:
+    chunks_per_section times as many chunk hits are fetched and reduced to the best chunk of each
+    section. With a lexical_index, the top hybrid_candidates dense and BM25 matches of each
+    comment are fused by reciprocal rank. With a reranker, its candidates best matches are
+    fetched and reordered by the cross-encoder down to k.
+    """
+    if reranker is None:
+        return first_stage_search(db, embedding_function, comments, k, lexical_index, hybrid_candidates,
+                                  chunks_per_section)[0]
+    candidates, dense_margins = first_stage_search(db, embedding_function, comments, max(k, reranker.candidates),
+                                                   lexical_index, hybrid_candidates, chunks_per_section)
+    with timer("rerank", len(comments)):
+        return reranker.rerank(comments, candidates, k, passage_key, dense_margins)
+
+
+def first_stage_search(db, embedding_function, comments: list, k: int, lexical_index=None,
+                       hybrid_candidates: int = DEFAULT_HYBRID_CANDIDATES, chunks_per_section: int = 1) -> tuple:
+    """
+    Returns (one list of (Document, distance) per comment, each comment's dense margin). The
+    margin is taken from the dense results before any fusion, since fused distances are RRF
+    scores rather than similarities; fused matches are marked with score_type 'rrf'.
+    """
+    from section_chunker import aggregate_sections
+
+    with timer("embed_queries", len(comments), text_bytes(comments)):
+        query_embeddings = embed_queries(embedding_function, comments)
+    if lexical_index is None:
+        with timer("vector_search", len(comments)):
+            chunk_results = query_collection(db, query_embeddings, k * chunks_per_section)
+            results = [aggregate_sections(results, k, section_key) for results in chunk_results]
+        return results, [dense_margin(matches) for matches in results]
+
+    from bm25_index import reciprocal_rank_fusion
+
+    candidates = max(k, hybrid_candidates)
+    with timer("vector_search", len(comments)):
+        dense_results = [aggregate_sections(results, candidates, section_key) for results in
+                         query_collection(db, query_embeddings, candidates * chunks_per_section)]
+    with timer("bm25_search", len(comments)):
+        lexical_results = [aggregate_sections(results, candidates, section_key) for results in
+                           lexical_index.similarity_search_by_texts(comments, candidates * chunks_per_section)]
+    fused = [
+        [(with_score_type(doc, "rrf"), distance) for doc, distance in
+         reciprocal_rank_fusion([dense, lexical], k, key=lambda doc: section_key(doc.metadata))]
+        for dense, lexical in zip(dense_results, lexical_results)
+    ]
+    return fused, [dense_margin(dense) for dense in dense_results]
+
 
+def retrieve_batched(db, embedding_function, comments: list, k: int, batch_size: int = DEFAULT_BATCH_SIZE,
+                     lexical_index=None, chunks_per_section: int = 1) -> list:
+    """
+    Retrieves the best matches for every comment, embedding batch_size comments per call.
+    Returns one list of (Document, distance) per comment, in the same order as comments.
+    """
+    all_results = []
+    for start in range(0, len(comments), batch_size):
+        batch = comments[start:start + batch_size]
+        all_results.extend(search_batch(db, embedding_function, batch, k, lexical_index,
+                                        chunks_per_section=chunks_per_section))
+    return all_results
+
+
+def open_vector_store(embedding_type: str, use_embedding_cache: bool = True, vector_store: str = "chroma",
+                      rescore_candidates: int = None) -> tuple:
+    """
+    Opens the collection that populate_database built for embedding_type.
+    rescore_candidates overrides how many candidates a quantized NumPy vector index rescores.
+    Returns the store and its embedding function.
+    """
+    # Imported here so that --help doesn't pay for loading chromadb and langchain
+    from chromadb import PersistentClient
+    from langchain_community.vectorstores import Chroma
+    from embedding_cache import get_cached_embedding_function
+
+    if use_embedding_cache:
+        embedding_function = get_cached_embedding_function(embedding_type)
+    else:
+        embedding_function = get_embedding_function(embedding_type)
+    # db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
+
+    collection_name = f"my_collection_{embedding_type}"  # Match the collection name used in your population script
+    if vector_store == "numpy":
+        from vector_index import NumpyVectorStore, VECTOR_INDEX_PATH
+        db = NumpyVectorStore(os.path.join(VECTOR_INDEX_PATH, collection_name), embedding_function)
+        if rescore_candidates is not None:
+            db.rescore_candidates = rescore_candidates
+    else:
+        client = PersistentClient(path=CHROMA_PATH)
+        db = Chroma(
+            client=client,
+            collection_name=collection_name,
+            embedding_function=embedding_function
+        )
+    return db, embedding_function
+
+
+def chunks_per_section(db) -> int:
+    """
+    Returns how many chunk hits to fetch per section wanted from db: 1 for a collection of whole
+    sections, otherwise the largest number of chunks of any section, up to MAX_CHUNKS_PER_SECTION.
+    """
+    items = db.get(include=["metadatas"])
+    most_chunks = max(((metadata or {}).get("chunk_count", 1) for metadata in items["metadatas"]), default=1)
+    return min(most_chunks, MAX_CHUNKS_PER_SECTION)
+
+
+def open_lexical_index(embedding_type: str, vector_store: str = "chroma"):
+    """
+    Opens the BM25 index that populate_database built next to the collection for embedding_type.
+    """
+    from bm25_index import BM25Index, bm25_index_path
+
+    path = bm25_index_path(f"my_collection_{embedding_type}", vector_store)
+    lexical_index = BM25Index(path)
+    if len(lexical_index) == 0:
+        raise FileNotFoundError(f"No BM25 index at {path}; run populate_database.py for this embedding first.")
+    return lexical_index
+
+
+def open_result_cache(db, embedding_type: str, vector_store: str = "chroma", retrieval: str = "dense",
+                      hybrid_candidates: int = DEFAULT_HYBRID_CANDIDATES, max_entries: int = None, reranker=None):
+    from query_cache import QueryResultCache, collection_version, DEFAULT_MAX_ENTRIES
+
+    if retrieval == "hybrid":
+        # The number of fused candidates changes hybrid results
+        retrieval = f"hybrid_{hybrid_candidates}"
+    # So do quantization, truncated dimensions and rescoring
+    signature = db.search_signature() if hasattr(db, "search_signature") else ""
+    if signature:
+        retrieval = f"{retrieval}_{signature}"
+    if reranker is not None:
+        retrieval = f"{retrieval}_{reranker.signature()}"
+    return QueryResultCache(f"my_collection_{embedding_type}", collection_version(db), embedding_type, vector_store,
+                            retrieval, max_entries=max_entries or DEFAULT_MAX_ENTRIES)
+
+
+def open_retrieval(embedding_type: str, use_embedding_cache: bool = True, vector_store: str = "chroma",
+                   retrieval: str = "dense", hybrid_candidates: int = DEFAULT_HYBRID_CANDIDATES,
+                   use_query_cache: bool = True, query_cache_size: int = None, rescore_candidates: int = None,
+                   reranker=None, service_url: str = None) -> tuple:
+    """
+    Returns (db, embedding function, BM25 index, query result cache, service client) for a run.
+    With service_url only the client is set: the service holds the warm collection, its cache
+    and its retrieval settings, and nothing is opened locally.
+    """
+    if service_url:
+        from retrieval_service import RetrievalClient
+        return None, None, None, None, RetrievalClient(service_url, embedding_type)
+    db, embedding_function = open_vector_store(embedding_type, use_embedding_cache, vector_store, rescore_candidates)
+    lexical_index = open_lexical_index(embedding_type, vector_store) if retrieval == "hybrid" else None
+    query_cache = open_result_cache(db, embedding_type, vector_store, retrieval, hybrid_candidates,
+                                    query_cache_size, reranker) if use_query_cache else None
+    return db, embedding_function, lexical_index, query_cache, None
+
+
+def load_representative_sentences(json_file: str, number_of_representative_sentences: int) -> list:
     print(f"Loading JSON file: {json_file}")
 
     all_representative_sentences = []
@@ -125,48 +393,151 @@ def query_rag(query_text: str):
             for topic in all_topics:
                 for comment in topic['representative sentences'][:number_of_representative_sentences]:
                     all_representative_sentences.append((ob['company name'], comment))
-    total_number_of_comments = len(all_representative_sentences)
-    comments = []
-    company_names = []
-    page_numbers = []
-    page_contents = []
-    scores = []
-    section_numbers = []
-    horizontal_plot = True
+    return all_representative_sentences
+
+
+def dedupe_comments(all_representative_sentences: list) -> tuple:
+    """
+    Keeps the first company name seen for every comment, skipping repeated comments.
+    Returns the unique comments and their company names.
+    """
+    unique_comments = []
+    unique_company_names = []
+    seen_comments = set()
     for company_name, comment in all_representative_sentences:
-        # Search the DB
-        if comment in comments:
+        if comment in seen_comments:
             continue
-        results = db.similarity_search_with_score(comment, k=best_match_count)
+        seen_comments.add(comment)
+        unique_comments.append(comment)
+        unique_company_names.append(company_name)
+    return unique_comments, unique_company_names
+
+
+def compact_matches(results: list, sections: dict) -> list:
+    """
+    Reduces (Document, distance) results to (section id, page, section number, similarity,
+    score type), adding each section's text to sections the first time it is seen. The id of a
+    chunk hit names the chunk, so its row shows the passage that matched.
+    """
+    matches = []
+    for doc, _score in results:
+        section_id = passage_key(doc.metadata)
+        sections.setdefault(section_id, doc.page_content)
+        matches.append((section_id, int(doc.metadata['page']), doc.metadata['section_number'], 1 - _score,
+                        score_type(doc.metadata)))
+    return matches
 
+
+def retrieve_timed(db, embedding_function, comments: list, k: int, batch_size: int, sections: dict,
+                   lexical_index=None, hybrid_candidates: int = DEFAULT_HYBRID_CANDIDATES, query_cache=None,
+                   chunks_per_section: int = 1, reranker=None, service=None):
+    """
+    Yields the compact matches of every comment as its batch is retrieved, so callers can write
+    results while later batches are still being searched. Prints the retrieval throughput at the end.
+    With a RetrievalClient as service, each batch is one request to the retrieval service instead.
+    """
+    elapsed = 0.0
+    for start in range(0, len(comments), batch_size):
+        batch_start = time.perf_counter()
+        batch = comments[start:start + batch_size]
+        if service is not None:
+            with timer("service_search", len(batch)):
+                batch_results = service.search(batch, k)
+        elif query_cache is None:
+            batch_results = search_batch(db, embedding_function, batch, k, lexical_index, hybrid_candidates,
+                                         chunks_per_section, reranker)
+        else:
+            # Only comments without a cached result are embedded and searched
+            batch_results = query_cache.search(
+                batch, k, lambda missing: search_batch(db, embedding_function, missing, k, lexical_index,
+                                                       hybrid_candidates, chunks_per_section, reranker),
+                passage_key
+            )
+        elapsed += time.perf_counter() - batch_start
+        for results in batch_results:
+            yield compact_matches(results, sections)
+    if comments:
+        print(f"Retrieved {len(comments)} unique comments in {elapsed:.2f}s "
+              f"({len(comments) / max(elapsed, 1e-9):.1f} comments/sec)")
+    if hasattr(embedding_function, "print_stats"):
+        embedding_function.print_stats()
+    if reranker is not None:
+        reranker.print_stats()
+    if query_cache is not None:
+        query_cache.print_stats()
+
+
+def iter_result_rows(unique_company_names: list, unique_comments: list, all_matches):
+    # all_matches goes first so that a generator is run to completion and prints its stats
+    for matches, company_name, comment in zip(all_matches, unique_company_names, unique_comments):
         # Process each result
-        for i, (doc, _score) in enumerate(results):
-            # For first result, include comment and company name
-            similarity_score = 1 - _score
+        for i, (section_id, page_number, section_number, similarity_score, match_type) in enumerate(matches):
+            # For first result, include comment and company name; for the rest keep them empty
             if i == 0:
-                comments.append(comment)
-                company_names.append(company_name)
+                yield comment, company_name, page_number, section_number, similarity_score, match_type, section_id
             else:
-                # For second result, keep comment and company name empty
-                comments.append("")
-                company_names.append("")
-            scores.append(similarity_score)
-            page_contents.append(doc.page_content)
-            section_numbers.append(doc.metadata['section_number'])
-            page_numbers.append(int(doc.metadata['page']))
-    df = pd.DataFrame({
-        'comment': comments,
-        'company name': company_names,
-        'Guidebook page number': page_numbers,
-        'Guidebook section number': section_numbers,
-        'Match Score': scores,
-        'Guidebook page content': page_contents
-    })
-
-    # Save to Excel
-    df.to_excel(f'{output_directory}/{config_name}_comments_{total_number_of_comments}.xlsx', index=False)
-    plot_section_frequency(section_numbers, horizontal_plot, config_name, output_directory, total_number_of_comments)
-    plot_similarity(scores, config_name, output_directory, total_number_of_comments)
+                yield "", "", page_number, section_number, similarity_score, match_type, section_id
+
+
+def write_config_outputs(rows, sections: dict, config_name: str, output_directory: str, total_number_of_comments: int,
+                         horizontal_plot: bool = True, output_formats: list = ('xlsx',),
+                         chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Streams rows to the result files of config_name and plots them. Only the section numbers
+    and scores are kept for the plots.
+    """
+    section_numbers = []
+    scores = []
+    base_path = f'{output_directory}/{config_name}_comments_{total_number_of_comments}'
+    with ResultWriter(base_path, sections, output_formats, chunk_size) as writer:
+        for row in rows:
+            writer.write(row)
+            section_numbers.append(row[3])
+            scores.append(row[4])
+    with timer("plots", 2):
+        plot_section_frequency(section_numbers, horizontal_plot, config_name, output_directory, total_number_of_comments)
+        plot_similarity(scores, config_name, output_directory, total_number_of_comments)
+    return Counter(section_numbers)
+
+
+def render_config(*args) -> tuple:
+    """
+    Runs write_config_outputs in a worker process and sends its stage timings back with the result.
+    """
+    drain()
+    section_frequency = write_config_outputs(*args)
+    return section_frequency, drain()
+
+
+def query_rag(query_text: str, embedding_type: str = "ollama_nomic", batch_size: int = DEFAULT_BATCH_SIZE,
+              use_embedding_cache: bool = True, vector_store: str = "chroma", config_name: str = 'config_4',
+              output_formats: list = ('xlsx',), chunk_size: int = DEFAULT_CHUNK_SIZE, retrieval: str = "dense",
+              hybrid_candidates: int = DEFAULT_HYBRID_CANDIDATES, use_query_cache: bool = True,
+              query_cache_size: int = None, rescore_candidates: int = None, reranker=None, service_url: str = None):
+    # Prepare the DB.
+    output_directory = 'output/section_splitter'
+    json_file = f'config_json_data/representative_sentences_{config_name}.json'
+    best_match_count = 1
+    number_of_representative_sentences = 5
+    os.makedirs(output_directory, exist_ok=True)
+    db, embedding_function, lexical_index, query_cache, service = open_retrieval(
+        embedding_type, use_embedding_cache, vector_store, retrieval, hybrid_candidates, use_query_cache,
+        query_cache_size, rescore_candidates, reranker, service_url)
+
+    all_representative_sentences = load_representative_sentences(json_file, number_of_representative_sentences)
+    total_number_of_comments = len(all_representative_sentences)
+    horizontal_plot = True
+
+    unique_comments, unique_company_names = dedupe_comments(all_representative_sentences)
+
+    # Search the DB, writing each batch's rows as soon as it is retrieved
+    sections = {}
+    all_matches = retrieve_timed(db, embedding_function, unique_comments, best_match_count, batch_size, sections,
+                                 lexical_index, hybrid_candidates, query_cache,
+                                 chunks_per_section(db) if service is None else 1, reranker, service)
+    rows = iter_result_rows(unique_company_names, unique_comments, all_matches)
+    write_config_outputs(rows, sections, config_name, output_directory, total_number_of_comments, horizontal_plot,
+                         output_formats, chunk_size)
 
         # Create DataFrame
 
@@ -184,5 +555,83 @@ def query_rag(query_text: str):
     # return response_text
 
 
+def query_configs(config_names: list, embedding_type: str = "ollama_nomic", batch_size: int = DEFAULT_BATCH_SIZE,
+                  use_embedding_cache: bool = True, vector_store: str = "chroma", render_workers: int = None,
+                  output_formats: list = ('xlsx',), chunk_size: int = DEFAULT_CHUNK_SIZE, retrieval: str = "dense",
+                  hybrid_candidates: int = DEFAULT_HYBRID_CANDIDATES, use_query_cache: bool = True,
+                  query_cache_size: int = None, rescore_candidates: int = None, reranker=None,
+                  service_url: str = None) -> dict:
+    """
+    Evaluates several configs in one run. The union of their comments is retrieved once,
+    batched, and the results are fanned back out to each config's Excel file and plots, which
+    are rendered by a process pool. Also writes a cross-config summary of section frequencies.
+    A CrossEncoderReranker reorders each comment's candidates before the best match is kept.
+    With service_url, comments are searched by a running retrieval_service instead.
+    Returns the section frequency Counter of every config.
+    """
+    output_directory = 'output/section_splitter'
+    best_match_count = 1
+    number_of_representative_sentences = 5
+    os.makedirs(output_directory, exist_ok=True)
+
+    config_sentences = {
+        config_name: load_representative_sentences(f'config_json_data/representative_sentences_{config_name}.json',
+                                                   number_of_representative_sentences)
+        for config_name in config_names
+    }
+    all_comments, _ = dedupe_comments(
+        [pair for sentences in config_sentences.values() for pair in sentences]
+    )
+    total_comments = sum(len(sentences) for sentences in config_sentences.values())
+    print(f"{len(config_names)} configs: {total_comments} comments, {len(all_comments)} unique")
+
+    db, embedding_function, lexical_index, query_cache, service = open_retrieval(
+        embedding_type, use_embedding_cache, vector_store, retrieval, hybrid_candidates, use_query_cache,
+        query_cache_size, rescore_candidates, reranker, service_url)
+    # Each section's text is kept once; matches only reference it
+    sections = {}
+    all_matches = retrieve_timed(db, embedding_function, all_comments, best_match_count, batch_size, sections,
+                                 lexical_index, hybrid_candidates, query_cache,
+                                 chunks_per_section(db) if service is None else 1, reranker, service)
+    # The generator goes first so that it runs to completion and prints its stats
+    matches_by_comment = {comment: matches for matches, comment in zip(all_matches, all_comments)}
+
+    with ProcessPoolExecutor(max_workers=render_workers) as executor:
+        futures = {}
+        for config_name, sentences in config_sentences.items():
+            unique_comments, unique_company_names = dedupe_comments(sentences)
+            config_matches = [matches_by_comment[comment] for comment in unique_comments]
+            rows = list(iter_result_rows(unique_company_names, unique_comments, config_matches))
+            # Workers only receive the sections this config refers to
+            config_sections = {row[-1]: sections[row[-1]] for row in rows}
+            futures[config_name] = executor.submit(render_config, rows, config_sections, config_name,
+                                                   output_directory, len(sentences), True, output_formats, chunk_size)
+        section_frequencies = {}
+        for config_name, future in futures.items():
+            section_frequencies[config_name], worker_stages = future.result()
+            merge(worker_stages)
+
+    write_section_frequency_summary(section_frequencies, output_directory)
+    return section_frequencies
+
+
+def write_section_frequency_summary(section_frequencies: dict, output_directory: str):
+    """
+    Writes one row per section with its match count and share of matches in every config.
+    """
+    summary = pd.DataFrame(section_frequencies).fillna(0).astype(int)
+    summary.index.name = 'Guidebook section number'
+    for config_name in section_frequencies:
+        total = summary[config_name].sum()
+        summary[f'{config_name} share'] = summary[config_name] / total if total else 0.0
+    summary = summary.sort_values(list(section_frequencies), ascending=False)
+    summary_path = f'{output_directory}/configs_section_frequency_summary.xlsx'
+    summary.to_excel(summary_path)
+    print(f"Cross-config section frequency summary: {summary_path}")
+    for config_name, frequencies in section_frequencies.items():
+        top_sections = ", ".join(f"{section} ({count})" for section, count in frequencies.most_common(3))
+        print(f"  {config_name}: {top_sections}")
+
+
 if __name__ == "__main__":
     main()
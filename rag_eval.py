@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from get_embedding_function import EMBEDDING_TYPES
+from instrumentation import timer, record, print_report, write_report
+
+QUESTIONS_PATH = "data_sample/questions.yaml"
+DEFAULT_CONTEXT_SECTIONS = 5
+DEFAULT_MAX_CONCURRENCY = 4
+# Deterministic answers, so cached responses are the ones the model would give again
+DEFAULT_OPTIONS = {"temperature": 0}
+
+EVAL_PROMPT = """
+Expected Response: {expected_response}
+Actual Response: {actual_response}
+---
+(Answer with 'true' or 'false') Does the actual response match the expected response?
+"""
+
+
+def load_questions(path: str) -> list:
+    """
+    Reads (question, expected) pairs from a YAML or JSON file: a list of
+    {"question": ..., "expected": ...} items, optionally under a "questions" key.
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("questions", [])
+    return [{"question": item["question"], "expected": str(item.get("expected", item.get("expected_response")))}
+            for item in data]
+
+
+def build_prompt(question: str, results: list) -> str:
+    from query_data import PROMPT_TEMPLATE
+
+    context_text = "\n\n---\n\n".join(doc.page_content for doc, _score in results)
+    return PROMPT_TEMPLATE.format(context=context_text, question=question)
+
+
+def parse_verdict(text: str):
+    """
+    Returns True or False for a judge's answer, or None when it says neither.
+    """
+    cleaned = text.strip().lower()
+    if "true" in cleaned:
+        return True
+    if "false" in cleaned:
+        return False
+    return None
+
+
+def evaluate_questions(questions: list, db, embedding_function, llm, judge_model: str = None,
+                       k: int = DEFAULT_CONTEXT_SECTIONS, batch_size: int = 64, on_token=None) -> list:
+    """
+    Answers every question from its k best sections and has the judge compare each answer with
+    the expected one. Retrieval runs in batches; every question is then answered and judged as
+    its own task on llm's loop, so generation and judge calls overlap up to llm's concurrency.
+    on_token(index, token) streams the answers. Returns one result dict per question, in order.
+    """
+    from query_data import retrieve_batched, chunks_per_section
+    from result_writer import passage_key
+
+    texts = [item["question"] for item in questions]
+    with timer("retrieve", len(texts)):
+        all_results = retrieve_batched(db, embedding_function, texts, k, batch_size,
+                                       chunks_per_section=chunks_per_section(db))
+
+    async def answer_and_judge(index: int, item: dict, results: list) -> dict:
+        start = time.perf_counter()
+        stream = None if on_token is None else lambda token: on_token(index, token)
+        answer = await llm.agenerate(build_prompt(item["question"], results), on_token=stream, stage="generate")
+        judgement = await llm.agenerate(EVAL_PROMPT.format(expected_response=item["expected"], actual_response=answer),
+                                        model=judge_model, stage="judge")
+        record("answer_and_judge", time.perf_counter() - start, 1)
+        return {
+            "question": item["question"],
+            "expected": item["expected"],
+            "answer": answer,
+            "judgement": judgement.strip(),
+            "correct": parse_verdict(judgement),
+            "sources": [passage_key(doc.metadata) for doc, _score in results],
+        }
+
+    async def answer_all() -> list:
+        return await asyncio.gather(*(answer_and_judge(index, item, results)
+                                      for index, (item, results) in enumerate(zip(questions, all_results))))
+
+    with timer("answer_questions", len(questions)):
+        return llm.run(answer_all())
+
+
+def summarize(results: list) -> dict:
+    judged = [result["correct"] for result in results if result["correct"] is not None]
+    return {
+        "questions": len(results),
+        "correct": sum(judged),
+        "unjudged": len(results) - len(judged),
+        "accuracy": sum(judged) / len(results) if results else 0.0,
+    }
+
+
+def print_results(results: list):
+    for result in results:
+        # Green if the judge accepted the answer, red if it didn't, plain if it said neither
+        color = {True: "\033[92m", False: "\033[91m", None: ""}[result["correct"]]
+        print(f"{color}{result['question']}\n  expected: {result['expected']}\n  answer: {result['answer'].strip()}\n"
+              f"  judge: {result['judgement']}\033[0m")
+    summary = summarize(results)
+    print(f"Accuracy: {summary['correct']}/{summary['questions']} ({summary['accuracy']:.1%}), "
+          f"{summary['unjudged']} judgements neither true nor false")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a question set with RAG and judge the answers.")
+    parser.add_argument("--questions", type=str, default=QUESTIONS_PATH,
+                        help="YAML or JSON file of {question, expected} items.")
+    parser.add_argument("--embedding", type=str, default="ollama_nomic", choices=EMBEDDING_TYPES,
+                        help="Which embedding type to use. Must match the one used to populate the database.")
+    parser.add_argument("--vector_store", type=str, default="chroma", choices=["chroma", "numpy"])
+    parser.add_argument("--k", type=int, default=DEFAULT_CONTEXT_SECTIONS,
+                        help="Number of sections given to the model as context.")
+    parser.add_argument("--model", type=str, default="mistral", help="Ollama model that answers the questions.")
+    parser.add_argument("--judge_model", type=str, default=None, help="Ollama model that judges (default: --model).")
+    parser.add_argument("--max_concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help="Most generation and judge requests in flight at once.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Print answer tokens as they arrive (readable with --max_concurrency 1).")
+    parser.add_argument("--no_response_cache", action="store_true",
+                        help="Call the model for every prompt instead of reusing cached responses.")
+    parser.add_argument("--output", type=str, default=None, help="Also write every answer and judgement to this JSON file.")
+    parser.add_argument("--metrics_json", type=str, default=None,
+                        help="Also write the per-stage timings to this JSON file.")
+    args = parser.parse_args()
+
+    from async_ollama_llm import AsyncOllamaLLM
+    from llm_cache import LLMResponseCache
+    from query_data import open_vector_store
+
+    questions = load_questions(args.questions)
+    db, embedding_function = open_vector_store(args.embedding, vector_store=args.vector_store)
+    cache = None if args.no_response_cache else LLMResponseCache()
+    llm = AsyncOllamaLLM(args.model, max_concurrency=args.max_concurrency, options=DEFAULT_OPTIONS, cache=cache)
+    on_token = (lambda index, token: (sys.stdout.write(token), sys.stdout.flush())) if args.stream else None
+    try:
+        results = evaluate_questions(questions, db, embedding_function, llm, args.judge_model, args.k,
+                                     on_token=on_token)
+    finally:
+        llm.close()
+    if args.stream:
+        print()
+    print_results(results)
+    if cache is not None:
+        cache.print_stats()
+    print_report()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summarize(results), "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.metrics_json:
+        write_report(args.metrics_json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import math
+import time
+import numpy as np
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+DEFAULT_RERANK_CANDIDATES = 20
+DEFAULT_RERANK_BATCH_SIZE = 64
+# Skip reranking a comment when its best dense match is this much more similar than the runner-up
+DEFAULT_RERANK_MARGIN = 0.1
+MAX_QUERY_TOKENS = 64
+
+
+def dense_margin(results: list) -> float:
+    """
+    Returns how much closer a comment's best dense match is than its runner-up, or infinity
+    when there is no runner-up.
+    """
+    return results[1][1] - results[0][1] if len(results) >= 2 else math.inf
+
+
+class CrossEncoderReranker:
+    """
+    Reorders dense candidates by a cross-encoder's score for each (comment, section) pair.
+
+    Section texts are tokenized once and their token IDs cached for every later comment; only
+    the pairs are assembled per comment. Pairs are sorted by length and scored in batches of
+    batch_size so padding stays small on CPU. A comment whose best dense match beats the
+    runner-up by at least margin (in cosine similarity) keeps its first-stage order without
+    being scored. Reranked distances are 1 - sigmoid(cross-encoder logit), and their Documents
+    are marked with score_type 'cross_encoder' so they aren't mistaken for first-stage scores.
+    The model is loaded from Hugging Face (./hf_models) on first use.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_RERANK_MODEL, candidates: int = DEFAULT_RERANK_CANDIDATES,
+                 batch_size: int = DEFAULT_RERANK_BATCH_SIZE, margin: float = DEFAULT_RERANK_MARGIN,
+                 max_length: int = 512):
+        self.model_name = model_name
+        self.candidates = candidates
+        self.batch_size = batch_size
+        self.margin = margin
+        self.max_length = max_length
+        self.tokenizer = None
+        self.model = None
+        self._section_tokens = {}
+        self.stats = {"comments": 0, "reranked": 0, "skipped": 0, "pairs": 0, "top_changed": 0,
+                      "sections_tokenized": 0, "section_token_hits": 0, "seconds": 0.0}
+
+    def signature(self) -> str:
+        # Everything that changes the reranked results, for the query result cache key
+        return f"rerank_{self.model_name}_c{self.candidates}_dm{self.margin}"
+
+    def _load(self):
+        if self.model is not None:
+            return
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+        from get_embedding_function import HF_CACHE_FOLDER, is_hf_model_cached
+
+        local_files_only = is_hf_model_cached(self.model_name)
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, cache_dir=HF_CACHE_FOLDER,
+                                                       local_files_only=local_files_only)
+        self.model = AutoModelForSequenceClassification.from_pretrained(self.model_name, cache_dir=HF_CACHE_FOLDER,
+                                                                        local_files_only=local_files_only)
+        self.model.eval()
+
+    def _tokenize(self, text: str, max_tokens: int) -> list:
+        return self.tokenizer(text, add_special_tokens=False, truncation=True, max_length=max_tokens)["input_ids"]
+
+    def _encode_pair(self, query_ids: list, section_ids: list) -> dict:
+        return self.tokenizer.prepare_for_model(query_ids, section_ids, truncation="only_second",
+                                                max_length=self.max_length)
+
+    def _score_batch(self, features: list) -> np.ndarray:
+        import torch
+
+        batch = self.tokenizer.pad(features, return_tensors="pt")
+        with torch.inference_mode():
+            logits = self.model(**batch).logits
+        # Single-label rerankers output one relevance logit; two-label ones the positive class last
+        return logits[:, -1].float().numpy()
+
+    def _section_ids(self, key: str, text: str) -> list:
+        section_ids = self._section_tokens.get(key)
+        if section_ids is None:
+            section_ids = self._section_tokens[key] = self._tokenize(text, self.max_length)
+            self.stats["sections_tokenized"] += 1
+        else:
+            self.stats["section_token_hits"] += 1
+        return section_ids
+
+    def score(self, pairs: list) -> np.ndarray:
+        """
+        Returns the cross-encoder logit of every (query token IDs, section token IDs) pair.
+        """
+        features = [self._encode_pair(query_ids, section_ids) for query_ids, section_ids in pairs]
+        order = sorted(range(len(features)), key=lambda i: len(features[i]["input_ids"]))
+        scores = np.empty(len(features), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            scores[batch] = self._score_batch([features[i] for i in batch])
+        return scores
+
+    def rerank(self, comments: list, results: list, k: int, key, dense_margins: list = None) -> list:
+        """
+        Returns the best k of every comment's (Document, distance) candidates, reranked by the
+        cross-encoder unless the dense margin is decisive. key(metadata) names a candidate's
+        text for the token cache. dense_margins holds the gap between each comment's best two
+        dense distances; without it the candidates' own distances must be dense ones.
+        """
+        from result_writer import with_score_type
+
+        start_time = time.perf_counter()
+        self.stats["comments"] += len(comments)
+        if dense_margins is None:
+            dense_margins = [dense_margin(candidates) for candidates in results]
+        pairs = []
+        owners = []
+        reranked = [candidates[:k] for candidates in results]
+        for index, (comment, candidates) in enumerate(zip(comments, results)):
+            if len(candidates) < 2 or dense_margins[index] >= self.margin:
+                self.stats["skipped"] += 1
+                continue
+            self._load()
+            query_ids = self._tokenize(comment, MAX_QUERY_TOKENS)
+            for doc, _distance in candidates:
+                pairs.append((query_ids, self._section_ids(key(doc.metadata), doc.page_content)))
+                owners.append(index)
+        if pairs:
+            scores = self.score(pairs)
+            self.stats["pairs"] += len(pairs)
+            position = 0
+            for index in dict.fromkeys(owners):
+                candidates = results[index]
+                candidate_scores = scores[position:position + len(candidates)]
+                position += len(candidates)
+                order = np.argsort(-candidate_scores, kind="stable")[:k]
+                reranked[index] = [(with_score_type(candidates[i][0], "cross_encoder"),
+                                    1.0 - 1.0 / (1.0 + math.exp(-float(candidate_scores[i])))) for i in order]
+                self.stats["reranked"] += 1
+                self.stats["top_changed"] += int(order[0] != 0)
+        self.stats["seconds"] += time.perf_counter() - start_time
+        return reranked
+
+    def print_stats(self):
+        stats = self.stats
+        comments = max(stats["comments"], 1)
+        print(f"Reranker ({self.model_name}): {stats['reranked']} of {stats['comments']} comments reranked, "
+              f"{stats['skipped']} kept by the dense margin, {stats['pairs']} pairs scored, "
+              f"{1000 * stats['seconds'] / comments:.2f} ms/comment added, top match changed for "
+              f"{stats['top_changed'] / comments:.1%} of comments, {stats['sections_tokenized']} sections tokenized "
+              f"({stats['section_token_hits']} cache hits)")
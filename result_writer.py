@@ -0,0 +1,184 @@
+import csv
+import os
+import sys
+from instrumentation import timer
+
+RESULT_COLUMNS = ['comment', 'company name', 'Guidebook page number', 'Guidebook section number', 'Match Score',
+                  'Score Type', 'section id']
+EXCEL_COLUMNS = RESULT_COLUMNS[:-1] + ['Guidebook page content']
+OUTPUT_FORMATS = ['xlsx', 'parquet', 'csv']
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def section_key(metadata: dict) -> str:
+    # Section numbers restart in every PDF, so the source keeps keys unique across documents
+    return f"{metadata.get('source', '')}::{metadata['section_number']}"
+
+
+def passage_key(metadata: dict) -> str:
+    # A chunk of a section is keyed by its section and position, a whole section by the section alone
+    if "chunk_index" not in metadata:
+        return section_key(metadata)
+    return f"{section_key(metadata)}#{metadata['chunk_index']}"
+
+
+def score_type(metadata: dict) -> str:
+    # 'dense', 'rrf' for hybrid fusion or 'cross_encoder'; unfused, unreranked matches carry the store's distance
+    return metadata.get('score_type', 'dense')
+
+
+def with_score_type(doc, score_type: str):
+    """
+    Returns a copy of doc whose metadata names the score its distance is, leaving doc itself
+    untouched since one stored Document can be a match of several comments.
+    """
+    return type(doc)(page_content=doc.page_content, metadata={**doc.metadata, 'score_type': score_type})
+
+
+def peak_memory_mb():
+    """
+    Returns the peak resident set size of this process in MiB, or None where it isn't available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def result_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('comment', pa.string()),
+        ('company name', pa.string()),
+        ('Guidebook page number', pa.int64()),
+        ('Guidebook section number', pa.string()),
+        ('Match Score', pa.float64()),
+        ('Score Type', pa.string()),
+        ('section id', pa.string()),
+    ])
+
+
+class ResultWriter:
+    """
+    Streams result rows to disk in chunks of chunk_size.
+
+    Rows reference their section (or the chunk of it that matched) by id instead of carrying its
+    text: the text of every section is kept once in the sections dict. Parquet and CSV results
+    get a matching *_sections file with the text of every referenced section, while the Excel
+    export (openpyxl write-only mode) repeats the text in each row for human readers. Only the
+    current chunk is held in memory.
+    """
+
+    def __init__(self, base_path: str, sections: dict, formats: list = ('xlsx',), chunk_size: int = DEFAULT_CHUNK_SIZE):
+        unknown = set(formats) - set(OUTPUT_FORMATS)
+        if unknown:
+            raise ValueError(f"Unknown output formats: {sorted(unknown)}")
+        self.base_path = base_path
+        self.sections = sections
+        self.formats = list(formats)
+        self.chunk_size = chunk_size
+        self.rows_written = 0
+        self.referenced_sections = set()
+        self._chunk = []
+        self._workbook = self._sheet = None
+        self._parquet_writer = None
+        self._csv_file = self._csv_writer = None
+
+        if 'xlsx' in self.formats:
+            from openpyxl import Workbook
+            self._workbook = Workbook(write_only=True)
+            # Same sheet name as DataFrame.to_excel
+            self._sheet = self._workbook.create_sheet('Sheet1')
+            self._sheet.append(EXCEL_COLUMNS)
+        if 'csv' in self.formats:
+            self._csv_file = open(f'{base_path}.csv', 'w', newline='', encoding='utf-8')
+            self._csv_writer = csv.writer(self._csv_file)
+            self._csv_writer.writerow(RESULT_COLUMNS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, row: tuple):
+        self._chunk.append(row)
+        if len(self._chunk) >= self.chunk_size:
+            self.flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        if not self._chunk:
+            return
+        with timer("write_results", len(self._chunk)):
+            self._flush_chunk()
+        self.rows_written += len(self._chunk)
+        self._chunk = []
+
+    def _flush_chunk(self):
+        for row in self._chunk:
+            self.referenced_sections.add(row[-1])
+        if self._sheet is not None:
+            for row in self._chunk:
+                self._sheet.append(list(row[:-1]) + [self.sections[row[-1]]])
+        if self._csv_writer is not None:
+            self._csv_writer.writerows(self._chunk)
+        if 'parquet' in self.formats:
+            self._write_parquet_chunk()
+
+    def _write_parquet_chunk(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = result_schema()
+        columns = list(zip(*self._chunk)) or [[] for _ in RESULT_COLUMNS]
+        table = pa.Table.from_arrays([pa.array(column, field.type) for column, field in zip(columns, schema)], schema=schema)
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(f'{self.base_path}.parquet', schema)
+        self._parquet_writer.write_table(table)
+
+    def _write_sections(self):
+        section_ids = sorted(self.referenced_sections)
+        if 'parquet' in self.formats:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.table({
+                'section id': pa.array(section_ids, pa.string()),
+                'Guidebook page content': pa.array([self.sections[section_id] for section_id in section_ids], pa.string()),
+            }), f'{self.base_path}_sections.parquet')
+        if 'csv' in self.formats:
+            with open(f'{self.base_path}_sections.csv', 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['section id', 'Guidebook page content'])
+                writer.writerows((section_id, self.sections[section_id]) for section_id in section_ids)
+
+    def close(self):
+        self.flush()
+        with timer("save_results", self.rows_written):
+            self._save()
+
+        peak = peak_memory_mb()
+        peak_text = f", peak memory {peak:.0f} MiB" if peak is not None else ""
+        print(f"Wrote {self.rows_written} rows referencing {len(self.referenced_sections)} sections to "
+              f"{os.path.basename(self.base_path)}.{{{','.join(self.formats)}}}{peak_text}")
+
+    def _save(self):
+        if self._parquet_writer is None and 'parquet' in self.formats:
+            # No rows at all: still leave an empty file with the right schema behind
+            self._write_parquet_chunk()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = self._csv_writer = None
+        if self._workbook is not None:
+            self._workbook.save(f'{self.base_path}.xlsx')
+            self._workbook = self._sheet = None
+        self._write_sections()
@@ -0,0 +1,524 @@
+import argparse
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from get_embedding_function import EMBEDDING_TYPES
+from instrumentation import record, report, timer
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_WAIT_MS = 5.0
+MAX_K = 100
+REQUEST_TIMEOUT = 120.0
+
+
+class WarmCollection:
+    """
+    One collection kept open for the life of the service: its vector store, embedding function,
+    optional BM25 index, reranker and query result cache, and the text of every stored passage
+    (a whole section, or a chunk of one) with the passages of every section in chunk order.
+
+    Everything is opened on a batcher thread, which then serves every search of this collection:
+    requests arriving within max_wait_ms of each other are merged, up to max_batch comments, and
+    searched with one embedding call per k. The stores are only ever touched by that thread.
+    Before every batch it checks whether populate_database has written the collection's files
+    since they were opened, and if so reopens the stores, the query result cache (at the new
+    collection version) and the passages.
+    """
+
+    def __init__(self, embedding_type: str, vector_store: str = "chroma", retrieval: str = "dense",
+                 hybrid_candidates: int = None, reranker=None, use_query_cache: bool = True,
+                 max_batch: int = DEFAULT_MAX_BATCH, max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        self.embedding_type = embedding_type
+        self.vector_store = vector_store
+        self.retrieval = retrieval
+        self.hybrid_candidates = hybrid_candidates
+        self.reranker = reranker
+        self.use_query_cache = use_query_cache
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.passages = {}
+        self.section_passages = {}
+        self.version = None
+        self._stamp = None
+        self.ready = threading.Event()
+        self.error = None
+        self.stats = {"requests": 0, "comments": 0, "batches": 0, "largest_batch": 0}
+        self._stats_lock = threading.Lock()
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name=f"batcher-{embedding_type}", daemon=True).start()
+
+    def _open(self):
+        with timer("service_open"):
+            self._load()
+            # Load the model now rather than on the first request, past the embedding cache
+            backend = getattr(self.embedding_function, "embedding_function", self.embedding_function)
+            backend.embed_query("warm up")
+            if self.reranker is not None:
+                self.reranker._load()
+        # And run one search, so that the store's query path is warm too
+        self._search(["warm up"], 1, use_query_cache=False)
+
+    def _files(self) -> tuple:
+        """
+        Returns the name, size and modification time of every file of the collection's vector store
+        and BM25 index, which populate_database changes whenever it changes the collection.
+        """
+        from bm25_index import bm25_index_path
+        from query_data import CHROMA_PATH
+        from vector_index import VECTOR_INDEX_PATH
+
+        collection_name = f"my_collection_{self.embedding_type}"
+        store_path = (os.path.join(VECTOR_INDEX_PATH, collection_name) if self.vector_store == "numpy"
+                      else CHROMA_PATH)
+        files = []
+        for directory in (store_path, bm25_index_path(collection_name, self.vector_store)):
+            if os.path.isdir(directory):
+                for entry in os.scandir(directory):
+                    if entry.is_file():
+                        stat = entry.stat()
+                        files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+        return tuple(sorted(files))
+
+    def _load(self):
+        from query_cache import collection_version
+        from query_data import (open_vector_store, open_lexical_index, open_result_cache, chunks_per_section,
+                                DEFAULT_HYBRID_CANDIDATES)
+        from result_writer import passage_key, section_key
+
+        self._stamp = self._files()
+        self.db, self.embedding_function = open_vector_store(self.embedding_type, vector_store=self.vector_store)
+        if self.hybrid_candidates is None:
+            self.hybrid_candidates = DEFAULT_HYBRID_CANDIDATES
+        self.lexical_index = (open_lexical_index(self.embedding_type, self.vector_store)
+                              if self.retrieval == "hybrid" else None)
+        self.query_cache = (open_result_cache(self.db, self.embedding_type, self.vector_store, self.retrieval,
+                                              self.hybrid_candidates, reranker=self.reranker)
+                            if self.use_query_cache else None)
+        self.chunks_per_section = chunks_per_section(self.db)
+        items = self.db.get(include=["documents", "metadatas"])
+        passages = {passage_key(metadata): (document, metadata)
+                    for document, metadata in zip(items["documents"], items["metadatas"])}
+        section_passages = {}
+        for key, (_, metadata) in sorted(passages.items(), key=lambda item: item[1][1].get("chunk_index", 0)):
+            section_passages.setdefault(section_key(metadata), []).append(key)
+        # Replaced whole, so request threads reading them never see a half-built collection
+        self.passages, self.section_passages = passages, section_passages
+        self.version = self.query_cache.version if self.query_cache is not None else collection_version(self.db)
+
+    def _refresh(self):
+        if self._files() == self._stamp:
+            return
+        previous = self.version
+        with timer("service_reload"):
+            self._load()
+        if self.version != previous:
+            print(f"Reloaded {self.embedding_type} collection at version {self.version[:12]}")
+
+    def refresh(self):
+        """
+        Waits until the batcher has picked up any change populate_database made to the collection.
+        """
+        future = Future()
+        self._queue.put(([], 1, future))
+        future.result(REQUEST_TIMEOUT)
+
+    def section(self, section_id: str):
+        """
+        Returns the text, metadata and passage IDs of a section, its chunks joined back together,
+        or None if it isn't stored.
+        """
+        from section_chunker import join_chunks
+
+        keys = self.section_passages.get(section_id)
+        if keys is None:
+            return None
+        metadata = {name: value for name, value in self.passages[keys[0]][1].items()
+                    if name not in ("chunk_id", "chunk_index", "chunk_count", "content_hash")}
+        return {"id": section_id, "text": join_chunks([self.passages[key][0] for key in keys]), "metadata": metadata,
+                "passages": keys}
+
+    def _search(self, comments: list, k: int, use_query_cache: bool = True) -> list:
+        from query_data import search_batch
+        from result_writer import passage_key
+
+        def search(missing: list) -> list:
+            return search_batch(self.db, self.embedding_function, missing, k, self.lexical_index,
+                                self.hybrid_candidates, self.chunks_per_section, self.reranker)
+
+        if self.query_cache is None or not use_query_cache:
+            return search(comments)
+        return self.query_cache.search(comments, k, search, passage_key)
+
+    def _next_batch(self) -> list:
+        requests = [self._queue.get()]
+        size = len(requests[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            requests.append(request)
+            size += len(request[0])
+        return requests
+
+    def _run(self):
+        try:
+            self._open()
+        except Exception as error:
+            self.error = error
+        self.ready.set()
+        while True:
+            requests = self._next_batch()
+            if self.error is None:
+                try:
+                    self._refresh()
+                except Exception as error:
+                    # A half-written collection is picked up again once populate_database has finished
+                    for _, _, future in requests:
+                        future.set_exception(error)
+                    self._stamp = None
+                    continue
+            if self.error is not None:
+                for _, _, future in requests:
+                    future.set_exception(self.error)
+                continue
+            by_k = {}
+            for request in requests:
+                by_k.setdefault(request[1], []).append(request)
+            for k, group in by_k.items():
+                # Comments asked for by several requests are searched once
+                comments = list(dict.fromkeys(comment for request_comments, _, _ in group
+                                              for comment in request_comments))
+                try:
+                    results = {}
+                    for start in range(0, len(comments), self.max_batch):
+                        batch = comments[start:start + self.max_batch]
+                        with timer("service_batch", len(batch)):
+                            results.update(zip(batch, self._search(batch, k)))
+                        with self._stats_lock:
+                            self.stats["batches"] += 1
+                            self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+                except Exception as error:
+                    for _, _, future in group:
+                        future.set_exception(error)
+                    continue
+                for request_comments, _, future in group:
+                    future.set_result([results[comment] for comment in request_comments])
+
+    def search(self, comments: list, k: int) -> Future:
+        """
+        Queues comments for the next batch. The future resolves to one list of (Document, distance) per comment.
+        """
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["comments"] += len(comments)
+        future = Future()
+        self._queue.put((comments, k, future))
+        return future
+
+
+class RetrievalService:
+    """
+    The warm collections of every embedding type served, the first being the default.
+    """
+
+    def __init__(self, collections: list):
+        self.collections = {collection.embedding_type: collection for collection in collections}
+        self.default = collections[0].embedding_type
+        self.started = time.time()
+
+    def collection(self, embedding_type: str = None) -> WarmCollection:
+        embedding_type = embedding_type or self.default
+        if embedding_type not in self.collections:
+            raise LookupError(f"Embedding {embedding_type} is not served; start the service with --embedding {embedding_type}")
+        collection = self.collections[embedding_type]
+        if not collection.ready.wait(REQUEST_TIMEOUT):
+            raise TimeoutError(f"Collection for {embedding_type} is still opening")
+        if collection.error is not None:
+            raise RuntimeError(f"Collection for {embedding_type} failed to open: {collection.error}")
+        return collection
+
+    def health(self) -> dict:
+        collections = {
+            name: {"ready": collection.ready.is_set() and collection.error is None, "passages": len(collection.passages),
+                   "version": collection.version, "vector_store": collection.vector_store,
+                   "retrieval": collection.retrieval,
+                   "error": None if collection.error is None else str(collection.error)}
+            for name, collection in self.collections.items()
+        }
+        ready = all(collection["ready"] for collection in collections.values())
+        return {"status": "ok" if ready else "starting", "uptime_s": time.time() - self.started,
+                "collections": collections}
+
+    def metrics(self) -> dict:
+        collections = {}
+        for name, collection in self.collections.items():
+            with collection._stats_lock:
+                collections[name] = dict(collection.stats)
+        return {"stages": report(), "collections": collections}
+
+
+def match_json(doc, distance: float, include_text: bool) -> dict:
+    from result_writer import passage_key, score_type
+
+    match = {"id": passage_key(doc.metadata), "distance": float(distance), "similarity": 1 - float(distance),
+             "score_type": score_type(doc.metadata), "metadata": doc.metadata}
+    if include_text:
+        match["text"] = doc.page_content
+    return match
+
+
+class RetrievalRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # Headers and body are separate writes; over TCP the body would wait ~40ms for a delayed ACK
+        self.disable_nagle_algorithm = self.request.family != socket.AF_UNIX
+        super().setup()
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, respond):
+        start = time.perf_counter()
+        try:
+            status, payload = respond()
+        except (LookupError, ValueError, TypeError) as error:
+            status, payload = 400, {"error": str(error)}
+        except Exception as error:
+            status, payload = 503, {"error": str(error)}
+        self._reply(status, payload)
+        record(f"service_{self.command.lower()}", time.perf_counter() - start, 1)
+
+    def do_GET(self):
+        self._handle(self._get)
+
+    def do_POST(self):
+        self._handle(self._post)
+
+    def _get(self) -> tuple:
+        service = self.server.service
+        url = urlsplit(self.path)
+        if url.path == "/health":
+            health = service.health()
+            return (200 if health["status"] == "ok" else 503), health
+        if url.path == "/metrics":
+            return 200, service.metrics()
+        embedding_type = parse_qs(url.query).get("embedding", [None])[0]
+        if url.path.startswith("/sections/"):
+            section_id = unquote(url.path[len("/sections/"):])
+            collection = service.collection(embedding_type)
+            collection.refresh()
+            section = collection.section(section_id)
+            if section is None:
+                return 404, {"error": f"No section {section_id}"}
+            return 200, section
+        if url.path.startswith("/passages/"):
+            # Search results are passages: a whole section, or one chunk of it
+            passage_id = unquote(url.path[len("/passages/"):])
+            collection = service.collection(embedding_type)
+            collection.refresh()
+            passage = collection.passages.get(passage_id)
+            if passage is None:
+                return 404, {"error": f"No passage {passage_id}"}
+            return 200, {"id": passage_id, "text": passage[0], "metadata": passage[1]}
+        return 404, {"error": f"Unknown path {url.path}"}
+
+    def _post(self) -> tuple:
+        if urlsplit(self.path).path != "/search":
+            return 404, {"error": f"Unknown path {self.path}"}
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        single = "comment" in body
+        comments = [body["comment"]] if single else body.get("comments")
+        if not isinstance(comments, list) or not all(isinstance(comment, str) for comment in comments):
+            raise ValueError('Send {"comment": text} or {"comments": [text, ...]}')
+        k = int(body.get("k", 1))
+        if not 1 <= k <= MAX_K:
+            raise ValueError(f"k must be between 1 and {MAX_K}")
+        include_text = bool(body.get("include_text", True))
+        collection = self.server.service.collection(body.get("embedding"))
+        results = collection.search(comments, k).result(REQUEST_TIMEOUT) if comments else []
+        matches = [[match_json(doc, distance, include_text) for doc, distance in result] for result in results]
+        return 200, ({"matches": matches[0]} if single else {"results": matches})
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+
+class ThreadingTCPHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def make_server(service: RetrievalService, host: str = "127.0.0.1", port: int = DEFAULT_PORT, unix_socket: str = None):
+    """
+    Returns an HTTP server for service on host:port, or on the Unix socket path unix_socket.
+    """
+    if unix_socket:
+        server = ThreadingUnixHTTPServer(unix_socket, RetrievalRequestHandler)
+    else:
+        server = ThreadingTCPHTTPServer((host, port), RetrievalRequestHandler)
+    server.service = service
+    return server
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class RetrievalClient:
+    """
+    Client of a running retrieval service, at http://host:port or unix:///path/to/socket.
+    Each thread keeps its own keep-alive connection. Results come back as (Document, distance)
+    lists, like search_batch returns them.
+    """
+
+    def __init__(self, url: str, embedding_type: str = None, timeout: float = REQUEST_TIMEOUT):
+        self.url = url
+        self.embedding_type = embedding_type
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            url = urlsplit(self.url)
+            if url.scheme == "unix":
+                connection = _UnixHTTPConnection(url.path, self.timeout)
+            else:
+                connection = http.client.HTTPConnection(url.hostname, url.port or DEFAULT_PORT, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _request(self, method: str, path: str, payload: dict = None) -> dict:
+        body = None if payload is None else json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                data = json.loads(response.read())
+                break
+            except (ConnectionError, http.client.HTTPException):
+                # The service closed an idle keep-alive connection; reconnect once
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise RuntimeError(f"Retrieval service returned HTTP {response.status}: {data.get('error', data)}")
+        return data
+
+    def search(self, comments: list, k: int = 1) -> list:
+        """
+        Returns one list of (Document, distance) per comment, searched as one batched request.
+        """
+        from langchain_core.documents import Document
+
+        data = self._request("POST", "/search", {"comments": list(comments), "k": k, "embedding": self.embedding_type})
+        return [[(Document(page_content=match["text"], metadata=match["metadata"]), match["distance"])
+                 for match in matches] for matches in data["results"]]
+
+    def _get_by_id(self, kind: str, item_id: str) -> dict:
+        query = f"?embedding={quote(self.embedding_type)}" if self.embedding_type else ""
+        return self._request("GET", f"/{kind}/{quote(item_id, safe='')}{query}")
+
+    def section(self, section_id: str) -> dict:
+        """
+        Returns a whole section by its ID (source::section number), chunks joined in order.
+        """
+        return self._get_by_id("sections", section_id)
+
+    def passage(self, passage_id: str) -> dict:
+        """
+        Returns one stored passage by the ID a search result carries (a chunk ends in #index).
+        """
+        return self._get_by_id("passages", passage_id)
+
+    def health(self) -> dict:
+        return self._request("GET", "/health")
+
+    def metrics(self) -> dict:
+        return self._request("GET", "/metrics")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve section search with warm embedding models and collections.")
+    parser.add_argument("--embedding", type=str, nargs="+", default=["ollama_nomic"], choices=EMBEDDING_TYPES,
+                        help="Embedding types whose collections are served; the first is the default.")
+    parser.add_argument("--vector_store", type=str, default="chroma", choices=["chroma", "numpy"])
+    parser.add_argument("--retrieval", type=str, default="dense", choices=["dense", "hybrid"])
+    parser.add_argument("--hybrid_candidates", type=int, default=None,
+                        help="Number of dense and of BM25 candidates fused per comment with --retrieval hybrid.")
+    parser.add_argument("--rerank", action="store_true", help="Rerank candidates with a warm cross-encoder.")
+    parser.add_argument("--no_query_cache", action="store_true",
+                        help="Search every comment again instead of reusing cached results.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix_socket", type=str, default=None, help="Listen on this Unix socket instead of TCP.")
+    parser.add_argument("--max_batch", type=int, default=DEFAULT_MAX_BATCH,
+                        help="Most comments searched with one embedding call.")
+    parser.add_argument("--max_wait_ms", type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="How long a request waits for others to share its batch.")
+    args = parser.parse_args()
+
+    collections = []
+    for embedding_type in args.embedding:
+        reranker = None
+        if args.rerank:
+            from reranker import CrossEncoderReranker
+            reranker = CrossEncoderReranker()
+        collections.append(WarmCollection(embedding_type, args.vector_store, args.retrieval, args.hybrid_candidates,
+                                          reranker, not args.no_query_cache, args.max_batch, args.max_wait_ms))
+    service = RetrievalService(collections)
+    server = make_server(service, args.host, args.port, args.unix_socket)
+    for collection in collections:
+        collection.ready.wait()
+        if collection.error is not None:
+            print(f"Could not open {collection.embedding_type}: {collection.error}")
+    print(f"Serving {', '.join(args.embedding)} on "
+          f"{'unix://' + args.unix_socket if args.unix_socket else f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import hashlib
+import re
+
+# Share of the model's max length a chunk may fill, leaving room for special tokens, query
+# instructions and the error of estimate_tokens
+TOKEN_BUDGET_FRACTION = 0.9
+DEFAULT_OVERLAP_FRACTION = 0.15
+# A sentence ends at . ! or ? followed by something that starts a new one, and a list item at a line break
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])|\s*\n(?=\s*(?:[•\-–*]|\d+[.)]|[a-z][.)])\s)")
+TOKEN_PIECE = re.compile(r"\w+|[^\w\s]")
+WORD = re.compile(r"\S+")
+# Subword tokenizers split long and rare words; count one extra token per this many characters
+CHARACTERS_PER_EXTRA_TOKEN = 6
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximates how many WordPiece/BPE tokens text has without loading a tokenizer. Every
+    punctuation mark and every word is a token, and long words count extra. It errs on the
+    high side for plain English so chunks stay within the model's limit.
+    """
+    return sum(1 + (len(piece) - 1) // CHARACTERS_PER_EXTRA_TOKEN for piece in TOKEN_PIECE.findall(text))
+
+
+def chunk_budget(embedding_type: str, max_tokens: int = None) -> int:
+    """
+    Returns the estimated tokens a chunk may hold for embedding_type, optionally capped at max_tokens.
+    """
+    from get_embedding_function import EMBEDDING_MAX_TOKENS
+
+    budget = int(EMBEDDING_MAX_TOKENS[embedding_type] * TOKEN_BUDGET_FRACTION)
+    return min(budget, max_tokens) if max_tokens else budget
+
+
+def _sentence_spans(text: str) -> list:
+    spans = []
+    start = 0
+    for boundary in SENTENCE_BOUNDARY.finditer(text):
+        if text[start:boundary.start()].strip():
+            spans.append((start, boundary.start()))
+        start = boundary.end()
+    if text[start:].strip():
+        spans.append((start, len(text)))
+    return spans
+
+
+def _units(text: str, max_tokens: int) -> list:
+    """
+    Returns (start, end, tokens) for every sentence of text. Sentences longer than max_tokens
+    are cut into runs of whole words.
+    """
+    units = []
+    for start, end in _sentence_spans(text):
+        tokens = estimate_tokens(text[start:end])
+        if tokens <= max_tokens:
+            units.append((start, end, tokens))
+            continue
+        run_start = run_end = None
+        run_tokens = 0
+        for word in WORD.finditer(text, start, end):
+            word_tokens = estimate_tokens(word.group())
+            if run_start is not None and run_tokens + word_tokens > max_tokens:
+                units.append((run_start, run_end, run_tokens))
+                run_start = None
+                run_tokens = 0
+            if run_start is None:
+                run_start = word.start()
+            run_end = word.end()
+            run_tokens += word_tokens
+        if run_start is not None:
+            units.append((run_start, run_end, run_tokens))
+    return units
+
+
+def chunk_text(text: str, max_tokens: int, overlap_tokens: int = None) -> list:
+    """
+    Splits text into chunks of whole sentences of at most max_tokens estimated tokens. Each chunk
+    repeats the last sentences of the one before, up to overlap_tokens (default 15% of
+    max_tokens), so a passage cut at a boundary is still whole in one of them. Chunks are
+    slices of text, so line breaks are kept. Text that fits is returned as a single chunk.
+    """
+    if overlap_tokens is None:
+        overlap_tokens = int(max_tokens * DEFAULT_OVERLAP_FRACTION)
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    units = _units(text, max_tokens)
+    chunks = []
+    first = 0
+    while first < len(units):
+        last = first
+        tokens = 0
+        while last < len(units) and (last == first or tokens + units[last][2] <= max_tokens):
+            tokens += units[last][2]
+            last += 1
+        chunks.append(text[units[first][0]:units[last - 1][1]])
+        if last == len(units):
+            break
+        # Step back over the trailing sentences that fit in the overlap, always leaving room for
+        # the next new sentence so every chunk moves forward
+        next_first = last
+        overlap = 0
+        while (next_first - 1 > first and overlap + units[next_first - 1][2] <= overlap_tokens
+               and overlap + units[next_first - 1][2] + units[last][2] <= max_tokens):
+            next_first -= 1
+            overlap += units[next_first][2]
+        first = next_first
+    return chunks
+
+
+def chunk_section(doc_id: str, text: str, metadata: dict, max_tokens: int, overlap_tokens: int = None) -> list:
+    """
+    Returns (chunk id, text, metadata) for every chunk of a section. Each chunk keeps the
+    section's metadata (section_number, page, source, ...) and adds its chunk_id, chunk_index and
+    chunk_count; its content_hash covers the section's hash and the chunk's text.
+    """
+    chunks = chunk_text(text, max_tokens, overlap_tokens)
+    result = []
+    for index, chunk in enumerate(chunks):
+        chunk_id = f"{doc_id}#{index}"
+        content = f"{metadata.get('content_hash', '')}\0{chunk}"
+        result.append((chunk_id, chunk, dict(
+            metadata,
+            chunk_id=chunk_id,
+            chunk_index=index,
+            chunk_count=len(chunks),
+            content_hash=hashlib.sha256(content.encode("utf-8")).hexdigest()
+        )))
+    return result
+
+
+def join_chunks(chunks: list) -> str:
+    """
+    Rebuilds a section's text from its chunks, in chunk_index order, dropping the sentences
+    each chunk repeats from the one before. An overlap starts after whitespace, like the
+    sentences it is made of; chunks that don't overlap are joined by a space.
+    """
+    text = chunks[0] if chunks else ""
+    for chunk in chunks[1:]:
+        previous = text[-len(chunk):]
+        overlap = next((len(previous) - start for start in range(1, len(previous))
+                        if previous[start - 1].isspace() and chunk.startswith(previous[start:])), 0)
+        text += chunk[overlap:] if overlap else f" {chunk}"
+    return text
+
+
+def is_chunk_id(doc_id: str) -> bool:
+    return doc_id.rpartition("#")[2].isdigit()
+
+
+def check_chunk_layout(existing_ids, chunked: bool, collection_name: str):
+    """
+    Raises ValueError when a collection holds whole sections and chunked documents are about to
+    be added to it, or the other way round. Writers that only add unseen IDs would otherwise keep
+    both copies of every section; --sync or --reset replaces the old layout instead.
+    """
+    stored = {is_chunk_id(doc_id) for doc_id in existing_ids}
+    if stored and stored != {chunked}:
+        layout = "chunks" if True in stored else "whole sections"
+        wanted = "chunks" if chunked else "whole sections"
+        raise ValueError(f"{collection_name} stores {layout}, not {wanted}; run with --sync or --reset to rebuild "
+                         f"it{'' if chunked else ', or drop --no_chunking'}")
+
+
+def chunk_documents(documents: list, max_tokens: int, overlap_tokens: int = None) -> list:
+    """
+    Splits section Documents into chunk Documents of at most max_tokens estimated tokens.
+    """
+    from langchain_core.documents import Document
+
+    chunks = []
+    for doc in documents:
+        for _, text, metadata in chunk_section(doc.metadata["section_number"], doc.page_content, doc.metadata,
+                                               max_tokens, overlap_tokens):
+            chunks.append(Document(page_content=text, metadata=metadata))
+    return chunks
+
+
+def aggregate_sections(results: list, k: int, key) -> list:
+    """
+    Reduces a ranked list of (Document, distance) chunk hits, best first, to the best hit of
+    each of the first k sections. key(metadata) names a hit's section.
+    """
+    seen = set()
+    sections = []
+    for doc, distance in results:
+        section = key(doc.metadata)
+        if section in seen:
+            continue
+        seen.add(section)
+        sections.append((doc, distance))
+        if len(sections) == k:
+            break
+    return sections
@@ -0,0 +1,338 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter
+import fitz  # PyMuPDF, install with pip install pymupdf
+from pdf_splitter_test import iter_page_lines, iter_sections, parse_toc, _page_lines
+from instrumentation import timer, print_report
+
+SECTION_CACHE_PATH = "section_cache"
+# Bumped whenever the layout of the intermediate files changes
+FORMAT_VERSION = 1
+# Lines set this much larger than the body text are headings for the font extractor
+HEADING_SIZE_RATIO = 1.2
+# Longer lines are text set in a large font rather than headings
+MAX_HEADING_WORDS = 12
+# Pages the font extractor reads to learn the body text size before it starts yielding sections
+FONT_SAMPLE_PAGES = 20
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def _join_lines(section_lines: list) -> str:
+    return "\n".join(line_text for line_text in section_lines if line_text.strip()).strip()
+
+
+def iter_toc_sections(pdf_path: str, workers: int = None):
+    """
+    Sections from the printed table of contents on pages 2-6 (0-based), as extract_sections finds them.
+    """
+    yield from iter_sections(pdf_path, workers)
+
+
+def outline_numbers(levels: list) -> list:
+    """
+    Numbers outline entries from their nesting levels: 1., 1.1., 1.2., 2., ...
+    """
+    counters = []
+    numbers = []
+    for level in levels:
+        counters = counters[:level] + [0] * (level - len(counters))
+        counters[level - 1] += 1
+        numbers.append("".join(f"{counter}." for counter in counters))
+    return numbers
+
+
+def iter_outline_sections(pdf_path: str, workers: int = None):
+    """
+    Sections from the PDF's outline (bookmarks), numbered by their nesting level.
+
+    A section runs from the line holding its bookmark's title (or the top of the bookmarked
+    page when no line does) to where the next bookmark's section starts. Pages are streamed
+    like iter_sections does, keeping only those from the current section's page on.
+    """
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+        outline = [(level, title.strip(), page) for level, title, page in doc.get_toc() if 1 <= page <= page_count]
+        if not outline:
+            print(f"No outline found in {pdf_path}.")
+            return
+        numbers = outline_numbers([level for level, _, _ in outline])
+
+        pages = {}
+        page_stream = iter_page_lines(pdf_path, page_count, workers)
+        next_unread = 0
+
+        def page_lines(p: int) -> list:
+            nonlocal next_unread
+            while next_unread <= p:
+                pages[next_unread] = next(page_stream)
+                next_unread += 1
+            if p not in pages:
+                # Only when the outline goes back to a page that was already dropped
+                pages[p] = _page_lines(doc[p])
+            return pages[p]
+
+        def locate(title: str, p: int, after: int = -1) -> tuple:
+            # The (page, line) of the first line after `after` holding title, or the top of the page
+            wanted = _normalize(title)
+            for line_index, (line_text, _) in enumerate(page_lines(p)):
+                if line_index > after and wanted and wanted in _normalize(line_text):
+                    return p, line_index
+            return p, None
+
+        try:
+            heading = locate(outline[0][1], outline[0][2] - 1)
+            for i, (level, title, page) in enumerate(outline):
+                for p in [p for p in pages if p < heading[0]]:
+                    del pages[p]
+                start = (heading[0], 0 if heading[1] is None else heading[1] + 1)
+                if i + 1 < len(outline):
+                    next_title, next_page = outline[i + 1][1:]
+                    after = heading[1] if next_page - 1 == heading[0] and heading[1] is not None else -1
+                    heading = locate(next_title, next_page - 1, after)
+                    end = (heading[0], heading[1] or 0)
+                else:
+                    end = (page_count, 0)
+                if end <= start:
+                    # The next bookmark points back into this section: keep the rest of its page
+                    end = (start[0] + 1, 0)
+
+                section_lines = []
+                for p in range(start[0], min(end[0] + 1, page_count)):
+                    lines = page_lines(p)
+                    section_lines.extend(line_text for line_text, _ in
+                                         lines[start[1] if p == start[0] else 0:end[1] if p == end[0] else None])
+                yield {
+                    "section_number": numbers[i],
+                    "title": title,
+                    "page": page,
+                    "end_page": max(start[0], end[0] - 1 if end[1] == 0 else end[0]) + 1,
+                    "text": _join_lines(section_lines)
+                }
+        finally:
+            page_stream.close()
+
+
+def body_font_size(pages: list) -> float:
+    """
+    The font size set in the most characters across pages of (line_text, font_size) pairs.
+    """
+    sizes = Counter()
+    for page_lines in pages:
+        for line_text, font_size in page_lines:
+            sizes[round(font_size, 1)] += len(line_text)
+    return sizes.most_common(1)[0][0] if sizes else 0.0
+
+
+def is_heading(line_text: str, font_size: float, heading_size: float) -> bool:
+    # Large decorative glyphs and page numbers aren't headings, and neither are long runs of large text
+    return (font_size >= heading_size and len(line_text.split()) <= MAX_HEADING_WORDS
+            and sum(character.isalpha() for character in line_text) >= 3)
+
+
+def iter_font_sections(pdf_path: str, workers: int = None):
+    """
+    Sections for PDFs with neither a printed table of contents nor an outline: every run of
+    lines set at least HEADING_SIZE_RATIO times larger than the body text starts a section,
+    numbered 1., 2., ... in reading order, unless another heading follows it. Text before the first heading (or of a document
+    without any) becomes one section per page, numbered 0.1, 0.2, ... like unnumbered TOC entries.
+    """
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    page_stream = iter_page_lines(pdf_path, page_count, workers)
+    try:
+        sample = [page_lines for _, page_lines in zip(range(FONT_SAMPLE_PAGES), page_stream)]
+        heading_size = body_font_size(sample) * HEADING_SIZE_RATIO
+
+        def all_pages():
+            yield from sample
+            yield from page_stream
+
+        section = None
+        numbered = 0
+        for p, page_lines in enumerate(all_pages()):
+            preface = []
+            for line_text, font_size in page_lines:
+                if not is_heading(line_text, font_size, heading_size):
+                    if section is None:
+                        preface.append(line_text)
+                    else:
+                        section["lines"].append(line_text)
+                        section["end_page"] = p + 1
+                    continue
+                if section is None:
+                    yield from _preface_section(preface, p + 1)
+                    preface = []
+                elif not section["lines"] and abs(font_size - section["size"]) < 0.5:
+                    # Headings set over several lines
+                    section["title"] += " " + line_text
+                    continue
+                elif _join_lines(section["lines"]):
+                    # A heading straight above another one, like a cover line, has no section of its own
+                    numbered += 1
+                    yield _font_section(section, numbered)
+                section = {"title": line_text, "size": font_size, "page": p + 1, "end_page": p + 1, "lines": []}
+            yield from _preface_section(preface, p + 1)
+        if section is not None and _join_lines(section["lines"]):
+            yield _font_section(section, numbered + 1)
+    finally:
+        page_stream.close()
+
+
+def _preface_section(preface: list, page: int):
+    if _join_lines(preface):
+        yield {"section_number": f"0.{page}", "title": f"Page {page}", "page": page, "end_page": page,
+               "text": _join_lines(preface)}
+
+
+def _font_section(section: dict, number: int) -> dict:
+    return {
+        "section_number": f"{number}.",
+        "title": section["title"],
+        "page": section["page"],
+        "end_page": section["end_page"],
+        "text": _join_lines(section["lines"])
+    }
+
+
+# Each extractor yields section dicts with section_number, title, page, end_page and text
+EXTRACTORS = {
+    "toc": iter_toc_sections,
+    "outline": iter_outline_sections,
+    "font": iter_font_sections,
+}
+# Bumped whenever an extractor's output changes, so intermediates written by the old code aren't reused
+EXTRACTOR_VERSIONS = {
+    "toc": 1,
+    "outline": 1,
+    "font": 1,
+}
+EXTRACTOR_NAMES = ["auto"] + list(EXTRACTORS)
+
+
+def register_extractor(name: str, function, version: int = 1):
+    """
+    Adds an extractor for a new document layout. function(pdf_path, workers=None) yields
+    section dicts; bump version whenever its output changes.
+    """
+    EXTRACTORS[name] = function
+    EXTRACTOR_VERSIONS[name] = version
+
+
+def detect_extractor(pdf_path: str) -> str:
+    """
+    The extractor "auto" resolves to: the printed table of contents if there is one, then the
+    outline, then the font heuristic.
+    """
+    with fitz.open(pdf_path) as doc:
+        if parse_toc(doc):
+            return "toc"
+        if any(page >= 1 for _, _, page in doc.get_toc()):
+            return "outline"
+    return "font"
+
+
+def extractor_key(extractor: str) -> str:
+    if extractor == "auto":
+        # What auto resolves to isn't known without opening the PDF, so it depends on every extractor
+        return "auto-" + "-".join(f"{name}{EXTRACTOR_VERSIONS[name]}" for name in sorted(EXTRACTORS))
+    return f"{extractor}-v{EXTRACTOR_VERSIONS[extractor]}"
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def section_cache_path(digest: str, extractor: str, cache_dir: str = SECTION_CACHE_PATH) -> str:
+    return os.path.join(cache_dir, f"{digest}.{extractor_key(extractor)}.v{FORMAT_VERSION}.jsonl.gz")
+
+
+def read_cached_sections(path: str):
+    """
+    Yields the sections of an intermediate file, or nothing but None when it was written in another format.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format_version") != FORMAT_VERSION:
+            yield None
+            return
+        for line in f:
+            yield json.loads(line)
+
+
+def iter_cached_sections(pdf_path: str, extractor: str = "auto", workers: int = None,
+                         cache_dir: str = SECTION_CACHE_PATH, use_cache: bool = True):
+    """
+    Yields the sections of pdf_path found by extractor ("auto" picks one with detect_extractor).
+
+    Sections are kept in a gzipped JSONL intermediate keyed by the PDF's SHA-256, the extractor
+    and its version: a header line, then one line per section with its page span and text. An
+    unchanged PDF is read back from it without being opened; otherwise the sections are written
+    as they stream past, and the file only replaces any old one once every section is in it.
+    """
+    if not use_cache:
+        yield from EXTRACTORS[detect_extractor(pdf_path) if extractor == "auto" else extractor](pdf_path, workers)
+        return
+
+    with timer("hash_pdf", 1, os.path.getsize(pdf_path)):
+        digest = file_digest(pdf_path)
+    path = section_cache_path(digest, extractor, cache_dir)
+    if os.path.exists(path):
+        with timer("read_section_cache") as measurement:
+            sections = list(read_cached_sections(path))
+            measurement.items = len(sections)
+        if None not in sections:
+            yield from sections
+            return
+
+    resolved = detect_extractor(pdf_path) if extractor == "auto" else extractor
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    os.close(fd)
+    try:
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"format_version": FORMAT_VERSION, "extractor": resolved,
+                                "extractor_version": EXTRACTOR_VERSIONS[resolved],
+                                "source": os.path.basename(pdf_path), "sha256": digest}) + "\n")
+            for section in EXTRACTORS[resolved](pdf_path, workers):
+                f.write(json.dumps(section) + "\n")
+                yield section
+        os.replace(temp_path, path)
+    finally:
+        # Left behind when the consumer stopped early or the extractor failed
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def load_sections(pdf_path: str, extractor: str = "auto", workers: int = None,
+                  cache_dir: str = SECTION_CACHE_PATH, use_cache: bool = True) -> list:
+    return list(iter_cached_sections(pdf_path, extractor, workers, cache_dir, use_cache))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract PDF sections with a pluggable extractor.")
+    parser.add_argument("--pdf_path", type=str, default="data/2024_Joint_Application_Information_Requirements.pdf")
+    parser.add_argument("--extractor", type=str, default="auto", choices=EXTRACTOR_NAMES)
+    parser.add_argument("--workers", type=int, default=None, help="Number of page parsing processes.")
+    parser.add_argument("--no_section_cache", action="store_true",
+                        help="Extract the sections again instead of reading the cached intermediate.")
+    args = parser.parse_args()
+
+    if args.extractor == "auto":
+        print(f"Extractor: {detect_extractor(args.pdf_path)}")
+    sections = load_sections(args.pdf_path, args.extractor, args.workers, use_cache=not args.no_section_cache)
+    for section in sections:
+        print(f"{section['section_number']:<8} {section['title'][:60]:<60} pages {section['page']}-{section['end_page']} "
+              f"({len(section['text'])} characters)")
+    print(f"length of sections: {len(sections)}")
+    print_report()
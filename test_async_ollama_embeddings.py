@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from async_ollama_embeddings import AsyncOllamaEmbeddings, OllamaHTTPError
+
+
+class StubOllama(ThreadingHTTPServer):
+    """
+    Mimics Ollama's /api/embed endpoint: every input is embedded as [len(text), position in batch].
+    """
+    daemon_threads = True
+
+    def __init__(self, failures: int = 0, delay: float = 0.0):
+        super().__init__(("127.0.0.1", 0), StubOllamaHandler)
+        self.failures = failures
+        self.delay = delay
+        self.batches = []
+        self.client_ports = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.client_ports.add(self.client_address[1])
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            fail = server.failures > 0
+            if fail:
+                server.failures -= 1
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+
+        if self.path != "/api/embed" or payload.get("model") == "missing":
+            self._reply(404, {"error": "model not found"})
+        elif fail:
+            self._reply(503, {"error": "busy"})
+        else:
+            with server.lock:
+                server.batches.append(payload["input"])
+            self._reply(200, {"model": payload["model"],
+                              "embeddings": [[float(len(text)), float(i)] for i, text in enumerate(payload["input"])]})
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def stub_server(request):
+    server = StubOllama(**getattr(request, "param", {}))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_embeddings(server, **kwargs):
+    return AsyncOllamaEmbeddings(model="nomic-embed-text", base_url=f"http://127.0.0.1:{server.server_port}",
+                                 backoff=0.01, **kwargs)
+
+
+def test_batches_keep_order_and_prefixes(stub_server):
+    embeddings = make_embeddings(stub_server, batch_size=3)
+    texts = [f"text {'x' * i}" for i in range(8)]
+    vectors = embeddings.embed_documents(texts)
+
+    assert [vector[0] for vector in vectors] == [float(len("passage: " + text)) for text in texts]
+    assert sorted(len(batch) for batch in stub_server.batches) == [2, 3, 3]
+    assert embeddings.embed_query("hello") == [float(len("query: hello")), 0.0]
+    embeddings.close()
+
+
+@pytest.mark.parametrize("stub_server", [{"delay": 0.05}], indirect=True)
+def test_bounds_in_flight_requests_and_reuses_connections(stub_server):
+    embeddings = make_embeddings(stub_server, batch_size=1, max_concurrency=2)
+    embeddings.embed_documents([str(i) for i in range(10)])
+    embeddings.embed_documents([str(i) for i in range(10)])
+
+    assert stub_server.max_in_flight == 2
+    assert len(stub_server.client_ports) == 2
+    embeddings.close()
+
+
+@pytest.mark.parametrize("stub_server", [{"failures": 2}], indirect=True)
+def test_retries_server_errors(stub_server):
+    embeddings = make_embeddings(stub_server, max_retries=3)
+    assert embeddings.embed_documents(["a"]) == [[float(len("passage: a")), 0.0]]
+    embeddings.close()
+
+
+def test_does_not_retry_client_errors(stub_server):
+    embeddings = AsyncOllamaEmbeddings(model="missing", base_url=f"http://127.0.0.1:{stub_server.server_port}")
+    with pytest.raises(OllamaHTTPError):
+        embeddings.embed_documents(["a"])
+    embeddings.close()
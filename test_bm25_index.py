@@ -0,0 +1,36 @@
+import numpy as np
+from bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+IDS = ["1.", "2.", "3."]
+DOCUMENTS = [
+    "Describe the caribou habitat within the project area.",
+    "Section 10.5.1 covers water quality monitoring and water sampling.",
+    "Noise and vibration effects on nearby residents.",
+]
+METADATAS = [{"section_number": doc_id} for doc_id in IDS]
+
+
+def test_tokenize_keeps_section_numbers():
+    assert tokenize("See 10.5.1. for the Water quality") == ["see", "10.5.1", "water", "quality"]
+
+
+def test_search_ranks_and_persists(tmp_path):
+    index = BM25Index.build(str(tmp_path / "bm25"), IDS, DOCUMENTS, METADATAS)
+    index.save()
+    loaded = BM25Index(str(tmp_path / "bm25"))
+    assert loaded.ids == IDS
+
+    rows, scores = loaded.search(["water sampling", "10.5.1", "caribou noise", "unrelated"], k=2)
+    assert rows[0, 0] == 1 and rows[1, 0] == 1
+    assert set(rows[2]) == {0, 2}
+    # No shared term: no match at all
+    assert list(rows[3]) == [-1, -1]
+    np.testing.assert_allclose(loaded.scores(["water sampling"]), index.scores(["water sampling"]))
+
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    dense = [("a", 0.1), ("b", 0.2), ("c", 0.3)]
+    lexical = [("b", 9.0), ("c", 5.0)]
+    fused = reciprocal_rank_fusion([dense, lexical], k=2, key=lambda doc: doc)
+    assert [doc for doc, _ in fused] == ["b", "c"]
+    assert all(0 <= distance < 1 for _, distance in fused)
@@ -0,0 +1,79 @@
+import math
+import pandas as pd
+from comment_retriever.util import filter_comments
+
+COLUMNS = ["project", "comment_id", "round", "comment_text", "date_received"]
+NAN = float("nan")
+ROWS = [
+    ("A", "EAO-1", 1, "caribou", "2024-01-05"),
+    ("A", "EAO-1", 2, "caribou again", "2024-02-05"),
+    ("A", "Tahltan-1", 2, "water", "2024-02-10"),
+    ("A", "Tahltan-2", 3, NAN, "2024-03-01"),
+    ("B", "EAO-1", 2, "noise", "18/Dec/20"),
+    ("B", "Tahltan-3", 1, "dust", NAN),
+    ("B", "Tahltan-3", 3, "dust again", "2/19/18"),
+    (NAN, "EAO-9", 1, "orphan", "2024-01-01"),
+    ("C", "EAO-5", 4, "fish", "2024-04-01"),
+    ("C", NAN, 1, "anonymous", "2024-04-02"),
+]
+
+
+def comments_frame() -> pd.DataFrame:
+    return pd.DataFrame(ROWS, columns=COLUMNS)
+
+
+def test_without_filters_every_project_keeps_its_rows():
+    comments, times = filter_comments(comments_frame())
+    # Rows without a project are dropped
+    assert comments == {"A": ["caribou", "caribou again", "water"], "B": ["noise", "dust", "dust again"],
+                        "C": ["fish", "anonymous"]}
+    assert times["A"] == ["2024-01-05", "2024-02-05", "2024-02-10", "2024-03-01"]
+
+
+def test_round_exist_keeps_every_round_of_comments_in_that_round_of_the_same_project():
+    comments, times = filter_comments(comments_frame(), filter_by_round_exist="1", drop_date_na=True)
+    # B's EAO-1 is never in round 1 of B, even though A's EAO-1 is
+    assert comments == {"A": ["caribou", "caribou again"], "B": ["dust", "dust again"], "C": ["anonymous"]}
+    assert times == {"A": ["2024-01-05", "2024-02-05"], "B": ["2/19/18"], "C": ["2024-04-02"]}
+
+    comments, _ = filter_comments(comments_frame(), filter_by_round="2-4", filter_by_round_exist="1")
+    assert comments == {"A": ["caribou again"], "B": ["dust again"], "C": []}
+
+
+def test_round_range():
+    comments, times = filter_comments(comments_frame(), filter_by_round="2-3", drop_date_na=True)
+    assert comments == {"A": ["caribou again", "water"], "B": ["noise", "dust again"], "C": []}
+    assert times == {"A": ["2024-02-05", "2024-02-10", "2024-03-01"], "B": ["18/Dec/20", "2/19/18"], "C": []}
+
+    # An open range runs up to the last round
+    comments, _ = filter_comments(comments_frame(), filter_by_round="2-")
+    assert comments == {"A": ["caribou again", "water"], "B": ["noise", "dust again"], "C": ["fish"]}
+
+    comments, times = filter_comments(comments_frame(), filter_by_round="3", drop_text_na=False)
+    assert comments["B"] == ["dust again"] and comments["C"] == []
+    assert len(comments["A"]) == 1 and math.isnan(comments["A"][0])
+    assert times == {"A": ["2024-03-01"], "B": ["2/19/18"], "C": []}
+
+
+def test_team_filter():
+    comments, _ = filter_comments(comments_frame(), filter_by_team_name="TAHLTAN")
+    assert comments == {"A": ["water"], "B": ["dust", "dust again"], "C": []}
+
+    # Comments without a comment_id belong to no team
+    comments, _ = filter_comments(comments_frame(), filter_by_team_name="tahltan", filter_by_team_name_present=False)
+    assert comments == {"A": ["caribou", "caribou again"], "B": ["noise"], "C": ["fish", "anonymous"]}
+
+
+def test_empty_results():
+    assert filter_comments(comments_frame(), filter_by_team_name="nobody") == (
+        {"A": [], "B": [], "C": []}, {"A": [], "B": [], "C": []}
+    )
+    # Projects narrowed out of the frame beforehand still get an entry
+    df = comments_frame()
+    comments, times = filter_comments(df[df["project"] == "B"], filter_by_round="1", projects=["A", "B", "C"])
+    assert comments == {"A": [], "B": ["dust"], "C": []}
+    assert times["A"] == [] and len(times["B"]) == 1
+
+    empty = comments_frame().iloc[:0]
+    assert filter_comments(empty) == ({}, {})
+    assert filter_comments(empty, filter_by_round="2-", filter_by_round_exist="1", filter_by_team_name="eao") == ({}, {})
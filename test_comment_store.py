@@ -0,0 +1,93 @@
+import json
+import os
+import pandas as pd
+import pytest
+from benchmarks.process_comments import process_comments_legacy, same_results
+from comment_retriever.comment_store import ensure_comment_store, load_project_comments, read_comments, store_paths
+from comment_retriever.util import process_comments
+
+COMMENTS_CSV = """project,comment_id,round,comment_text,date_received
+A,EAO-1,1,caribou,2024-01-05 12:00:00 AM
+A,EAO-1,2,caribou again,2024-02-05 12:00:00 AM
+A,Tahltan-1,2,water,2024-02-10 12:00:00 AM
+A,Tahltan-2,3,,2024-03-01 12:00:00 AM
+B,EAO-1,2,noise,18/Dec/20
+B,Tahltan-3,1,dust,
+B,Tahltan-3,3,dust again,2/19/18
+,EAO-9,1,orphan,2024-01-01 12:00:00 AM
+C,EAO-5,4,fish,2024-04-01 12:00:00 AM
+C,,1,anonymous,2024-04-02 12:00:00 AM
+"""
+FILTERS = [
+    dict(),
+    dict(filter_by_round="1"),
+    dict(filter_by_round="3", drop_text_na=False),
+    dict(filter_by_round="2-3", drop_date_na=True),
+    dict(filter_by_round="2-"),
+    dict(filter_by_round_exist="1"),
+    dict(filter_by_round="2-4", filter_by_round_exist="1"),
+    dict(filter_by_team_name="TAHLTAN"),
+    dict(filter_by_team_name="tahltan", filter_by_team_name_present=False, drop_text_na=False),
+    dict(filter_by_round="2-", filter_by_team_name="eao"),
+    dict(filter_by_team_name="nobody"),
+]
+
+
+@pytest.fixture
+def comments_csv(tmp_path):
+    path = str(tmp_path / "comments.csv")
+    with open(path, "w") as f:
+        f.write(COMMENTS_CSV)
+    return path
+
+
+@pytest.mark.parametrize("filters", FILTERS, ids=lambda filters: ",".join(f"{k}={v}" for k, v in filters.items()))
+def test_store_matches_the_csv_read(comments_csv, filters):
+    legacy = process_comments_legacy(comments_csv, **filters)
+    assert list(legacy[0]) == ["A", "B", "C"]
+    assert same_results(legacy, process_comments(comments_csv, **filters))
+    assert same_results(legacy, load_project_comments(comments_csv, **filters))
+
+
+def test_filters_are_pushed_down_to_the_store(comments_csv):
+    df, projects = read_comments(comments_csv, filter_by_round="2-3", filter_by_team_name="tahltan")
+    assert projects == ["A", "B", "C"]
+    assert list(df["comment_id"]) == ["Tahltan-1", "Tahltan-2", "Tahltan-3"]
+    # Rows without a comment_id are on no team, so excluding a team keeps them
+    df, _ = read_comments(comments_csv, filter_by_team_name="tahltan", filter_by_team_name_present=False)
+    assert df["comment_id"].isna().sum() == 1 and len(df) == 6
+    # The round-exist filter needs every round of a comment, so the round filter isn't pushed down with it
+    df, _ = read_comments(comments_csv, filter_by_round="2", filter_by_round_exist="1")
+    assert len(df) == 10
+
+
+def test_parsed_dates(comments_csv):
+    _, times = load_project_comments(comments_csv, parsed_dates=True)
+    assert times["B"] == [pd.Timestamp("2020-12-18"), pd.Timestamp("2018-02-19")]
+    assert times["A"][0] == pd.Timestamp("2024-01-05")
+
+
+def test_store_is_rebuilt_when_the_csv_changes(comments_csv):
+    store_path, meta_path = store_paths(comments_csv)
+    ensure_comment_store(comments_csv)
+    built = os.stat(store_path).st_mtime_ns
+
+    # Touched without an edit: the store is kept and the new mtime remembered
+    csv_mtime = os.stat(comments_csv).st_mtime_ns + 10 ** 9
+    os.utime(comments_csv, ns=(csv_mtime, csv_mtime))
+    assert ensure_comment_store(comments_csv)["mtime_ns"] == csv_mtime
+    assert os.stat(store_path).st_mtime_ns == built
+
+    # Edited in place to the same size: only the hash tells the CSVs apart
+    with open(comments_csv, "w") as f:
+        f.write(COMMENTS_CSV.replace("fish", "fist"))
+    os.utime(comments_csv, ns=(csv_mtime + 10 ** 9, csv_mtime + 10 ** 9))
+    comments, _ = load_project_comments(comments_csv, filter_by_round="4")
+    assert comments == {"A": [], "B": [], "C": ["fist"]}
+
+    with open(comments_csv, "a") as f:
+        f.write("D,EAO-7,1,moose,2024-05-01 12:00:00 AM\n")
+    comments, _ = load_project_comments(comments_csv, filter_by_round="1")
+    assert comments == {"A": ["caribou"], "B": ["dust"], "C": ["anonymous"], "D": ["moose"]}
+    with open(meta_path) as f:
+        assert json.load(f)["projects"] == ["A", "B", "C", "D"]
@@ -0,0 +1,47 @@
+import embedding_cache
+from embedding_cache import CachedEmbeddings
+from hash_embeddings import HashEmbeddings
+
+
+class SlowBackend(HashEmbeddings):
+    """
+    Runs during_embed() in the middle of every backend call, standing in for a slow model.
+    """
+
+    def __init__(self, during_embed=None):
+        super().__init__(dims=8)
+        self.during_embed = during_embed
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        if self.during_embed is not None:
+            self.during_embed()
+        return super().embed_documents(texts)
+
+
+def test_hits_skip_the_backend(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    backend = SlowBackend()
+    first = CachedEmbeddings(backend, "hash", path).embed_documents(["water quality", "noise"])
+    cache = CachedEmbeddings(backend, "hash", path)
+    dust = HashEmbeddings(dims=8).embed_query("dust")
+    assert cache.embed_documents(["noise ", "dust", "water quality"]) == [first[1], dust, first[0]]
+    assert backend.embedded == ["water quality", "noise", "dust"]
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_other_instance_can_write_during_a_backend_call(tmp_path, monkeypatch):
+    # Without a lock held across the backend call, the other writer never has to wait
+    monkeypatch.setattr(embedding_cache, "SQLITE_TIMEOUT", 0.2)
+    path = str(tmp_path / "embeddings.sqlite")
+    CachedEmbeddings(SlowBackend(), "hash", path).embed_documents(["water quality"])
+
+    other = CachedEmbeddings(SlowBackend(), "hash", path)
+    written = []
+    backend = SlowBackend(lambda: written.append(other.embed_documents(["caribou range"])))
+    # A partial hit touches last_used before the backend is called for the miss
+    cache = CachedEmbeddings(backend, "hash", path)
+    cache.embed_documents(["water quality", "noise"])
+    assert backend.embedded == ["noise"] and len(written) == 1
+    assert CachedEmbeddings(SlowBackend(), "hash", path).embed_documents(["caribou range"]) == written[0]
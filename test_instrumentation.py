@@ -0,0 +1,35 @@
+import instrumentation
+from instrumentation import instrumented, timer, report, drain, merge, record
+
+
+def test_stages_report_counts_and_percentiles():
+    drain()
+    for milliseconds in range(1, 101):
+        record("search", milliseconds / 1000, items=2, nbytes=10)
+    with timer("embed", items=5) as measurement:
+        measurement.nbytes = 50
+
+    @instrumented("extract", items=len)
+    def extract():
+        return [1, 2, 3]
+
+    extract()
+    summary = report()
+    assert summary["search"]["count"] == 100
+    assert summary["search"]["items"] == 200
+    assert round(summary["search"]["p50_ms"]) == 51
+    assert round(summary["search"]["p95_ms"]) == 96
+    assert summary["embed"]["bytes"] == 50
+    assert summary["extract"]["items"] == 3
+    drain()
+
+
+def test_drain_and_merge_move_measurements():
+    drain()
+    record("plots", 0.5, items=2)
+    worker_stages = drain()
+    assert report() == {}
+    merge(worker_stages)
+    merge(worker_stages)
+    assert instrumentation.report()["plots"]["count"] == 2
+    drain()
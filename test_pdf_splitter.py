@@ -0,0 +1,51 @@
+from benchmarks.synthetic import synthetic_sections, write_synthetic_pdf
+from pdf_splitter_test import HeadingIndex, extract_sections, iter_sections
+
+
+def test_iter_sections_streams_every_section(tmp_path):
+    sections = synthetic_sections(12, 80)
+    pdf_path = str(tmp_path / "guidebook.pdf")
+    write_synthetic_pdf(pdf_path, sections)
+
+    stream = iter_sections(pdf_path, workers=1)
+    first = next(stream)
+    assert first["section_number"] == sections[0][0] and first["title"] == sections[0][1]
+    extracted = [first] + list(stream)
+    assert [section["section_number"] for section in extracted] == [number for number, _, _ in sections]
+    for section, (_, _, sentences) in zip(extracted, sections):
+        # Sections span several pages and stop before the next heading
+        assert section["text"].startswith(sentences[0].split()[0])
+        assert section["text"].split()[-1] == sentences[-1].split()[-1]
+    assert extract_sections(pdf_path, workers=2) == extracted
+
+
+def test_heading_index_matches_substrings():
+    index = HeadingIndex(["1.", "1.1.", "Water", "Water Quality", "ter Q"])
+    index.add_page(4, [("1.1. Water Quality", 14.0), ("Water quality is body text", 10.0), ("11. Waterfalls", 13.0)])
+    for pattern in index.patterns:
+        assert index.positions[index.pattern_ids[pattern]] == \
+            [(4, line) for line, text in [(0, "1.1. Water Quality"), (2, "11. Waterfalls")] if pattern in text]
+    assert index.first(["Water Quality", "1.1."], (4, 1)) is None
+    assert index.first(["Water", "ter Q"], (4, 1)) == (4, 2)
+
+
+def test_missing_heading_is_diagnosed(tmp_path):
+    import fitz
+
+    sections = synthetic_sections(6, 20)
+    pdf_path = str(tmp_path / "guidebook.pdf")
+    write_synthetic_pdf(pdf_path, sections)
+    # Remove the heading of the fourth section
+    number, title, _ = sections[3]
+    with fitz.open(pdf_path) as doc:
+        for page in doc.pages(7):
+            for rect in page.search_for(f"{number} {title}"):
+                page.add_redact_annot(rect)
+            page.apply_redactions()
+        doc.save(str(tmp_path / "redacted.pdf"))
+
+    diagnostics = []
+    extracted = extract_sections(str(tmp_path / "redacted.pdf"), workers=1, diagnostics=diagnostics)
+    assert [section["section_number"] for section in extracted] == [number for number, _, _ in sections[:3] + sections[4:]]
+    assert [(d["section_number"], d["missing"]) for d in diagnostics] == [(number, "end of " + sections[2][0]),
+                                                                          (number, "start")]
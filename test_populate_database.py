@@ -0,0 +1,95 @@
+import hashlib
+import os
+import sys
+import threading
+import pytest
+from langchain_core.documents import Document
+import embedding_cache
+import get_embedding_function
+import populate_database
+from hash_embeddings import HashEmbeddings
+from populate_database import add_to_chroma, clear_database, populate_backends, prepare_documents, sync_vector_index
+from vector_index import NumpyVectorStore, VECTOR_INDEX_PATH
+
+SECTIONS = {
+    "1.": "Caribou calving grounds are protected from road construction.",
+    "2.": "Water quality is monitored downstream of the tailings facility.",
+    "3.": "Noise from blasting is limited to daytime hours.",
+    "4.": "Dust from haul roads is suppressed with water trucks.",
+}
+
+
+class MeetingHashEmbeddings(HashEmbeddings):
+    """
+    With a barrier set, every backend call waits until the other lane is in its backend call
+    too, so each lane's cache lookup happens while the other lane is embedding.
+    """
+    barrier = None
+
+    def embed_documents(self, texts):
+        if self.barrier is not None:
+            self.barrier.wait()
+        return super().embed_documents(texts)
+
+
+def documents(numbers: list) -> list:
+    return [Document(page_content=SECTIONS[number], metadata={
+        "source": "guide.pdf", "section_number": number, "page": 1,
+        "content_hash": hashlib.sha256(SECTIONS[number].encode("utf-8")).hexdigest()
+    }) for number in numbers]
+
+
+def test_backends_populate_concurrently_from_a_warm_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(get_embedding_function, "_instances", {})
+    for embedding_type, kind in (("hash_a", "local_a"), ("hash_b", "local_b")):
+        monkeypatch.setitem(get_embedding_function.EMBEDDING_BACKENDS, embedding_type, MeetingHashEmbeddings)
+        monkeypatch.setitem(get_embedding_function.EMBEDDING_BACKEND_KINDS, embedding_type, kind)
+
+    # Half of the sections are in the embedding cache, so both lanes get partial hits
+    for embedding_type in ("hash_a", "hash_b"):
+        embedding_cache.get_cached_embedding_function(embedding_type).embed_documents([SECTIONS["1."], SECTIONS["2."]])
+    # A write transaction held across one lane's backend call would lock the other lane out of the cache
+    monkeypatch.setattr(MeetingHashEmbeddings, "barrier", threading.Barrier(2, timeout=embedding_cache.SQLITE_TIMEOUT))
+    report = populate_backends(documents(list(SECTIONS)), ["hash_a", "hash_b"])
+    assert {embedding_type: outcome for embedding_type, (_, outcome) in report.items()} == {
+        "hash_a": "4 added", "hash_b": "4 added"
+    }
+
+
+def test_reset_removes_the_vector_index(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sync_vector_index(documents(list(SECTIONS)), "hash", ivf_lists=2)
+    index_dir = os.path.join(VECTOR_INDEX_PATH, "my_collection_hash")
+    assert os.path.exists(os.path.join(index_dir, "settings.json"))
+    clear_database("hash")
+    assert not os.path.exists(index_dir)
+
+
+def test_reset_deletes_the_chroma_collection(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert add_to_chroma(documents(list(SECTIONS)), "hash") == 4
+    chunks = prepare_documents(documents(list(SECTIONS)), "hash", chunking=True)
+    with pytest.raises(ValueError, match="--reset"):
+        add_to_chroma(chunks, "hash")
+    clear_database("hash")
+    assert add_to_chroma(chunks, "hash") == len(chunks)
+
+
+def test_reset_switches_a_codes_only_index_to_a_new_codec(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(populate_database, "load_documents", lambda *args, **kwargs: documents(list(SECTIONS)))
+
+    def populate(*flags):
+        monkeypatch.setattr(sys, "argv", ["populate_database.py", "--embedding", "hash", "--vector_store", "numpy",
+                                          "--no_chunking", *flags])
+        populate_database.main()
+
+    populate("--quantization", "int8", "--ivf_lists", "2")
+    # The int8 codes can't be turned into binary ones without the full-precision vectors
+    with pytest.raises(ValueError, match="--reset"):
+        populate("--quantization", "binary")
+    populate("--reset", "--quantization", "binary")
+    store = NumpyVectorStore(os.path.join(VECTOR_INDEX_PATH, "my_collection_hash"))
+    assert (store.quantization, len(store), store.codes.dtype.name) == ("binary", 4, "uint8")
+    assert store.centroids is None
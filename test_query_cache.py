@@ -0,0 +1,101 @@
+from langchain_core.documents import Document
+from query_cache import QueryResultCache, collection_version, invalidate_collection
+
+
+class FakeStore:
+    def __init__(self, hashes: dict):
+        self.hashes = hashes
+
+    def get(self, include=None) -> dict:
+        return {"ids": list(self.hashes), "metadatas": [{"content_hash": h} for h in self.hashes.values()]}
+
+
+def fake_search(searched: list):
+    def search(comments: list) -> list:
+        searched.extend(comments)
+        return [[(Document(page_content=f"text of {comment}", metadata={"section_number": comment}), 0.25)]
+                for comment in comments]
+    return search
+
+
+def section_key(metadata: dict) -> str:
+    return metadata["section_number"]
+
+
+def open_cache(tmp_path, store, max_entries: int = 100) -> QueryResultCache:
+    return QueryResultCache("my_collection_test", collection_version(store), "test",
+                            path=str(tmp_path / "results.sqlite"), max_entries=max_entries)
+
+
+def test_hits_only_search_new_comments(tmp_path):
+    store = FakeStore({"1.": "a", "2.": "b"})
+    searched = []
+    results = open_cache(tmp_path, store).search(["water", "noise"], 1, fake_search(searched), section_key)
+    assert searched == ["water", "noise"]
+
+    cache = open_cache(tmp_path, store)
+    searched.clear()
+    # Normalized text ("noise " == "noise") hits the cache
+    again = cache.search(["noise ", "water", "dust"], 1, fake_search(searched), section_key)
+    assert searched == ["dust"]
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert again[1][0][0].page_content == results[0][0][0].page_content
+    assert again[1][0][1] == 0.25
+
+
+def test_new_collection_version_invalidates(tmp_path):
+    searched = []
+    open_cache(tmp_path, FakeStore({"1.": "a"})).search(["water"], 1, fake_search(searched), section_key)
+    open_cache(tmp_path, FakeStore({"1.": "changed"})).search(["water"], 1, fake_search(searched), section_key)
+    assert searched == ["water", "water"]
+
+    invalidate_collection("my_collection_test", path=str(tmp_path / "results.sqlite"))
+    cache = open_cache(tmp_path, FakeStore({"1.": "changed"}))
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_bound(tmp_path):
+    store = FakeStore({"1.": "a"})
+    cache = open_cache(tmp_path, store, max_entries=10)
+    cache.search([f"comment {i}" for i in range(25)], 1, fake_search([]), section_key)
+    assert cache.stats()["entries"] <= 10
+
+
+def test_score_type_is_kept_per_match(tmp_path):
+    from result_writer import score_type, with_score_type
+
+    store = FakeStore({"1.": "a"})
+    doc = Document(page_content="shared section", metadata={"section_number": "1."})
+
+    def search(comments: list) -> list:
+        return [[(doc, 0.2)], [(with_score_type(doc, "cross_encoder"), 0.1)]]
+
+    open_cache(tmp_path, store).search(["water", "noise"], 1, search, section_key)
+    cache = open_cache(tmp_path, store)
+    results = cache.search(["water", "noise"], 1, fake_search([]), section_key)
+    assert cache.hits == 2
+    assert [score_type(matches[0][0].metadata) for matches in results] == ["dense", "cross_encoder"]
+
+
+def test_other_instance_can_write_during_a_search(tmp_path, monkeypatch):
+    import sqlite3
+    import query_cache
+
+    # Connections give up almost at once, so any write lock held across the search fails the test
+    monkeypatch.setattr(query_cache, "SQLITE_TIMEOUT", 0.05)
+    store = FakeStore({"1.": "a"})
+    open_cache(tmp_path, store).search(["water"], 1, fake_search([]), section_key)
+
+    other = open_cache(tmp_path, store)
+    written = []
+
+    def search(comments: list) -> list:
+        written.append(other.search(["dust"], 1, fake_search([]), section_key))
+        return fake_search([])(comments)
+
+    # A partial hit touches last_used before the missing comment is searched
+    cache = open_cache(tmp_path, store)
+    cache.search(["water", "noise"], 1, search, section_key)
+    assert (cache.hits, cache.misses) == (1, 1) and len(written) == 1
+    connection = sqlite3.connect(str(tmp_path / "results.sqlite"))
+    assert connection.execute("SELECT COUNT(*) FROM results").fetchone()[0] == 3
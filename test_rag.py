@@ -1,47 +1,44 @@
-from query_data import query_rag
-from langchain_community.llms.ollama import Ollama
+from async_ollama_llm import AsyncOllamaLLM
+from rag_eval import EVAL_PROMPT, evaluate_questions
 
-EVAL_PROMPT = """
-Expected Response: {expected_response}
-Actual Response: {actual_response}
----
-(Answer with 'true' or 'false') Does the actual response match the expected response? 
-"""
 
-
-def test_monopoly_rules():
+def test_monopoly_rules(stub_server, store):
     assert query_and_validate(
         question="How much total money does a player start with in Monopoly? (Answer with the number only)",
         expected_response="$1500",
+        server=stub_server,
+        store=store,
     )
 
 
-def test_ticket_to_ride_rules():
+def test_ticket_to_ride_rules(stub_server, store):
     assert query_and_validate(
         question="How many points does the longest continuous train get in Ticket to Ride? (Answer with the number only)",
         expected_response="10 points",
+        server=stub_server,
+        store=store,
     )
 
 
-def query_and_validate(question: str, expected_response: str):
-    response_text = query_rag(question)
-    prompt = EVAL_PROMPT.format(
-        expected_response=expected_response, actual_response=response_text
-    )
-
-    model = Ollama(model="mistral")
-    evaluation_results_str = model.invoke(prompt)
-    evaluation_results_str_cleaned = evaluation_results_str.strip().lower()
+def query_and_validate(question: str, expected_response: str, server, store):
+    # The stub stands in for Ollama, and store is a NumpyVectorStore of the rules in a temporary directory
+    db, embedding_function = store
+    llm = AsyncOllamaLLM(base_url=f"http://127.0.0.1:{server.server_port}")
+    try:
+        result = evaluate_questions([{"question": question, "expected": expected_response}], db, embedding_function,
+                                    llm)[0]
+    finally:
+        llm.close()
 
-    print(prompt)
+    print(EVAL_PROMPT.format(expected_response=expected_response, actual_response=result["answer"]))
 
-    if "true" in evaluation_results_str_cleaned:
+    if result["correct"] is True:
         # Print response in Green if it is correct.
-        print("\033[92m" + f"Response: {evaluation_results_str_cleaned}" + "\033[0m")
+        print("\033[92m" + f"Response: {result['judgement'].lower()}" + "\033[0m")
         return True
-    elif "false" in evaluation_results_str_cleaned:
+    elif result["correct"] is False:
         # Print response in Red if it is incorrect.
-        print("\033[91m" + f"Response: {evaluation_results_str_cleaned}" + "\033[0m")
+        print("\033[91m" + f"Response: {result['judgement'].lower()}" + "\033[0m")
         return False
     else:
         raise ValueError(
@@ -0,0 +1,68 @@
+import json
+import pytest
+from async_ollama_llm import AsyncOllamaLLM
+from instrumentation import drain
+from llm_cache import LLMResponseCache
+from rag_eval import evaluate_questions, load_questions, summarize
+
+QUESTIONS = [
+    {"question": "How much money does a player start with?", "expected": "$1500"},
+    {"question": "How many points is the longest train worth?", "expected": "10 points"},
+    {"question": "How many cards does each player draw?", "expected": "4 cards"},
+]
+
+
+def make_llm(server, **kwargs):
+    return AsyncOllamaLLM(base_url=f"http://127.0.0.1:{server.server_port}", backoff=0.01, **kwargs)
+
+
+@pytest.mark.parametrize("stub_server", [{"delay": 0.05}], indirect=True)
+def test_answers_and_judges_concurrently_with_one_client(stub_server, store):
+    llm = make_llm(stub_server, max_concurrency=2)
+    drain()
+    results = evaluate_questions(QUESTIONS * 2, *store, llm, k=1)
+    llm.close()
+
+    assert [result["correct"] for result in results] == [True, True, False] * 2
+    assert summarize(results)["accuracy"] == pytest.approx(4 / 6)
+    assert results[0]["sources"] == ["rules.pdf::1."]
+    # Twelve requests over at most two connections, never more than two at once
+    assert len(stub_server.prompts) == 12
+    assert stub_server.max_in_flight == 2 and len(stub_server.client_ports) <= 2
+    stages = drain()
+    assert len(stages["generate"]["durations"]) == 6 and len(stages["judge"]["durations"]) == 6
+
+
+def test_streams_answer_tokens(stub_server, store, sections):
+    llm = make_llm(stub_server)
+    tokens = {}
+    drain()
+    results = evaluate_questions(QUESTIONS, *store, llm, k=1,
+                                 on_token=lambda index, token: tokens.setdefault(index, []).append(token))
+    llm.close()
+
+    assert ["".join(tokens[index]) for index in range(len(QUESTIONS))] == [result["answer"] for result in results]
+    assert results[0]["answer"].strip() == sections["1."]
+    assert "generate_first_token" in drain()
+
+
+def test_cached_responses_skip_the_model(stub_server, store, tmp_path):
+    cache_path = str(tmp_path / "responses.sqlite")
+    llm = make_llm(stub_server, cache=LLMResponseCache(cache_path))
+    first = evaluate_questions(QUESTIONS, *store, llm, k=1)
+    llm.close()
+    requests = len(stub_server.prompts)
+
+    cache = LLMResponseCache(cache_path)
+    llm = make_llm(stub_server, cache=cache)
+    assert evaluate_questions(QUESTIONS, *store, llm, k=1) == first
+    llm.close()
+    assert len(stub_server.prompts) == requests
+    assert cache.stats()["hits"] == 2 * len(QUESTIONS)
+
+
+def test_load_questions_from_yaml_and_json(tmp_path):
+    (tmp_path / "questions.yaml").write_text('- question: "Q?"\n  expected: 10 points\n')
+    (tmp_path / "questions.json").write_text(json.dumps({"questions": [{"question": "Q?", "expected_response": 1500}]}))
+    assert load_questions(str(tmp_path / "questions.yaml")) == [{"question": "Q?", "expected": "10 points"}]
+    assert load_questions(str(tmp_path / "questions.json")) == [{"question": "Q?", "expected": "1500"}]
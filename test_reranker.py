@@ -0,0 +1,77 @@
+from langchain_core.documents import Document
+from reranker import CrossEncoderReranker
+
+
+class WordOverlapReranker(CrossEncoderReranker):
+    """
+    Scores a pair by the words the comment and section share, in place of a cross-encoder model.
+    """
+
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        self.model = "stub"
+        self.tokenized = []
+        self.batches = []
+
+    def _tokenize(self, text, max_tokens):
+        self.tokenized.append(text)
+        return text.lower().split()[:max_tokens]
+
+    def _encode_pair(self, query_ids, section_ids):
+        return {"input_ids": query_ids + section_ids, "overlap": len(set(query_ids) & set(section_ids))}
+
+    def _score_batch(self, features):
+        self.batches.append([len(feature["input_ids"]) for feature in features])
+        return [feature["overlap"] for feature in features]
+
+
+def candidates(*texts_and_distances):
+    return [(Document(page_content=text, metadata={"section_number": text}), distance)
+            for text, distance in texts_and_distances]
+
+
+def section(metadata):
+    return metadata["section_number"]
+
+
+def test_rerank_reorders_and_keeps_k():
+    reranker = WordOverlapReranker(margin=0.1)
+    results = [candidates(("fish habitat", 0.30), ("caribou herd range", 0.32), ("water quality", 0.35))]
+    reranked = reranker.rerank(["caribou range"], results, 2, section)
+    assert [doc.page_content for doc, _ in reranked[0]] == ["caribou herd range", "fish habitat"]
+    assert reranked[0][0][1] < reranked[0][1][1]
+    assert {doc.metadata["score_type"] for doc, _ in reranked[0]} == {"cross_encoder"}
+    # The candidates' own Documents are left as they were
+    assert "score_type" not in results[0][0][0].metadata
+    assert reranker.stats["reranked"] == 1 and reranker.stats["top_changed"] == 1
+
+
+def test_decisive_dense_margin_skips_reranking():
+    reranker = WordOverlapReranker(margin=0.1)
+    results = [candidates(("fish habitat", 0.10), ("caribou herd range", 0.40))]
+    reranked = reranker.rerank(["caribou range"], results, 1, section)
+    assert reranked == [results[0][:1]]
+    assert reranker.stats["skipped"] == 1 and reranker.stats["pairs"] == 0 and reranker.tokenized == []
+
+
+def test_margin_comes_from_dense_distances_not_fused_ones():
+    reranker = WordOverlapReranker(margin=0.1)
+    # RRF distances of the top two are always far apart; the dense ones given here are close
+    fused = [candidates(("fish habitat", 0.0), ("caribou herd range", 0.5))]
+    reranked = reranker.rerank(["caribou range"], fused, 1, section, dense_margins=[0.02])
+    assert reranked[0][0][0].page_content == "caribou herd range"
+    reranked = reranker.rerank(["caribou range"], fused, 1, section, dense_margins=[0.3])
+    assert reranked == [fused[0][:1]] and reranker.stats["skipped"] == 1
+
+
+def test_sections_are_tokenized_once_and_scored_in_batches():
+    reranker = WordOverlapReranker(margin=1.0, batch_size=2)
+    shared = candidates(("fish habitat", 0.3), ("caribou herd range summer", 0.31), ("water", 0.32))
+    reranker.rerank(["caribou", "fish"], [shared, shared], 1, section)
+    reranker.rerank(["water"], [shared], 1, section)
+    # Three sections and three comments tokenized, however many pairs use them
+    assert len(reranker.tokenized) == 6
+    assert reranker.stats["section_token_hits"] == 6
+    # Pairs are sorted by length before batching to keep padding small
+    lengths = [length for batch in reranker.batches[:3] for length in batch]
+    assert lengths == sorted(lengths) and all(len(batch) <= 2 for batch in reranker.batches)
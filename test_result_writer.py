@@ -0,0 +1,40 @@
+import csv
+import pandas as pd
+from result_writer import ResultWriter, EXCEL_COLUMNS
+
+SECTIONS = {"guide.pdf::1.": "First section text", "guide.pdf::2.": "Second section text"}
+ROWS = [
+    ("water quality", "Company A", 3, "1.", 0.9, "dense", "guide.pdf::1."),
+    ("noise", "Company B", 7, "2.", 0.8, "cross_encoder", "guide.pdf::2."),
+    ("dust", "Company B", 3, "1.", 0.7, "dense", "guide.pdf::1."),
+]
+
+
+def test_writes_every_format_in_chunks(tmp_path):
+    base_path = str(tmp_path / "config_comments_3")
+    with ResultWriter(base_path, SECTIONS, ["xlsx", "parquet", "csv"], chunk_size=2) as writer:
+        writer.write_rows(ROWS)
+    assert writer.rows_written == 3
+
+    excel = pd.read_excel(f"{base_path}.xlsx")
+    assert list(excel.columns) == EXCEL_COLUMNS
+    assert list(excel["Guidebook page content"]) == ["First section text", "Second section text", "First section text"]
+
+    parquet = pd.read_parquet(f"{base_path}.parquet")
+    assert list(parquet["section id"]) == [row[-1] for row in ROWS]
+    assert list(parquet["Match Score"]) == [0.9, 0.8, 0.7]
+    assert list(parquet["Score Type"]) == ["dense", "cross_encoder", "dense"]
+
+    # Section text is stored once per section, not once per row
+    sections = pd.read_parquet(f"{base_path}_sections.parquet")
+    assert dict(zip(sections["section id"], sections["Guidebook page content"])) == SECTIONS
+    with open(f"{base_path}_sections.csv", newline="", encoding="utf-8") as f:
+        assert len(list(csv.reader(f))) == 1 + len(SECTIONS)
+
+
+def test_empty_results_leave_valid_files(tmp_path):
+    base_path = str(tmp_path / "empty")
+    with ResultWriter(base_path, {}, ["parquet", "xlsx"]):
+        pass
+    assert len(pd.read_parquet(f"{base_path}.parquet")) == 0
+    assert len(pd.read_excel(f"{base_path}.xlsx")) == 0
@@ -0,0 +1,119 @@
+import os
+import threading
+import pytest
+from retrieval_service import RetrievalClient, RetrievalService, WarmCollection, make_server
+from vector_index import VECTOR_INDEX_PATH
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch, make_store):
+    # The service opens the collection the way query_data does, relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    make_store(os.path.join(VECTOR_INDEX_PATH, "my_collection_hash"))
+    collection = WarmCollection("hash", "numpy", use_query_cache=False, max_wait_ms=50)
+    collection.ready.wait(30)
+    return RetrievalService([collection])
+
+
+@pytest.fixture
+def chunked_service(tmp_path, monkeypatch, make_store, sections):
+    monkeypatch.chdir(tmp_path)
+    long_section = " ".join(f"Rule {i} says a player may trade property before rolling the dice." for i in range(12))
+    make_store(os.path.join(VECTOR_INDEX_PATH, "my_collection_hash"), {**sections, "4.2.": long_section},
+               max_tokens=40)
+    collection = WarmCollection("hash", "numpy", use_query_cache=False, max_wait_ms=50)
+    collection.ready.wait(30)
+    return RetrievalService([collection]), long_section
+
+
+def serve(service, **address):
+    server = make_server(service, port=0, **address)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_search_sections_health_and_metrics(service, sections):
+    server = serve(service)
+    client = RetrievalClient(f"http://127.0.0.1:{server.server_address[1]}", "hash")
+    assert client.health()["status"] == "ok"
+
+    results = client.search(["longest continuous train points", "roll two dice"], k=2)
+    assert [len(matches) for matches in results] == [2, 2]
+    best, distance = results[0][0]
+    assert best.metadata["section_number"] == "2." and best.page_content == sections["2."]
+    assert client.section("rules.pdf::2.")["text"] == sections["2."]
+    assert client.passage("rules.pdf::2.")["text"] == sections["2."]
+
+    metrics = client.metrics()
+    assert metrics["collections"]["hash"]["comments"] == 2
+    assert metrics["stages"]["service_post"]["count"] == 1
+    with pytest.raises(RuntimeError, match="404"):
+        client.section("rules.pdf::9.")
+    with pytest.raises(RuntimeError, match="400"):
+        RetrievalClient(client.url, "bge_m3").search(["water"])
+    server.shutdown()
+    server.server_close()
+
+
+def test_sections_join_their_chunks_and_passages_are_served_apart(chunked_service):
+    service, long_section = chunked_service
+    server = serve(service)
+    client = RetrievalClient(f"http://127.0.0.1:{server.server_address[1]}", "hash")
+
+    section = client.section("rules.pdf::4.2.")
+    assert section["text"] == long_section and len(section["passages"]) > 1
+    assert section["passages"] == [f"rules.pdf::4.2.#{index}" for index in range(len(section["passages"]))]
+    assert "chunk_index" not in section["metadata"]
+    # Search results name chunks, which are served under /passages/
+    best, _ = client.search(["trade property before rolling"])[0][0]
+    passage_id = f"rules.pdf::4.2.#{best.metadata['chunk_index']}"
+    assert client.passage(passage_id)["text"] == best.page_content
+    with pytest.raises(RuntimeError, match="404"):
+        client.section(passage_id)
+    server.shutdown()
+    server.server_close()
+
+
+def test_concurrent_requests_share_batches(service, tmp_path):
+    server = serve(service, unix_socket=str(tmp_path / "retrieval.sock"))
+    client = RetrievalClient(f"unix://{tmp_path / 'retrieval.sock'}", "hash")
+    comments = [f"Monopoly money player starts {i}" for i in range(8)]
+    results = [None] * len(comments)
+
+    def search(index):
+        results[index] = client.search([comments[index]])[0]
+
+    threads = [threading.Thread(target=search, args=(i,)) for i in range(len(comments))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(matches[0][0].metadata["section_number"] == "1." for matches in results)
+    stats = service.collections["hash"].stats
+    assert stats["requests"] == 8 and stats["batches"] < 8 and stats["largest_batch"] > 1
+    server.shutdown()
+    server.server_close()
+
+
+def test_service_reloads_a_repopulated_collection(tmp_path, monkeypatch, make_store, sections):
+    monkeypatch.chdir(tmp_path)
+    path = os.path.join(VECTOR_INDEX_PATH, "my_collection_hash")
+    make_store(path)
+    collection = WarmCollection("hash", "numpy", max_wait_ms=5)
+    collection.ready.wait(30)
+    server = serve(RetrievalService([collection]))
+    client = RetrievalClient(f"http://127.0.0.1:{server.server_address[1]}", "hash")
+    comment = "longest continuous train points"
+    assert client.search([comment])[0][0][0].page_content == sections["2."]
+    version = client.health()["collections"]["hash"]["version"]
+
+    # populate_database runs while the service is up: a cached result and the old passage text must not be served
+    changed = "The longest continuous train is worth 15 points in the revised Ticket to Ride rules."
+    make_store(path, {**sections, "2.": changed})
+    assert client.passage("rules.pdf::2.")["text"] == changed
+    assert client.section("rules.pdf::2.")["text"] == changed
+    assert client.search([comment])[0][0][0].page_content == changed
+    assert client.health()["collections"]["hash"]["version"] != version
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,62 @@
+import pytest
+from langchain_core.documents import Document
+from section_chunker import (aggregate_sections, check_chunk_layout, chunk_section, chunk_text, estimate_tokens,
+                             join_chunks)
+
+SENTENCES = [f"Sentence number {i} describes caribou habitat and water quality." for i in range(40)]
+TEXT = "\n".join(SENTENCES)
+
+
+def test_short_text_is_one_chunk():
+    assert chunk_text("Short section.", max_tokens=50) == ["Short section."]
+
+
+def test_chunks_fit_budget_overlap_and_cover_text():
+    chunks = chunk_text(TEXT, max_tokens=70, overlap_tokens=20)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 70 for chunk in chunks)
+    # Chunks are whole sentences, and neighbours share their boundary sentence
+    for chunk in chunks:
+        assert chunk.startswith("Sentence number") and chunk.endswith(".")
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous.split("\n")[-1] == chunk.split("\n")[0]
+    assert {sentence for chunk in chunks for sentence in chunk.split("\n")} == set(SENTENCES)
+
+
+def test_join_chunks_rebuilds_the_section():
+    assert join_chunks(chunk_text(TEXT, max_tokens=70, overlap_tokens=20)) == TEXT
+    text = " ".join(SENTENCES)
+    assert join_chunks(chunk_text(text, max_tokens=70, overlap_tokens=0)) == text
+    assert join_chunks(["Short section."]) == "Short section."
+
+
+def test_long_sentence_is_cut_into_words():
+    chunks = chunk_text(" ".join(["word"] * 100) + ".", max_tokens=30, overlap_tokens=0)
+    assert all(estimate_tokens(chunk) <= 30 for chunk in chunks)
+    assert " ".join(chunks).split() == (" ".join(["word"] * 100) + ".").split()
+
+
+def test_chunks_keep_parent_metadata():
+    metadata = {"section_number": "4.2.", "page": 17, "content_hash": "abc"}
+    chunks = chunk_section("4.2.", TEXT, metadata, max_tokens=60)
+    assert [chunk_id for chunk_id, _, _ in chunks] == [f"4.2.#{i}" for i in range(len(chunks))]
+    assert all(chunk_metadata["section_number"] == "4.2." and chunk_metadata["page"] == 17
+               and chunk_metadata["chunk_count"] == len(chunks) for _, _, chunk_metadata in chunks)
+    assert len({chunk_metadata["content_hash"] for _, _, chunk_metadata in chunks}) == len(chunks)
+
+
+def test_aggregate_sections_keeps_best_chunk():
+    hits = [(Document(page_content=text, metadata={"section_number": number}), distance)
+            for text, number, distance in [("a0", "1.", 0.1), ("a1", "1.", 0.2), ("b0", "2.", 0.3), ("c0", "3.", 0.4)]]
+    sections = aggregate_sections(hits, 2, key=lambda metadata: metadata["section_number"])
+    assert [(doc.page_content, distance) for doc, distance in sections] == [("a0", 0.1), ("b0", 0.3)]
+
+
+def test_chunks_are_not_mixed_with_whole_sections():
+    check_chunk_layout([], True, "empty")
+    check_chunk_layout(["1.#0", "1.#1", "guide.pdf::2.#0"], True, "chunked")
+    check_chunk_layout(["1.", "guide.pdf::2."], False, "sections")
+    with pytest.raises(ValueError, match="stores whole sections, not chunks"):
+        check_chunk_layout(["1.", "2."], True, "sections")
+    with pytest.raises(ValueError, match="stores chunks, not whole sections"):
+        check_chunk_layout(["1.#0"], False, "chunked")
@@ -0,0 +1,91 @@
+import os
+import fitz
+import pytest
+import section_extractors
+from benchmarks.synthetic import synthetic_sections, write_synthetic_pdf
+from pdf_splitter_test import extract_sections
+from section_extractors import detect_extractor, file_digest, load_sections, outline_numbers, section_cache_path
+
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "data_sample", "ticket_to_ride.pdf")
+
+
+@pytest.fixture
+def guidebook(tmp_path):
+    sections = synthetic_sections(8, 40)
+    pdf_path = str(tmp_path / "guidebook.pdf")
+    write_synthetic_pdf(pdf_path, sections)
+    return pdf_path, sections
+
+
+def test_cached_sections_skip_parsing(guidebook, tmp_path, monkeypatch):
+    pdf_path, _ = guidebook
+    cache_dir = str(tmp_path / "section_cache")
+    assert detect_extractor(pdf_path) == "toc"
+    extracted = load_sections(pdf_path, cache_dir=cache_dir)
+    assert extracted == extract_sections(pdf_path, workers=1)
+    assert os.listdir(cache_dir) == [os.path.basename(section_cache_path(file_digest(pdf_path), "auto", cache_dir))]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("an unchanged PDF was opened")
+
+    monkeypatch.setattr(section_extractors.fitz, "open", fail)
+    assert load_sections(pdf_path, cache_dir=cache_dir) == extracted
+
+
+def test_changed_pdf_or_extractor_version_extracts_again(guidebook, tmp_path, monkeypatch):
+    pdf_path, _ = guidebook
+    cache_dir = str(tmp_path / "section_cache")
+    calls = []
+    extract = section_extractors.EXTRACTORS["toc"]
+    monkeypatch.setitem(section_extractors.EXTRACTORS, "toc", lambda *args: calls.append(args) or extract(*args))
+
+    load_sections(pdf_path, "toc", cache_dir=cache_dir)
+    load_sections(pdf_path, "toc", cache_dir=cache_dir)
+    assert len(calls) == 1
+    monkeypatch.setitem(section_extractors.EXTRACTOR_VERSIONS, "toc", 2)
+    load_sections(pdf_path, "toc", cache_dir=cache_dir)
+    assert len(calls) == 2
+    with fitz.open(pdf_path) as doc:
+        doc[0].insert_text((56, 500), "Revised", fontsize=10)
+        doc.save(str(tmp_path / "revised.pdf"))
+    os.replace(str(tmp_path / "revised.pdf"), pdf_path)
+    load_sections(pdf_path, "toc", cache_dir=cache_dir)
+    assert len(calls) == 3 and len(os.listdir(cache_dir)) == 3
+
+
+def test_stopping_early_leaves_no_intermediate(guidebook, tmp_path):
+    pdf_path, _ = guidebook
+    cache_dir = str(tmp_path / "section_cache")
+    stream = section_extractors.iter_cached_sections(pdf_path, cache_dir=cache_dir)
+    next(stream)
+    stream.close()
+    assert os.listdir(cache_dir) == []
+
+
+def test_outline_extractor_matches_toc_sections(guidebook, tmp_path):
+    pdf_path, sections = guidebook
+    toc_sections = extract_sections(pdf_path, workers=1)
+    outline_path = str(tmp_path / "outline.pdf")
+    with fitz.open(pdf_path) as doc:
+        doc.set_toc([[number.count("."), title, section["page"]]
+                     for (number, title, _), section in zip(sections, toc_sections)])
+        doc.save(outline_path)
+
+    extracted = load_sections(outline_path, "outline", use_cache=False)
+    assert [section["section_number"] for section in extracted] == [number for number, _, _ in sections]
+    assert [section["text"] for section in extracted] == [section["text"] for section in toc_sections]
+    assert [section["end_page"] for section in extracted] == [section["end_page"] for section in toc_sections]
+
+
+def test_font_extractor_finds_headings():
+    assert detect_extractor(SAMPLE_PDF) == "font"
+    extracted = load_sections(SAMPLE_PDF, use_cache=False)
+    titles = [section["title"] for section in extracted]
+    assert titles[:5] == ["Page 1", "Components", "Setting up the Game", "Object of the Game", "The Game Turn"]
+    assert "Game End" in titles
+    game_turn = extracted[titles.index("The Game Turn")]
+    assert (game_turn["page"], game_turn["end_page"]) == (2, 3) and game_turn["section_number"] == "4."
+
+
+def test_outline_numbers():
+    assert outline_numbers([1, 2, 2, 3, 1, 3]) == ["1.", "1.1.", "1.2.", "1.2.1.", "2.", "2.0.1."]
@@ -0,0 +1,85 @@
+import os
+import numpy as np
+import pytest
+from vector_index import NumpyVectorStore, normalize_rows
+
+
+def build_store(path, vectors, **settings) -> NumpyVectorStore:
+    store = NumpyVectorStore(str(path), **settings)
+    ids = [str(i) for i in range(len(vectors))]
+    store.upsert(ids, vectors, [f"document {i}" for i in ids], [{"section_number": i} for i in ids])
+    store.save()
+    return store
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 64))
+    return normalize_rows(centers[rng.integers(20, size=500)] + 0.5 * rng.normal(size=(500, 64)))
+
+
+def test_quantized_search_rescores_to_exact(tmp_path, vectors):
+    queries = vectors[:50] + 0.1
+    exact_rows, exact_similarities = build_store(tmp_path / "exact", vectors).search(queries, 5)
+    for quantization in ("int8", "binary"):
+        store = build_store(tmp_path / quantization, vectors, quantization=quantization, keep_full_precision=True)
+        rows, similarities = store.search(queries, 5)
+        assert np.mean(rows[:, 0] == exact_rows[:, 0]) >= 0.95
+        # Rescored similarities are the full-precision ones
+        matching = rows == exact_rows
+        np.testing.assert_allclose(similarities[matching], exact_similarities[matching], rtol=1e-5)
+
+    store.rescore_candidates = 0
+    approximate_rows, _ = store.search(queries, 5)
+    assert approximate_rows.shape == (50, 5)
+
+
+def test_settings_and_codes_persist(tmp_path, vectors):
+    build_store(tmp_path / "index", vectors, quantization="int8", dims=32)
+    loaded = NumpyVectorStore(str(tmp_path / "index"))
+    assert (loaded.quantization, loaded.dims, loaded.keep_full_precision) == ("int8", 32, False)
+    assert loaded.codes.shape == (500, 32) and loaded.codes.dtype == np.int8
+    # Only the codes are stored, so there is nothing to rescore with
+    assert not os.path.exists(tmp_path / "index" / "vectors.npy") and not loaded.rescores()
+    assert loaded.search_signature() == "int8_d32_r0"
+    # Queries are truncated to the stored dimensions
+    rows, _ = loaded.search(vectors[:3], 1)
+    assert list(rows[:, 0]) == [0, 1, 2]
+    with pytest.raises(ValueError):
+        NumpyVectorStore(str(tmp_path / "index"), dims=16)
+    with pytest.raises(ValueError):
+        NumpyVectorStore(str(tmp_path / "index"), quantization="none")
+
+
+def test_codes_only_index_is_smaller_and_updates_in_place(tmp_path, vectors):
+    build_store(tmp_path / "exact", vectors[:400])
+    float_bytes = os.path.getsize(tmp_path / "exact" / "vectors.npy")
+    for quantization, ratio in (("int8", 4), ("binary", 32)):
+        path = tmp_path / quantization
+        build_store(path, vectors[:400], quantization=quantization)
+        assert sorted(os.listdir(path)) == sorted(["codes.npy", "metadata.jsonl", "settings.json"]
+                                                  + (["scale.npy"] if quantization == "int8" else []))
+        # Up to the .npy header
+        assert os.path.getsize(path / "codes.npy") <= float_bytes / ratio + 128
+
+        store = NumpyVectorStore(str(path))
+        ids = [str(i) for i in range(400, 500)]
+        store.upsert(ids, vectors[400:], [f"document {i}" for i in ids], [{"section_number": i} for i in ids])
+        store.delete(["0"])
+        store.build_ivf(8)
+        store.save()
+        reloaded = NumpyVectorStore(str(path))
+        assert len(reloaded) == 499 and reloaded.codes.shape[0] == 499
+        rows, _ = reloaded.search(vectors[450:460], 1, nprobe=8)
+        assert np.mean([reloaded.ids[row] == str(450 + i) for i, row in enumerate(rows[:, 0])]) >= 0.9
+
+
+def test_keep_full_precision_can_be_dropped(tmp_path, vectors):
+    build_store(tmp_path / "index", vectors, quantization="binary", keep_full_precision=True)
+    assert os.path.exists(tmp_path / "index" / "vectors.npy")
+    store = NumpyVectorStore(str(tmp_path / "index"), keep_full_precision=False)
+    store.save()
+    assert not os.path.exists(tmp_path / "index" / "vectors.npy")
+    with pytest.raises(ValueError):
+        NumpyVectorStore(str(tmp_path / "index"), keep_full_precision=True)
@@ -0,0 +1,423 @@
+import json
+import os
+import numpy as np
+
+VECTOR_INDEX_PATH = "vector_index"
+DEFAULT_NPROBE = 8
+QUANTIZATIONS = ["none", "int8", "binary"]
+# Candidates found on the quantized vectors and rescored with the full-precision ones
+DEFAULT_RESCORE_CANDIDATES = 40
+# Bytes of temporaries scoring one block of rows may use
+SCORE_BLOCK_BYTES = 1 << 24
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns the column indices of the k highest scores in every row, best first.
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple:
+    """
+    Scalar-quantizes unit vectors to int8 with one symmetric scale per dimension.
+    Returns the codes and the scales; codes * scale / 127 approximates the vectors.
+    """
+    scale = np.abs(vectors).max(axis=0) if len(vectors) else np.ones(vectors.shape[1], dtype=np.float32)
+    scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+    return np.round(vectors / scale * 127).astype(np.int8), scale
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    # One sign bit per dimension, eight dimensions per byte
+    return np.packbits(vectors > 0, axis=1)
+
+
+def binary_similarity(queries: np.ndarray, codes: np.ndarray, dims: int) -> np.ndarray:
+    """
+    Estimates the cosine similarity of every full-precision query with every sign-bit code.
+    For unit vectors q and v, q . sign(v) averages sqrt(2 * dims / pi) * cos(q, v), and keeping
+    the query unquantized ranks better than comparing sign bits with sign bits.
+    """
+    block = max(1, SCORE_BLOCK_BYTES // (4 * dims))
+    similarities = np.empty((len(queries), len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), block):
+        signs = np.unpackbits(codes[start:start + block], axis=1, count=dims).astype(np.float32) * 2 - 1
+        similarities[:, start:start + block] = queries @ signs.T
+    return np.clip(similarities * np.sqrt(np.pi / (2 * dims)), -1.0, 1.0)
+
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10, seed: int = 0) -> tuple:
+    """
+    Clusters unit vectors by cosine similarity. Returns the unit centroids and each row's cluster.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_clusters, replace=False)].copy()
+    assignments = np.zeros(len(vectors), dtype=np.int64)
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(n_clusters):
+            members = vectors[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.sum(axis=0)
+            else:
+                # Re-seed empty clusters so every list stays useful
+                centroids[cluster] = vectors[rng.integers(len(vectors))]
+        centroids = normalize_rows(centroids)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+class NumpyVectorStore:
+    """
+    In-process vector store for small corpora.
+
+    Normalized float32 embeddings live in a memory-mapped vectors.npy next to a metadata.jsonl
+    sidecar holding each row's id, text and metadata. Queries are answered with one matrix
+    product and an argpartition top-k, and distances are 1 - cosine similarity like a Chroma
+    collection with hnsw:space=cosine. An optional IVF index (ivf.npz) restricts each query
+    to the rows of its nprobe closest clusters.
+
+    With quantization "int8" or "binary", the int8 or sign-bit codes (codes.npy, memory-mapped)
+    replace vectors.npy on disk, so the index shrinks 4x or 32x and loading reads only the codes.
+    With keep_full_precision, vectors.npy is kept next to them and the best rescore_candidates
+    rows found on the codes are rescored with the full-precision vectors, of which only those
+    rows are read from disk. dims truncates vectors and queries to their first dims dimensions,
+    for Matryoshka-trained models. quantization, dims and keep_full_precision are stored in
+    settings.json; None keeps the stored setting.
+    """
+
+    def __init__(self, path: str, embedding_function=None, quantization: str = None, dims: int = None,
+                 rescore_candidates: int = DEFAULT_RESCORE_CANDIDATES, keep_full_precision: bool = None):
+        self.path = path
+        self.embedding_function = embedding_function
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self.centroids = None
+        self.list_rows = None
+        self.list_offsets = None
+        self.quantization = "none"
+        self.dims = None
+        self.keep_full_precision = False
+        self.rescore_candidates = rescore_candidates
+        self.codes = None
+        self.scale = None
+        self.vector_dims = None
+        self._row_by_id = {}
+
+        settings_path = os.path.join(path, "settings.json")
+        if os.path.exists(settings_path):
+            with open(settings_path, "r") as f:
+                settings = json.load(f)
+            self.quantization = settings["quantization"]
+            self.dims = settings["dims"]
+            # Indexes written before the codes replaced vectors.npy always kept it
+            self.keep_full_precision = settings.get("keep_full_precision", True)
+            self.vector_dims = settings.get("vector_dims")
+        metadata_path = os.path.join(path, "metadata.jsonl")
+        if os.path.exists(metadata_path):
+            vectors_path = os.path.join(path, "vectors.npy")
+            if self._stores_vectors() and os.path.exists(vectors_path):
+                self.vectors = np.load(vectors_path, mmap_mode="r")
+            codes_path = os.path.join(path, "codes.npy")
+            if self.quantization != "none" and os.path.exists(codes_path):
+                self.codes = np.load(codes_path, mmap_mode="r")
+                self.scale = np.load(os.path.join(path, "scale.npy")) if self.quantization == "int8" else None
+            with open(metadata_path, "r") as f:
+                for line in f:
+                    row = json.loads(line)
+                    self.ids.append(row["id"])
+                    self.documents.append(row["document"])
+                    self.metadatas.append(row["metadata"])
+            ivf_path = os.path.join(path, "ivf.npz")
+            if os.path.exists(ivf_path):
+                ivf = np.load(ivf_path)
+                self.centroids = ivf["centroids"]
+                self.list_rows = ivf["list_rows"]
+                self.list_offsets = ivf["list_offsets"]
+        self._row_by_id = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self.configure(quantization, dims, keep_full_precision)
+
+    def configure(self, quantization: str = None, dims: int = None, keep_full_precision: bool = None):
+        """
+        Switches to another quantization, truncates the stored vectors to dims dimensions, or
+        starts or stops keeping full-precision vectors next to the codes. Vectors can't be made
+        longer again, since their tail was never stored, and an index of codes alone can't be
+        changed at all, since its full-precision vectors are gone.
+        """
+        changes = [quantization is not None and quantization != self.quantization,
+                   dims is not None and dims != self.dims,
+                   keep_full_precision is not None and keep_full_precision != self.keep_full_precision]
+        if any(changes) and not self._has_vectors():
+            raise ValueError(f"{self.path} only stores {self.quantization} codes; populate it again with --reset "
+                             "to change its settings")
+        if keep_full_precision is not None:
+            self.keep_full_precision = keep_full_precision
+        if quantization is not None and quantization != self.quantization:
+            if quantization not in QUANTIZATIONS:
+                raise ValueError(f"Unknown quantization: {quantization}")
+            self.quantization = quantization
+            self.codes = self.scale = None
+        if dims is not None and dims != self.dims:
+            stored_dims = self.vectors.shape[1] if len(self.ids) else None
+            if stored_dims is not None and dims > stored_dims:
+                raise ValueError(f"{self.path} stores {stored_dims} dimensions; rebuild it to keep {dims}")
+            self.dims = dims
+            if stored_dims is not None and dims < stored_dims:
+                self.vectors = normalize_rows(np.asarray(self.vectors)[:, :dims])
+                self.codes = self.scale = None
+                self.centroids = self.list_rows = self.list_offsets = None
+
+    def _truncate(self, vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return normalize_rows(vectors[:, :self.dims] if self.dims else vectors)
+
+    def _stores_vectors(self) -> bool:
+        return self.quantization == "none" or self.keep_full_precision
+
+    def _has_vectors(self) -> bool:
+        # False once an index of codes alone is loaded: its rows only exist as codes
+        return len(self.vectors) == len(self.ids)
+
+    def _ensure_codes(self):
+        if self.quantization == "none" or self.codes is not None or len(self.ids) == 0:
+            return
+        vectors = np.asarray(self.vectors, dtype=np.float32)
+        if self.quantization == "int8":
+            self.codes, self.scale = quantize_int8(vectors)
+        else:
+            self.codes = quantize_binary(vectors)
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        # New rows of an index of codes alone reuse its int8 scales, clipping what falls outside them
+        if self.quantization == "int8":
+            return np.clip(np.round(vectors / self.scale * 127), -127, 127).astype(np.int8)
+        return quantize_binary(vectors)
+
+    def _decoded_vectors(self) -> np.ndarray:
+        """
+        The full-precision vectors, or the unit vectors the codes stand for when only those are stored.
+        """
+        if self._has_vectors():
+            return np.asarray(self.vectors, dtype=np.float32)
+        if self.quantization == "int8":
+            return normalize_rows(np.asarray(self.codes, dtype=np.float32) * (self.scale / 127))
+        return normalize_rows(np.unpackbits(self.codes, axis=1, count=self.vector_dims).astype(np.float32) * 2 - 1)
+
+    def rescores(self) -> bool:
+        return self.quantization != "none" and self.keep_full_precision and bool(self.rescore_candidates)
+
+    def search_signature(self) -> str:
+        """
+        Names the settings that change search results besides the stored vectors: empty for
+        exact float32 search.
+        """
+        if self.quantization == "none" and not self.dims:
+            return ""
+        return f"{self.quantization}_d{self.dims or 'all'}_r{self.rescore_candidates if self.rescores() else 0}"
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, include=None) -> dict:
+        items = {"ids": list(self.ids), "metadatas": list(self.metadatas)}
+        if include and "documents" in include:
+            items["documents"] = list(self.documents)
+        return items
+
+    def upsert(self, ids: list, embeddings: list, documents: list, metadatas: list):
+        new_vectors = self._truncate(embeddings)
+        self.vector_dims = new_vectors.shape[1]
+        # An index of codes alone is updated in place; otherwise the codes are rebuilt from the vectors
+        codes_only = not self._has_vectors()
+        if codes_only:
+            rows, new_rows = np.array(self.codes), self._encode(new_vectors)
+        else:
+            rows, new_rows = np.array(self.vectors, dtype=np.float32), new_vectors
+        appended = []
+        for doc_id, new_row, document, metadata in zip(ids, new_rows, documents, metadatas):
+            row = self._row_by_id.get(doc_id)
+            if row is None:
+                self._row_by_id[doc_id] = len(self.ids)
+                self.ids.append(doc_id)
+                self.documents.append(document)
+                self.metadatas.append(metadata)
+                appended.append(new_row)
+            else:
+                rows[row] = new_row
+                self.documents[row] = document
+                self.metadatas[row] = metadata
+        if appended:
+            rows = np.vstack([rows.reshape(-1, new_rows.shape[1]), np.array(appended)])
+        if codes_only:
+            self.codes = rows
+        else:
+            self.vectors = rows
+            self.codes = self.scale = None
+        # Cluster assignments are stale once rows change
+        self.centroids = self.list_rows = self.list_offsets = None
+
+    def delete(self, ids: list):
+        removed = {self._row_by_id[doc_id] for doc_id in ids if doc_id in self._row_by_id}
+        if not removed:
+            return
+        keep = [row for row in range(len(self.ids)) if row not in removed]
+        if self._has_vectors():
+            self.vectors = np.array(self.vectors, dtype=np.float32)[keep]
+            self.codes = self.scale = None
+        else:
+            self.codes = np.array(self.codes)[keep]
+        self.ids = [self.ids[row] for row in keep]
+        self.documents = [self.documents[row] for row in keep]
+        self.metadatas = [self.metadatas[row] for row in keep]
+        self._row_by_id = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self.centroids = self.list_rows = self.list_offsets = None
+
+    def build_ivf(self, n_lists: int, iterations: int = 10, seed: int = 0):
+        vectors = self._decoded_vectors()
+        n_lists = min(n_lists, len(vectors))
+        self.centroids, assignments = spherical_kmeans(vectors, n_lists, iterations, seed)
+        self.list_rows = np.argsort(assignments, kind="stable")
+        self.list_offsets = np.searchsorted(assignments[self.list_rows], np.arange(n_lists + 1))
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._ensure_codes()
+        # Write to temporary files first so a crash never leaves a half-written index
+        metadata_tmp = os.path.join(self.path, "metadata.jsonl.tmp")
+        with open(metadata_tmp, "w") as f:
+            for doc_id, document, metadata in zip(self.ids, self.documents, self.metadatas):
+                f.write(json.dumps({"id": doc_id, "document": document, "metadata": metadata}) + "\n")
+        files = {"metadata.jsonl": metadata_tmp}
+        if self._stores_vectors():
+            files["vectors.npy"] = os.path.join(self.path, "vectors.tmp.npy")
+            np.save(files["vectors.npy"], np.asarray(self.vectors, dtype=np.float32))
+        if self.codes is not None:
+            files["codes.npy"] = os.path.join(self.path, "codes.tmp.npy")
+            np.save(files["codes.npy"], np.asarray(self.codes))
+            if self.scale is not None:
+                files["scale.npy"] = os.path.join(self.path, "scale.tmp.npy")
+                np.save(files["scale.npy"], self.scale)
+        if self.centroids is not None:
+            files["ivf.npz"] = os.path.join(self.path, "ivf.tmp.npz")
+            np.savez(files["ivf.npz"], centroids=self.centroids, list_rows=self.list_rows,
+                     list_offsets=self.list_offsets)
+        for name, temporary_path in files.items():
+            os.replace(temporary_path, os.path.join(self.path, name))
+        # Files of settings no longer in use, including quantized.npz of indexes written before codes.npy
+        for name in ("vectors.npy", "codes.npy", "scale.npy", "ivf.npz", "quantized.npz"):
+            if name not in files and os.path.exists(os.path.join(self.path, name)):
+                os.remove(os.path.join(self.path, name))
+        with open(os.path.join(self.path, "settings.json"), "w") as f:
+            json.dump({"quantization": self.quantization, "dims": self.dims,
+                       "keep_full_precision": self.keep_full_precision, "vector_dims": self.vector_dims}, f)
+
+        if self._stores_vectors():
+            self.vectors = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="r")
+        else:
+            self.vectors = np.empty((0, 0), dtype=np.float32)
+        if self.codes is not None:
+            self.codes = np.load(os.path.join(self.path, "codes.npy"), mmap_mode="r")
+
+    def search(self, query_embeddings: list, k: int, nprobe: int = DEFAULT_NPROBE) -> tuple:
+        """
+        Returns (rows, similarities), each of shape (number of queries, k).
+        Rows are -1 where fewer than k candidates were found.
+        """
+        queries = self._truncate(query_embeddings)
+        if len(self.ids) == 0:
+            return np.full((len(queries), 0), -1), np.zeros((len(queries), 0), dtype=np.float32)
+        if self.quantization == "none":
+            return self._search(queries, k, nprobe, self._exact_scores)
+        self._ensure_codes()
+        if not self.rescores():
+            return self._search(queries, k, nprobe, self._quantized_scores)
+        rows, _ = self._search(queries, max(k, self.rescore_candidates), nprobe, self._quantized_scores)
+        return self._rescore(queries, rows, k)
+
+    def _exact_scores(self, queries: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        return queries @ np.asarray(vectors).T
+
+    def _quantized_scores(self, queries: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        codes = self.codes if rows is None else self.codes[rows]
+        if self.quantization == "binary":
+            return binary_similarity(queries, codes, queries.shape[1])
+        scaled_queries = queries * (self.scale / 127)
+        block = max(1, SCORE_BLOCK_BYTES // (4 * codes.shape[1]))
+        # Blocks keep the float copies of the codes that the matrix product makes small
+        return np.hstack([scaled_queries @ codes[start:start + block].T for start in range(0, len(codes), block)])
+
+    def _rescore(self, queries: np.ndarray, candidate_rows: np.ndarray, k: int) -> tuple:
+        """
+        Reorders every query's candidate rows by full-precision similarity and keeps the best k.
+        """
+        valid = candidate_rows >= 0
+        # Each distinct row is read once, in order, from the memory-mapped vectors
+        unique_rows, inverse = np.unique(np.where(valid, candidate_rows, 0), return_inverse=True)
+        candidates = np.asarray(self.vectors[unique_rows])[inverse.reshape(candidate_rows.shape)]
+        scores = np.einsum("qcd,qd->qc", candidates, queries)
+        scores[~valid] = -np.inf
+        best = top_k(scores, k)
+        rows = np.take_along_axis(candidate_rows, best, axis=1)
+        similarities = np.take_along_axis(scores, best, axis=1)
+        rows[np.isneginf(similarities)] = -1
+        return rows, similarities
+
+    def _search(self, queries: np.ndarray, k: int, nprobe: int, score) -> tuple:
+        """
+        Returns the top k rows and their similarities under score(queries, rows), over every row
+        or, with an IVF index, over the rows of each query's nprobe closest clusters.
+        """
+        if self.centroids is None:
+            scores = score(queries)
+            rows = top_k(scores, k)
+            return rows, np.take_along_axis(scores, rows, axis=1)
+
+        probes = top_k(queries @ self.centroids.T, nprobe)
+        rows = np.full((len(queries), k), -1)
+        similarities = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for q, query_probes in enumerate(probes):
+            # Sorted rows keep the memory-mapped reads sequential
+            candidates = np.sort(np.concatenate([
+                self.list_rows[self.list_offsets[cluster]:self.list_offsets[cluster + 1]] for cluster in query_probes
+            ]))
+            scores = score(queries[q][None, :], candidates)[0]
+            best = top_k(scores[None, :], k)[0]
+            rows[q, :len(best)] = candidates[best]
+            similarities[q, :len(best)] = scores[best]
+        return rows, similarities
+
+    def similarity_search_by_vectors(self, query_embeddings: list, k: int, nprobe: int = DEFAULT_NPROBE) -> list:
+        """
+        Returns one list of (Document, distance) per query, like Chroma's similarity_search_with_score.
+        """
+        from langchain_core.documents import Document
+
+        rows, similarities = self.search(query_embeddings, k, nprobe)
+        all_results = []
+        for query_rows, query_similarities in zip(rows, similarities):
+            all_results.append([
+                (Document(page_content=self.documents[row], metadata=self.metadatas[row]), 1.0 - float(similarity))
+                for row, similarity in zip(query_rows, query_similarities) if row >= 0
+            ])
+        return all_results
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> list:
+        return self.similarity_search_by_vectors([self.embedding_function.embed_query(query)], k)[0]